@@ -77,6 +77,9 @@ Requires: python3-kobo-rpmlib
 Requires: python3-kobo-worker >= 0.36.1
 Requires: %{name}-common = %{version}-%{release}
 Recommends: osh-worker-conf
+# recompress results of profiles using zstd
+Requires: xz
+Requires: zstd
 
 Obsoletes: covscan-worker < %{version}
 
@@ -102,10 +105,13 @@ Requires: gzip
 Requires: python3-qpid-proton
 # optional: inform ET about progress using Kafka (IT Managed Kafka)
 Recommends: python3-kafka
+# optional: store task results in S3 compatible object storage
+Suggests: python3-boto3
 # hub is interacting with brew
 Requires: koji
 # extract tarballs created by csmock
 Requires: xz
+Requires: zstd
 
 Requires: csdiff
 Requires: python3-bugzilla
@@ -287,10 +293,12 @@ fi
 %attr(640,root,root) %config(noreplace) %{_sysconfdir}/osh/worker.conf
 
 %files hub
+%{_bindir}/osh-results-processor
 %{_bindir}/osh-retention
 %{_bindir}/osh-stats
 %{_sysconfdir}/osh/hub
 %{python3_sitelib}/osh/hub
+%{_unitdir}/osh-results-processor.service
 %{_unitdir}/osh-retention.*
 %{_unitdir}/osh-stats.*
 %exclude %{python3_sitelib}/osh/hub/scripts/osh-xmlrpc-client.py*
@@ -334,14 +342,16 @@ if pg_isready -h localhost; then
     # the Python interpreter from creating an unowned byte-compiled module for
     # `settings_local.py`
     runuser -u apache -- %{python3_sitelib}/osh/hub/manage.py migrate
+    runuser -u apache -- %{python3_sitelib}/osh/hub/manage.py rebuild_latest_waivers --if-empty
 fi
 
-%systemd_post osh-{retention,stats}.{service,timer}
+%systemd_post osh-{retention,stats}.{service,timer} osh-results-processor.service
 
 %preun hub
-%systemd_preun osh-{retention,stats}.{service,timer}
+%systemd_preun osh-{retention,stats}.{service,timer} osh-results-processor.service
 
 %postun hub
+%systemd_postun_with_restart osh-results-processor.service
 %systemd_postun osh-{retention,stats}.{service,timer}
 
 %files worker-manager
@@ -11,6 +11,9 @@ from xmlrpc.client import Fault
 
 import koji
 
+from osh.common.constants import (DEFAULT_RESULTS_COMPRESSION,
+                                  RESULTS_TARBALL_SUFFIXES)
+
 
 def check_analyzers(proxy, analyzers_list):
     result = proxy.scan.check_analyzers(analyzers_list)
@@ -133,25 +136,35 @@ def fetch_results(hub, dest, task_id):
     task_info = hub.scan.get_task_info(task_id)
     task_url = hub.client.task_url(task_id)
 
-    # we need result_filename + '.tar.xz'
-    tarball = _get_result_filename(task_info['args']) + '.tar.xz'
-
     # get absolute path
     dest_dir = os.path.abspath(os.path.expanduser(dest) if dest is not None else os.curdir)
-    local_path = os.path.join(dest_dir, tarball)
 
-    # task_url is url to task with trailing '/'
-    url = f"{task_url}log/{tarball}?format=raw"
+    # we need result_filename + '.tar.xz' (or '.tar.zst' depending on the
+    # profile; ErrataDiffBuild tasks do not tell, so try the other one too)
+    compression = task_info['args'].get('results_compression', DEFAULT_RESULTS_COMPRESSION)
+    suffixes = [RESULTS_TARBALL_SUFFIXES[compression]]
+    suffixes += [s for s in RESULTS_TARBALL_SUFFIXES.values() if s not in suffixes]
 
-    print(f"Downloading {tarball}: ", file=sys.stderr, end="")
-    try:
-        urlretrieve(url, local_path)
-    except HTTPError as e:
-        print(e, file=sys.stderr)
-        return False
+    for suffix in suffixes:
+        tarball = _get_result_filename(task_info['args']) + suffix
+        local_path = os.path.join(dest_dir, tarball)
+
+        # task_url is url to task with trailing '/'
+        url = f"{task_url}log/{tarball}?format=raw"
+
+        print(f"Downloading {tarball}: ", file=sys.stderr, end="")
+        try:
+            urlretrieve(url, local_path)
+        except HTTPError as e:
+            print(e, file=sys.stderr)
+            if e.code == HTTPStatus.NOT_FOUND:
+                continue
+            return False
+
+        print("OK", file=sys.stderr)
+        return True
 
-    print("OK", file=sys.stderr)
-    return True
+    return False
 
 
 def upload_file(hub, srpm, target_dir, parser):
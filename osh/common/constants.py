@@ -20,8 +20,13 @@ DEFAULT_CHECKER_GROUP = "Unsorted"
 SCAN_RESULTS_FILENAME = 'scan-results.js'
 SCAN_RESULTS_SUMMARY = 'scan-results-summary.txt'
 
-CSDIFF_ARGS = '-jz'
-
 DEFECTS_IN_PATCHES_FILE = "defects-in-patches.js"
 
 DEFAULT_SCAN_LIMIT = 1000
+
+# compression of results tarballs (as set in scan profiles) -> file suffix
+RESULTS_TARBALL_SUFFIXES = {
+    'xz': '.tar.xz',
+    'zstd': '.tar.zst',
+}
+DEFAULT_RESULTS_COMPRESSION = 'xz'
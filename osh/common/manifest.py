@@ -0,0 +1,119 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Manifest of a results tarball
+
+Workers upload the manifest next to the results tarball.  It lists the files
+in the tarball with their sizes and sha256 digests, counts of defects per
+checker and versions of the analyzers, so that the hub knows what the results
+contain without probing the task dir:
+
+{
+    "version": 1,
+    "tarball": {"name": "pkg-1.0-1.tar.xz", "size": 1234, "sha256": "..."},
+    "files": {"pkg-1.0-1/scan-results.js": {"size": 42, "sha256": "..."}, ...},
+    "defects": {"GCC_WARNING": 3, ...},
+    "analyzers": {"gcc": "12.3.1", ...}
+}
+"""
+
+import collections
+import hashlib
+import json
+import os
+import tarfile
+
+from osh.common.constants import SCAN_RESULTS_FILENAME
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = '.manifest.json'
+
+CHUNK_SIZE = 1024 ** 2
+
+ANALYZER_VERSION_PREFIX = 'analyzer-version-'
+
+
+def manifest_path(tarball):
+    return tarball + MANIFEST_SUFFIX
+
+
+def file_digest(f):
+    """ return tuple (size, sha256 hex digest) of content of file object `f` """
+    sha256 = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+        sha256.update(chunk)
+        size += len(chunk)
+    return size, sha256.hexdigest()
+
+
+def _summarize_results(data):
+    """ return defect counts per checker and analyzer versions in scan results """
+    results = json.loads(data)
+    defects = collections.Counter(defect.get('checker', '') for defect in results.get('defects', []))
+    analyzers = {key[len(ANALYZER_VERSION_PREFIX):]: value
+                 for key, value in results.get('scan', {}).items()
+                 if key.startswith(ANALYZER_VERSION_PREFIX)}
+    return dict(defects), analyzers
+
+
+def build_manifest(tarball):
+    """ return manifest of the members of `tarball` (read in a single pass) """
+    files = {}
+    defects = {}
+    analyzers = {}
+    with tarfile.open(tarball, 'r|*') as tf:
+        for member in tf:
+            if not member.isreg():
+                continue
+
+            f = tf.extractfile(member)
+            if member.name.count('/') == 1 and os.path.basename(member.name) == SCAN_RESULTS_FILENAME:
+                data = f.read()
+                size, sha256 = len(data), hashlib.sha256(data).hexdigest()
+                try:
+                    defects, analyzers = _summarize_results(data)
+                except (ValueError, AttributeError):
+                    # the hub reports malformed results when loading them
+                    pass
+            else:
+                size, sha256 = file_digest(f)
+            files[member.name] = {'size': size, 'sha256': sha256}
+
+    return {
+        'version': MANIFEST_VERSION,
+        'files': files,
+        'defects': defects,
+        'analyzers': analyzers,
+    }
+
+
+def write_manifest(manifest, tarball):
+    """
+    record the (final) `tarball` in `manifest` and write it next to the
+    tarball, return path to the manifest
+    """
+    with open(tarball, 'rb') as f:
+        size, sha256 = file_digest(f)
+    manifest = dict(manifest, tarball={
+        'name': os.path.basename(tarball),
+        'size': size,
+        'sha256': sha256,
+    })
+
+    path = manifest_path(tarball)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return path
+
+
+def load_manifest(f):
+    """ return manifest read from file object `f`, raise ValueError if it is invalid """
+    manifest = json.load(f)
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError('unsupported manifest version')
+    for key in ('tarball', 'files', 'defects', 'analyzers'):
+        if key not in manifest:
+            raise ValueError('manifest is missing %s' % key)
+    return manifest
@@ -13,22 +13,21 @@ from kobo.hub.decorators import validate_worker
 from kobo.hub.models import Task
 from kobo.hub.xmlrpc.worker import open_task as kobo_open_task
 
+from osh.hub.scan.messaging import publish_fedora_message
 from osh.hub.scan.mock import generate_mock_configs
 from osh.hub.scan.models import (SCAN_STATES, AnalyzerVersion, AppSettings,
                                  Profile, Scan, ScanBinding)
 from osh.hub.scan.notify import send_task_notification
+from osh.hub.scan.results_queue import defer_notification, process_results
 from osh.hub.scan.scanner import (move_mock_configs, obtain_base,
                                   prepare_base_scan)
+from osh.hub.scan.service import deduplicate_task_files
 from osh.hub.scan.xmlrpc_helper import cancel_scan
 from osh.hub.scan.xmlrpc_helper import fail_scan as h_fail_scan
-from osh.hub.scan.xmlrpc_helper import finish_scan as h_finish_scan
 from osh.hub.scan.xmlrpc_helper import (prepare_version_retriever,
                                         scan_notification_email)
 from osh.hub.service.csmock_parser import unpack_and_return_api
-from osh.hub.waiving.results_loader import TaskResultsProcessor
-
-if settings.ENABLE_FEDORA_MESSAGING:
-    from fedora_messaging import api, message
+from osh.hub.service.path import get_task_dir
 
 logger = logging.getLogger(__name__)
 
@@ -57,17 +56,6 @@ __all__ = [
 ]
 
 
-@validate_worker
-def publish_fedora_message(request, topic, task, body={}):
-    # Send messages only for main tasks (and not subtasks)
-    if settings.ENABLE_FEDORA_MESSAGING and task.parent_id is None:
-        body.update({'task_id': task.id})
-        try:
-            msg = message.Message(topic=topic, headers={}, body=body)
-            api.publish(msg)
-        except Exception as ex:  # noqa: B902
-            logger.error(ex)
-
 # REGULAR TASKS
 
 
@@ -75,7 +63,7 @@ def publish_fedora_message(request, topic, task, body={}):
 @validate_worker
 def create_mock_configs(request, task_id):
     task = Task.objects.get(id=task_id)
-    task_dir = Task.get_task_dir(task_id, create=True)
+    task_dir = get_task_dir(task_id, create=True)
 
     # skip if not a subtask
     if task.parent_id is None:
@@ -97,6 +85,9 @@ def create_mock_configs(request, task_id):
 def email_task_notification(request, task_id):
     try:
         logger.debug('email_task_notification for %s', task_id)
+        if defer_notification(task_id):
+            # sent once the results are processed
+            return
         return send_task_notification(request, task_id)
     finally:
         if settings.ENABLE_SINGLE_USE_WORKERS:
@@ -110,21 +101,8 @@ def email_task_notification(request, task_id):
 def finish_task(request, task_id):
     logger.info("Finishing task %s", task_id)
     task = Task.objects.get(id=task_id)
-    base_task = None
-    if task.subtasks():
-        base_task = task.subtasks()[0]
-    exclude_dirs = AppSettings.settings_get_results_tb_exclude_dirs()
-    td = TaskResultsProcessor(task, base_task, exclude_dirs)
-    td.unpack_results()
-
-    if base_task:
-        try:
-            td.generate_diffs()
-        except RuntimeError as ex:
-            logger.error("Can't diff tasks %s %s: %s", base_task, task, ex)
-            if not task.is_failed():
-                task.fail_task()
 
+    body = None
     if settings.ENABLE_FEDORA_MESSAGING and task.parent_id is None:
         import django.urls
 
@@ -134,7 +112,7 @@ def finish_task(request, task_id):
         scan_results_js_url = request.build_absolute_uri(scan_results_js_path)
 
         body = {'status': 'success', 'scan-results.js': scan_results_js_url}
-        if base_task:
+        if task.subtasks():
             added_js_path = django.urls.reverse("task/log", args=[task_id, "added.js"])
             added_js_path += "?format=raw"
             added_js_url = request.build_absolute_uri(added_js_path)
@@ -145,16 +123,18 @@ def finish_task(request, task_id):
             fixed_js_url = request.build_absolute_uri(fixed_js_path)
             body.update({'fixed.js': fixed_js_url})
 
-        publish_fedora_message(request, 'task.finished', task, body)
+    process_results(request, task, message=body)
 
 
 @validate_worker
 def open_task(request, task_id):
     response = kobo_open_task(request, task_id)
 
+    # place the task dir before the worker uploads anything to it
+    get_task_dir(task_id, create=True)
     task = Task.objects.get(id=task_id)
 
-    publish_fedora_message(request, 'task.started', task)
+    publish_fedora_message('task.started', task)
 
     if settings.ENABLE_SINGLE_USE_WORKERS:
         # TODO: Check if we should create shutdown tasks before deleting a worker.
@@ -189,6 +169,10 @@ def open_task(request, task_id):
 def email_scan_notification(request, scan_id):
     try:
         logger.debug('email_scan_notification for %s', scan_id)
+        task_id = ScanBinding.objects.get(scan__id=scan_id).task_id
+        if defer_notification(task_id):
+            # sent once the results are processed
+            return
         scan_notification_email(request, scan_id)
     finally:
         if settings.ENABLE_SINGLE_USE_WORKERS:
@@ -200,7 +184,8 @@ def email_scan_notification(request, scan_id):
 
 @validate_worker
 def finish_scan(request, scan_id, filename):
-    h_finish_scan(request, scan_id, filename)
+    sb = ScanBinding.objects.by_scan_id(scan_id)
+    process_results(request, sb.task, scan=sb.scan, filename=filename)
 
 
 @validate_worker
@@ -249,10 +234,12 @@ def get_scanning_args(request, profile):
 @validate_worker
 def move_upload(request, task_id, upload_id):
     """ child task's srpm is uploaded, move it to task's dir """
-    task_dir = Task.get_task_dir(task_id, create=True)
+    task_dir = get_task_dir(task_id, create=True)
     upload = FileUpload.objects.get(id=upload_id)
-    shutil.move(os.path.join(upload.target_dir, upload.name), os.path.join(task_dir, upload.name))
+    path = os.path.join(task_dir, upload.name)
+    shutil.move(os.path.join(upload.target_dir, upload.name), path)
     upload.delete()
+    deduplicate_task_files(task_id, [path])
 
 
 @validate_worker
@@ -335,7 +322,7 @@ def cancel_task(request, task_id):
 
     task = Task.objects.get(id=task_id)
     body = {'status': 'cancel'}
-    publish_fedora_message(request, 'task.finished', task, body)
+    publish_fedora_message('task.finished', task, body)
 
     return response
 
@@ -351,7 +338,7 @@ def fail_task(request, task_id, task_result):
 
     task = Task.objects.get(id=task_id)
     body = {'status': 'fail'}
-    publish_fedora_message(request, 'task.finished', task, body)
+    publish_fedora_message('task.finished', task, body)
 
     return response
 
@@ -372,6 +359,6 @@ def interrupt_tasks(request, task_list):
         fail_scan(request, sb.scan.id, 'Task was interrupted')
 
         body = {'status': 'interrupt'}
-        publish_fedora_message(request, 'task.finished', task, body)
+        publish_fedora_message('task.finished', task, body)
 
     return response
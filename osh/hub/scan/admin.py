@@ -2,7 +2,6 @@
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
 import os
-from glob import glob
 
 from django.contrib import admin
 from django.shortcuts import render
@@ -17,6 +16,7 @@ from osh.hub.scan.xmlrpc_helper import cancel_scan as h_cancel_scan
 from osh.hub.scan.xmlrpc_helper import cancel_scan_tasks
 from osh.hub.scan.xmlrpc_helper import fail_scan as h_fail_scan
 from osh.hub.scan.xmlrpc_helper import finish_scan as h_finish_scan
+from osh.hub.service.path import TaskResultPaths
 
 
 @admin.register(admin.models.LogEntry)
@@ -85,7 +85,7 @@ class ScanAdmin(OSHModelAdmin):
         task = Task.objects.get(scanbinding__scan__id=scan_id)
         task.state = TASK_STATES['CLOSED']
         task.save()
-        tb_path = glob(os.path.join(Task.get_task_dir(task.id), '*.tar.xz'))[0]
+        tb_path = TaskResultPaths(task).get_tarball_path()
         h_finish_scan(request, scan_id, os.path.basename(tb_path))
         scan = Scan.objects.get(id=scan_id)
 
@@ -0,0 +1,30 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+from django.core.management.base import BaseCommand, CommandError
+from kobo.client.constants import FINISHED_STATES
+from kobo.hub.models import Task
+
+from osh.hub.service.path import get_task_placement
+
+
+class Command(BaseCommand):
+    help = "Move task dirs of finished tasks to the volumes they belong to"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only print which task dirs would be moved')
+
+    def handle(self, *args, **options):
+        placement = get_task_placement()
+        if not placement.volumes:
+            raise CommandError("No TASK_VOLUMES are configured")
+
+        # task dirs of running tasks may be written to
+        task_ids = Task.objects.filter(state__in=FINISHED_STATES) \
+            .order_by('id').values_list('id', flat=True).iterator()
+
+        moved = placement.rebalance(task_ids, dry_run=options['dry_run'])
+        for task_id, volume in moved:
+            self.stdout.write("Task %d -> %s" % (task_id, volume))
+        self.stdout.write("Moved task dirs of %d tasks" % len(moved))
@@ -20,6 +20,7 @@ from django.conf import settings
 __all__ = (
     "send_message",
     "post_qpid_message",
+    "publish_fedora_message",
 )
 
 logger = logging.getLogger(__name__)
@@ -88,3 +89,19 @@ def post_qpid_message(state, etm, key):
     logger.info('message bus: %s %s', etm, state)
     message = {'scan_id': etm.id, 'scan_state': state}
     send_message(message, key)
+
+
+def publish_fedora_message(topic, task, body=None):
+    """publish a message about `task` to Fedora rabbitmq"""
+    # Send messages only for main tasks (and not subtasks)
+    if not settings.ENABLE_FEDORA_MESSAGING or task.parent_id is not None:
+        return
+
+    from fedora_messaging import api, message
+
+    body = dict(body or {}, task_id=task.id)
+    try:
+        msg = message.Message(topic=topic, headers={}, body=body)
+        api.publish(msg)
+    except Exception as ex:  # noqa: B902
+        logger.error(ex)
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0004_alter_task_worker'),
+        ('scan', '0019_alter_analyzer_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultsProcessing',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(blank=True, help_text='Name of the uploaded results tarball', max_length=256, null=True)),
+                ('state', models.PositiveIntegerField(choices=[(0, 'QUEUED'), (1, 'RUNNING'), (2, 'DONE'), (3, 'FAILED')], default=0, help_text='Processing state')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='', help_text='Error of the last failed attempt')),
+                ('hub_url', models.CharField(blank=True, default='', help_text='URL of the hub used in notifications', max_length=256)),
+                ('notify', models.BooleanField(default=False, help_text='Send notification once processed')),
+                ('message', models.JSONField(blank=True, help_text='Fedora message published once processed', null=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_started', models.DateTimeField(blank=True, null=True)),
+                ('date_finished', models.DateTimeField(blank=True, null=True)),
+                ('date_retry', models.DateTimeField(blank=True, help_text='Do not retry the processing before this time', null=True)),
+                ('scan', models.ForeignKey(blank=True, help_text='Scan to finish, empty for regular tasks', null=True, on_delete=django.db.models.deletion.CASCADE, to='scan.scan')),
+                ('task', models.ForeignKey(help_text='Task which uploaded the results', on_delete=django.db.models.deletion.CASCADE, to='hub.task')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
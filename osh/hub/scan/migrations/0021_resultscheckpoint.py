@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0004_alter_task_worker'),
+        ('scan', '0020_resultsprocessing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultsCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.PositiveIntegerField(choices=[(0, 'UNPACKED'), (1, 'DIFFED'), (2, 'LOADED'), (3, 'MATCHED')])),
+                ('date_reached', models.DateTimeField(auto_now_add=True)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hub.task')),
+            ],
+            options={
+                'unique_together': {('task', 'stage')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0004_alter_task_worker'),
+        ('scan', '0021_resultscheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultsManifest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tarball', models.CharField(help_text='Name of the results tarball', max_length=255)),
+                ('tarball_size', models.BigIntegerField()),
+                ('tarball_sha256', models.CharField(max_length=64)),
+                ('files', models.JSONField(help_text="Files in the tarball: {name: {'size': ..., 'sha256': ...}}")),
+                ('defects', models.JSONField(help_text='Number of defects per checker')),
+                ('analyzers', models.JSONField(help_text='Versions of analyzers')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='results_manifest', to='hub.task')),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0004_alter_task_worker'),
+        ('scan', '0022_resultsmanifest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResolvedResultPaths',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tarball', models.CharField(blank=True, help_text='Key of the results tarball in the results storage', max_length=255)),
+                ('json_results', models.CharField(blank=True, help_text='Path to JSON results relative to the task dir', max_length=255)),
+                ('diffed', models.BooleanField(default=False, help_text='Diffs against the base task exist')),
+                ('files', models.JSONField(default=list, help_text='Files of the task relative to the task dir')),
+                ('date_resolved', models.DateTimeField(auto_now=True)),
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='resolved_result_paths', to='hub.task')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scan', '0023_resolvedresultpaths'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanTree',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('html', models.TextField()),
+                ('date_rendered', models.DateTimeField(auto_now=True)),
+                ('package', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='scan_tree', to='scan.package')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scan', '0024_scantree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultsprocessing',
+            name='processor',
+            field=models.CharField(blank=True, default='', help_text='Results processor (host:pid) running the entry', max_length=256),
+        ),
+        migrations.AddField(
+            model_name='resultsprocessing',
+            name='date_heartbeat',
+            field=models.DateTimeField(blank=True, help_text='Last time the processor renewed its lease', null=True),
+        ),
+    ]
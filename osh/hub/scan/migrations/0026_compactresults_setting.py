@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+from django.db import migrations
+
+
+def add_setting(apps, schema_editor):
+    RetentionPolicySetting = apps.get_model('scan', 'RetentionPolicySetting')
+    db_alias = schema_editor.connection.alias
+    # disabled until the number of days is set
+    RetentionPolicySetting.objects.using(db_alias).get_or_create(name='CompactResults',
+                                                                 defaults={'days': None})
+
+
+def remove_setting(apps, schema_editor):
+    RetentionPolicySetting = apps.get_model('scan', 'RetentionPolicySetting')
+    db_alias = schema_editor.connection.alias
+    RetentionPolicySetting.objects.using(db_alias).filter(name='CompactResults').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scan', '0025_resultsprocessing_lease'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_setting, remove_setting),
+    ]
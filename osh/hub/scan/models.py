@@ -2,6 +2,7 @@
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
 import datetime
+import fnmatch
 import json
 import logging
 import re
@@ -17,6 +18,8 @@ from kobo.client.constants import TASK_STATES
 from kobo.hub.models import Task
 from kobo.types import Enum, EnumItem
 
+from osh.common.constants import (DEFAULT_RESULTS_COMPRESSION,
+                                  RESULTS_TARBALL_SUFFIXES)
 from osh.hub.other import get_or_none
 from osh.hub.scan.messaging import post_qpid_message
 
@@ -320,49 +323,62 @@ of this packages scan")
 
     display_latest_scans = property(get_latest_scans)
 
-    def display_graph(self, scan, response, indent_level=0):
-        if scan is None:
-            return response
-        sb = ScanBinding.objects.get(scan=scan)
-
-        response += '<div style="margin-left: %dem">%s<a href="%s">%s</a> (%s)' % (
-            indent_level if indent_level <= 1 else indent_level * 2,
-            '\u2570\u2500\u2500' if indent_level > 0 else '',
-            reverse("waiving/result", args=(sb.id,)),  # url
-            scan.nvr,
-            scan.get_state_display())
-
-        if sb.result is not None:
-            response += ' New defects: %d, fixed defects: %d' % (
-                sb.result.new_defects_count(),
-                sb.result.fixed_defects_count())
-
-        response += '</div>\n'
-
-        return self.display_graph(scan.parent,
-                                  response, indent_level + 1)
+    def render_scan_chain(self, scan, scans):
+        """
+        render chain of scans following `scan` through their parents, `scans`
+        are rows of all scans of the package by their IDs
+        """
+        response = ''
+        indent_level = 0
+        while scan is not None:
+            if scan['scanbinding'] is not None:
+                link = '<a href="%s">%s</a>' % (reverse("waiving/result", args=(scan['scanbinding'],)),
+                                                scan['nvr'])
+            else:
+                link = scan['nvr']
+            response += '<div style="margin-left: %dem">%s%s (%s)' % (
+                indent_level if indent_level <= 1 else indent_level * 2,
+                '\u2570\u2500\u2500' if indent_level > 0 else '',
+                link,
+                SCAN_STATES.get_value(scan['state']))
+
+            if scan['scanbinding__result'] is not None:
+                response += ' New defects: %d, fixed defects: %d' % (
+                    scan['scanbinding__result__new_defects_counter'],
+                    scan['scanbinding__result__fixed_defects_counter'])
+
+            response += '</div>\n'
+            scan = scans.get(scan['parent'])
+            indent_level += 1
+        return response
 
-    def display_scan_tree(self):
-        blocked_releases = self.get_partially_blocked_releases()\
-                               .values_list('release', flat=True)
-        scans = Scan.objects.filter(package=self)
+    def render_scan_tree(self):
+        """
+        render chains of scans of the package in all its releases; scans are
+        loaded with their bindings and counters of defects by a single query
+        and the chains are followed in memory
+        """
+        blocked_releases = {attr['release'] for attr in self.get_partially_blocked_releases()}
+        scans = {scan['id']: scan for scan in Scan.objects.filter(package=self).values(
+            'id', 'nvr', 'state', 'scan_type', 'date_submitted', 'parent', 'tag__release',
+            'base', 'base__nvr', 'base__scanbinding', 'scanbinding', 'scanbinding__result',
+            'scanbinding__result__new_defects_counter', 'scanbinding__result__fixed_defects_counter')}
 
         if not blocked_releases and not scans:
-            return mark_safe('There are no scans submitted related to this \
-package')
+            return 'There are no scans submitted related to this package'
 
-        releases = scans.filter(tag__release__isnull=False)\
-                        .values_list('tag__release', flat=True)\
-                        .union(blocked_releases)
+        release_ids = {scan['tag__release'] for scan in scans.values()
+                       if scan['tag__release'] is not None} | blocked_releases
+        releases = SystemRelease.objects.in_bulk(release_ids)
         response = ""
 
-        for release_id in sorted(releases):
-            scans_package = scans.filter(
-                tag__release__id=release_id,
-                state__in=SCAN_STATES_FINISHED_WELL,
-                scan_type__in=SCAN_TYPES_TARGET)
+        for release_id in sorted(release_ids):
+            scans_package = [scan for scan in scans.values()
+                             if scan['tag__release'] == release_id
+                             and scan['state'] in SCAN_STATES_FINISHED_WELL
+                             and scan['scan_type'] in SCAN_TYPES_TARGET]
 
-            release = SystemRelease.objects.get(id=release_id)
+            release = releases[release_id]
 
             response += '<div>\n<div style="display:flex; align-items: center;">\n'
             response += '<h3>%s release %d%s</h3>\n' % (
@@ -376,26 +392,34 @@ package')
                 continue
 
             # get latest scan with the first NVR
-            first_nvr = scans_package.order_by('date_submitted')[0].nvr
-            first_scan = scans_package.filter(nvr=first_nvr).latest()
+            first_nvr = min(scans_package, key=lambda scan: scan['date_submitted'])['nvr']
+            first_scan = max((scan for scan in scans_package if scan['nvr'] == first_nvr),
+                             key=lambda scan: scan['date_submitted'])
 
             # handle base scan
-            base = first_scan.base
             response += '<span style="position:absolute; left: 45em">Base: '
 
-            if base is not None:
-                sb_base = ScanBinding.objects.get(scan=base)
+            if first_scan['base__scanbinding'] is not None:
                 response += '<a href="%s">%s</a>' % (
-                    reverse("waiving/result", args=(sb_base.id,)),
-                    base.nvr)
+                    reverse("waiving/result", args=(first_scan['base__scanbinding'],)),
+                    first_scan['base__nvr'])
+            elif first_scan['base'] is not None:
+                response += first_scan['base__nvr']
             else:
                 response += 'NEW PACKAGE'
 
             response += '</span>\n</div>\n'
 
-            response = self.display_graph(first_scan, response)
+            response += self.render_scan_chain(first_scan, scans)
             response += "<hr/ ></div>\n"
-        return mark_safe(response)
+        return response
+
+    def display_scan_tree(self):
+        """ return rendered scan tree, cached until a scan of the package changes """
+        tree = ScanTree.objects.get_html(self)
+        if tree is None:
+            tree = ScanTree.objects.record(self, self.render_scan_tree())
+        return mark_safe(tree)
 
     def is_blocked(self, release):
         try:
@@ -452,6 +476,11 @@ class PackageAttribute(models.Model):
     def __str__(self):
         return "%s = %s (%s %s)" % (self.key, self.value, self.package, self.release)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # the scan tree of the package displays blocked releases
+        ScanTree.objects.invalidate(self.package_id)
+
     @classmethod
     def create(cls, package, release):
         atr = cls()
@@ -603,6 +632,11 @@ counted in statistics.")
         else:
             return prefix
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # the scan tree of the package displays states of its scans
+        ScanTree.objects.invalidate(self.package_id)
+
     def can_have_base(self):
         return self.scan_type in (SCAN_TYPES['ERRATA'], SCAN_TYPES['REBASE'])
 
@@ -786,6 +820,24 @@ counted in statistics.")
         ).order_by('date_submitted')
         return scans
 
+    def get_order_in_release(self):
+        """
+        return tuple (order of the scan in all_scans_in_release(), number of
+        those scans); order is None if the scan is not one of them
+        """
+        if self.tag is None:
+            return None, 0
+
+        earlier = models.Q(date_submitted__lt=self.date_submitted) | \
+            models.Q(date_submitted=self.date_submitted, id__lt=self.id)
+        counts = self.all_scans_in_release().aggregate(
+            count=models.Count('id'),
+            earlier=models.Count('id', filter=earlier),
+            this=models.Count('id', filter=models.Q(id=self.id)),
+        )
+        order = counts['earlier'] + 1 if counts['this'] else None
+        return order, counts['count']
+
     def finalize(self):
         """
         this scan doesn't contain any unprocessed defects
@@ -1263,6 +1315,10 @@ def _validate_command_arguments(cmd_args):
     if errors:
         raise ValidationError(errors)
 
+    compression = cmd_args.get('results_compression', DEFAULT_RESULTS_COMPRESSION)
+    if compression not in RESULTS_TARBALL_SUFFIXES:
+        raise ValidationError(f'Command arguments contain unknown results compression: "{compression}"')
+
 
 class Profile(models.Model):
     """
@@ -1299,6 +1355,11 @@ class Profile(models.Model):
             logger.info("No csmock arguments for profile '%s'", self)
             return ''
 
+    @property
+    def results_compression(self):
+        """ compression of results tarballs, see RESULTS_TARBALL_SUFFIXES """
+        return self.command_arguments.get('results_compression', DEFAULT_RESULTS_COMPRESSION)
+
 
 class RetentionPolicySetting(models.Model):
     name = models.CharField(max_length=128, blank=False, null=False, unique=True)
@@ -1317,3 +1378,252 @@ class TaskResultsRemoval(models.Model):
     reason = models.ForeignKey(RetentionPolicySetting, on_delete=models.CASCADE,
                                help_text="Reason why the retention was applied to the task")
     date_retention_applied = models.DateTimeField(auto_now_add=True)
+
+
+RESULTS_PROCESSING_STATES = Enum(
+    EnumItem("QUEUED", help_text="Waiting for a processor"),
+    EnumItem("RUNNING", help_text="Being processed"),
+    EnumItem("DONE", help_text="Processed successfully"),
+    EnumItem("FAILED", help_text="Processing failed"),
+)
+
+RESULTS_PROCESSING_PENDING = (
+    RESULTS_PROCESSING_STATES['QUEUED'],
+    RESULTS_PROCESSING_STATES['RUNNING'],
+)
+
+
+class ResultsProcessingMixin:
+    def pending(self):
+        return self.filter(state__in=RESULTS_PROCESSING_PENDING)
+
+    def ready(self):
+        """ queued entries which may be processed right now """
+        return self.filter(state=RESULTS_PROCESSING_STATES['QUEUED']).filter(
+            models.Q(date_retry__isnull=True) | models.Q(date_retry__lte=datetime.datetime.now()))
+
+    def depth(self):
+        """ return number of entries in each state: {'QUEUED': 3, ...} """
+        counts = dict(self.values_list('state').annotate(count=models.Count('id')))
+        return {name: counts.get(state, 0)
+                for state, name in RESULTS_PROCESSING_STATES.get_mapping()}
+
+    def stale(self, lease):
+        """
+        running entries whose processor has not renewed its lease for `lease`
+        seconds, e.g. because it got killed; entries processed synchronously
+        by the XML-RPC calls hold no lease
+        """
+        expired = datetime.datetime.now() - datetime.timedelta(seconds=lease)
+        return self.filter(state=RESULTS_PROCESSING_STATES['RUNNING'],
+                           date_heartbeat__lt=expired)
+
+
+class ResultsProcessingQuerySet(models.query.QuerySet, ResultsProcessingMixin):
+    pass
+
+
+class ResultsProcessingManager(models.Manager, ResultsProcessingMixin):
+    def get_queryset(self):
+        return ResultsProcessingQuerySet(self.model, using=self._db)
+
+
+class ResultsProcessing(models.Model):
+    """
+    Results uploaded by a worker which wait to be processed by the hub
+    """
+    task = models.ForeignKey(Task, on_delete=models.CASCADE,
+                             help_text="Task which uploaded the results")
+    scan = models.ForeignKey(Scan, on_delete=models.CASCADE, blank=True, null=True,
+                             help_text="Scan to finish, empty for regular tasks")
+    filename = models.CharField(max_length=256, blank=True, null=True,
+                                help_text="Name of the uploaded results tarball")
+    state = models.PositiveIntegerField(default=RESULTS_PROCESSING_STATES['QUEUED'],
+                                        choices=RESULTS_PROCESSING_STATES.get_mapping(),
+                                        help_text="Processing state")
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="",
+                             help_text="Error of the last failed attempt")
+    hub_url = models.CharField(max_length=256, blank=True, default="",
+                               help_text="URL of the hub used in notifications")
+    notify = models.BooleanField(default=False,
+                                 help_text="Send notification once processed")
+    message = models.JSONField(blank=True, null=True,
+                               help_text="Fedora message published once processed")
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_started = models.DateTimeField(blank=True, null=True)
+    date_finished = models.DateTimeField(blank=True, null=True)
+    date_retry = models.DateTimeField(blank=True, null=True,
+                                      help_text="Do not retry the processing before this time")
+    processor = models.CharField(max_length=256, blank=True, default="",
+                                 help_text="Results processor (host:pid) running the entry")
+    date_heartbeat = models.DateTimeField(blank=True, null=True,
+                                          help_text="Last time the processor renewed its lease")
+
+    objects = ResultsProcessingManager()
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return "#%d %s (%s)" % (self.id, self.task, self.get_state_display())
+
+    def is_pending(self):
+        return self.state in RESULTS_PROCESSING_PENDING
+
+
+RESULTS_STAGES = Enum(
+    EnumItem("UNPACKED", help_text="Results tarball unpacked"),
+    EnumItem("DIFFED", help_text="Results diffed against the base"),
+    EnumItem("LOADED", help_text="Results loaded into the database"),
+    EnumItem("MATCHED", help_text="Matched against waivers from the past"),
+)
+
+
+class ResultsCheckpointMixin:
+    def for_task(self, task):
+        return self.filter(task=task)
+
+    def reached(self, task, stage):
+        return self.for_task(task).filter(stage=stage).exists()
+
+
+class ResultsCheckpointQuerySet(models.query.QuerySet, ResultsCheckpointMixin):
+    pass
+
+
+class ResultsCheckpointManager(models.Manager, ResultsCheckpointMixin):
+    def get_queryset(self):
+        return ResultsCheckpointQuerySet(self.model, using=self._db)
+
+    def record(self, task, stage):
+        """ mark the stage of results processing of the task as completed """
+        self.get_or_create(task=task, stage=stage)
+
+
+class ResultsCheckpoint(models.Model):
+    """
+    Completed stage of results processing of a task; completed stages are
+    skipped when the processing is resumed
+    """
+    task = models.ForeignKey(Task, on_delete=models.CASCADE)
+    stage = models.PositiveIntegerField(choices=RESULTS_STAGES.get_mapping())
+    date_reached = models.DateTimeField(auto_now_add=True)
+
+    objects = ResultsCheckpointManager()
+
+    class Meta:
+        unique_together = ('task', 'stage')
+
+    def __str__(self):
+        return "%s: %s" % (self.task, self.get_stage_display())
+
+
+class ResultsManifestManager(models.Manager):
+    def for_task(self, task):
+        """ return manifest of results of the task, None if there is none """
+        return self.filter(task=task).first()
+
+    def record(self, task, manifest):
+        """ store `manifest` (see osh.common.manifest) of results of the task """
+        obj, _ = self.update_or_create(task=task, defaults={
+            'tarball': manifest['tarball']['name'],
+            'tarball_size': manifest['tarball']['size'],
+            'tarball_sha256': manifest['tarball']['sha256'],
+            'files': manifest['files'],
+            'defects': manifest['defects'],
+            'analyzers': manifest['analyzers'],
+        })
+        return obj
+
+
+class ResultsManifest(models.Model):
+    """
+    Manifest of the results tarball uploaded by the worker along with it,
+    the authoritative list of files in the results of the task
+    """
+    task = models.OneToOneField(Task, on_delete=models.CASCADE, related_name='results_manifest')
+    tarball = models.CharField(max_length=255, help_text="Name of the results tarball")
+    tarball_size = models.BigIntegerField()
+    tarball_sha256 = models.CharField(max_length=64)
+    files = models.JSONField(help_text="Files in the tarball: {name: {'size': ..., 'sha256': ...}}")
+    defects = models.JSONField(help_text="Number of defects per checker")
+    analyzers = models.JSONField(help_text="Versions of analyzers")
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    objects = ResultsManifestManager()
+
+    def __str__(self):
+        return "%s: %s" % (self.task, self.tarball)
+
+    def glob(self, pattern):
+        """ return sorted names of files matching `pattern`; '*' does not match '/' """
+        depth = pattern.count('/')
+        return sorted(name for name in self.files
+                      if name.count('/') == depth and fnmatch.fnmatchcase(name, pattern))
+
+    def defect_count(self):
+        return sum(self.defects.values())
+
+
+class ResolvedResultPathsManager(models.Manager):
+    def for_task(self, task):
+        """ return resolved paths to results of the task, None if not resolved """
+        return self.filter(task=task).first()
+
+    def record(self, task, **fields):
+        obj, _ = self.update_or_create(task=task, defaults=fields)
+        return obj
+
+    def invalidate(self, task):
+        """ forget the paths once the results of the task have changed """
+        self.filter(task=task).delete()
+
+
+class ResolvedResultPaths(models.Model):
+    """
+    Paths to results of a task resolved once the results have been processed,
+    so that pages displaying the results do not need to probe the task dir
+    """
+    task = models.OneToOneField(Task, on_delete=models.CASCADE, related_name='resolved_result_paths')
+    tarball = models.CharField(max_length=255, blank=True,
+                               help_text="Key of the results tarball in the results storage")
+    json_results = models.CharField(max_length=255, blank=True,
+                                    help_text="Path to JSON results relative to the task dir")
+    diffed = models.BooleanField(default=False, help_text="Diffs against the base task exist")
+    files = models.JSONField(default=list, help_text="Files of the task relative to the task dir")
+    date_resolved = models.DateTimeField(auto_now=True)
+
+    objects = ResolvedResultPathsManager()
+
+    def __str__(self):
+        return "%s" % self.task
+
+
+class ScanTreeManager(models.Manager):
+    def get_html(self, package):
+        """ return rendered scan tree of the package, None if it is not cached """
+        return self.filter(package=package).values_list('html', flat=True).first()
+
+    def record(self, package, html):
+        self.update_or_create(package=package, defaults={'html': html})
+        return html
+
+    def invalidate(self, package):
+        """ forget the tree once a scan of the package has changed """
+        self.filter(package=package).delete()
+
+
+class ScanTree(models.Model):
+    """
+    Rendered tree of scans displayed on the page of a package, dropped
+    whenever a scan of the package changes
+    """
+    package = models.OneToOneField(Package, on_delete=models.CASCADE, related_name='scan_tree')
+    html = models.TextField()
+    date_rendered = models.DateTimeField(auto_now=True)
+
+    objects = ScanTreeManager()
+
+    def __str__(self):
+        return "%s" % self.package
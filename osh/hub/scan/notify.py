@@ -13,7 +13,7 @@ from django.urls import reverse
 from kobo.client.constants import TASK_STATES
 from kobo.hub.models import Task
 
-from osh.hub.scan.models import SCAN_STATES, AppSettings, Scan
+from osh.hub.scan.models import SCAN_STATES, AppSettings, ResultsManifest, Scan
 from osh.hub.service.loading import get_defect_stats, load_defects
 from osh.hub.waiving.service import get_scans_new_defects_count
 
@@ -73,8 +73,15 @@ def generate_stats(task, diff_task=False, with_defects_in_patches=False):
             result_list += ["%-25s %s%d" % (checker, diff_sign, count) for checker, count in sorted_list]
             result_list.append('')
         return result_list
+
+    if not diff_task and not with_defects_in_patches:
+        # counts of defects per checker are summarized in the manifest
+        manifest = ResultsManifest.objects.for_task(task)
+        if manifest is not None:
+            return '\n'.join(display_defects([], 'All defects', manifest.defects))
+
     try:
-        defects_json = load_defects(task.id, diff_task)
+        defects_json = load_defects(task.id, diff_task, streaming=True)
     except RuntimeError:
         return ''
     result = []
@@ -0,0 +1,316 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Queue of results uploaded by workers
+
+Unpacking, diffing and loading of results into the database is expensive and
+used to block the worker's finish_task/finish_scan XML-RPC call until done.
+The calls now only record a ResultsProcessing entry which is then processed by
+the osh-results-processor daemon (or right away if
+ENABLE_ASYNC_RESULTS_PROCESSING is disabled).
+"""
+
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.parse
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.urls import get_script_prefix, set_script_prefix
+from kobo.hub.models import TASK_STATES, Task
+
+from osh.hub.other.exceptions import ScanException
+from osh.hub.scan.messaging import publish_fedora_message
+from osh.hub.scan.models import (RESULTS_PROCESSING_STATES, AppSettings,
+                                 ResultsProcessing, ScanBinding)
+from osh.hub.scan.notify import send_task_notification
+from osh.hub.scan.xmlrpc_helper import (fail_scan, finish_scan,
+                                        scan_notification_email)
+from osh.hub.service.path import TaskResultPaths, publish_task_dir
+from osh.hub.waiving.results_loader import TaskResultsProcessor
+
+logger = logging.getLogger(__name__)
+
+# how long an idle processor waits before looking for new entries (in seconds)
+POLL_INTERVAL = 2
+
+# how long to postpone processing of a task while its subtasks are pending
+SUBTASK_WAIT = 5
+
+
+def processor_id():
+    """identify this results processor among processors of all hub nodes"""
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+class HubRequest:
+    """
+    Stand-in for the XML-RPC request of the worker which uploaded the results,
+    used to build absolute URLs in notifications sent by the processor
+    """
+    def __init__(self, hub_url):
+        self.hub_url = hub_url
+
+    def build_absolute_uri(self, location):
+        return urllib.parse.urljoin(self.hub_url, location)
+
+
+def enqueue_results(request, task, scan=None, filename=None, message=None, **kwargs):
+    """record results of `task` (or `scan`) to be processed"""
+    return ResultsProcessing.objects.create(
+        task=task,
+        scan=scan,
+        filename=filename,
+        hub_url=request.build_absolute_uri(get_script_prefix()),
+        message=message,
+        **kwargs,
+    )
+
+
+def defer_notification(task_id):
+    """
+    mark pending results of the task to be notified about once processed,
+    return False if there is nothing pending and the notification can be sent
+    """
+    return ResultsProcessing.objects.pending().filter(task_id=task_id).update(notify=True) > 0
+
+
+def fail_processed_task(task):
+    """
+    fail the task whose results could not be processed; kobo only fails OPEN
+    tasks, but queued results are processed after the task has been closed
+    """
+    if task.is_failed():
+        return
+    if task.state == TASK_STATES['OPEN']:
+        task.fail_task()
+    else:
+        task.state = TASK_STATES['FAILED']
+        task.save(update_fields=['state'])
+
+
+def process_task_results(task):
+    """unpack results of a regular task and diff them against its base"""
+    base_task = None
+    if task.subtasks():
+        base_task = task.subtasks()[0]
+    exclude_dirs = AppSettings.settings_get_results_tb_exclude_dirs()
+    td = TaskResultsProcessor(task, base_task, exclude_dirs)
+    td.unpack_results()
+
+    if base_task:
+        try:
+            td.generate_diffs()
+        except RuntimeError as ex:
+            logger.error("Can't diff tasks %s %s: %s", base_task, task, ex)
+            fail_processed_task(task)
+
+
+def claim_job():
+    """lock the oldest ready entry for processing, return None if there is none"""
+    with transaction.atomic():
+        job = ResultsProcessing.objects.ready().select_for_update(skip_locked=True).first()
+        if job is None:
+            return None
+
+        job.state = RESULTS_PROCESSING_STATES['RUNNING']
+        job.attempts += 1
+        job.date_started = job.date_heartbeat = datetime.datetime.now()
+        job.processor = processor_id()
+        job.save(update_fields=['state', 'attempts', 'date_started', 'processor',
+                                'date_heartbeat'])
+    return job
+
+
+def renew_lease():
+    """renew the lease of entries run by this processor"""
+    return ResultsProcessing.objects.filter(state=RESULTS_PROCESSING_STATES['RUNNING'],
+                                            processor=processor_id()) \
+        .update(date_heartbeat=datetime.datetime.now())
+
+
+def requeue_stale():
+    """
+    queue again entries left running by a processor which got killed;
+    entries of processors which are still alive are not touched
+    """
+    with transaction.atomic():
+        ids = list(ResultsProcessing.objects.stale(settings.RESULTS_PROCESSING_LEASE)
+                   .select_for_update(skip_locked=True).values_list('id', flat=True))
+        if not ids:
+            return 0
+        logger.warning("Queueing stale entries again: %s", ids)
+        return ResultsProcessing.objects.filter(id__in=ids) \
+            .update(state=RESULTS_PROCESSING_STATES['QUEUED'], processor="",
+                    date_heartbeat=None)
+
+
+def _update(job, **kwargs):
+    # do not use job.save() -- `notify` may have been set in the meantime
+    ResultsProcessing.objects.filter(id=job.id).update(**kwargs)
+    for key, value in kwargs.items():
+        setattr(job, key, value)
+
+
+def _notify(job):
+    if not ResultsProcessing.objects.filter(id=job.id, notify=True).exists():
+        return
+
+    set_script_prefix(urllib.parse.urlparse(job.hub_url).path or '/')
+    request = HubRequest(job.hub_url)
+    try:
+        if job.scan_id is None:
+            send_task_notification(request, job.task_id)
+        else:
+            scan_notification_email(request, job.scan_id)
+    except Exception as ex:  # noqa: B902
+        logger.error("Can't send notification for %s: %s", job, ex)
+
+
+def _handle_failure(job, ex, sync):
+    logger.exception("Processing of %s failed", job)
+    error = repr(ex)
+
+    if not sync and job.attempts < settings.RESULTS_PROCESSING_MAX_ATTEMPTS:
+        delay = settings.RESULTS_PROCESSING_RETRY_DELAY * job.attempts
+        _update(job, state=RESULTS_PROCESSING_STATES['QUEUED'], error=error,
+                date_retry=datetime.datetime.now() + datetime.timedelta(seconds=delay))
+        return
+
+    _update(job, state=RESULTS_PROCESSING_STATES['FAILED'], error=error,
+            date_finished=datetime.datetime.now())
+    if sync:
+        raise ex
+
+    task = Task.objects.get(id=job.task_id)
+    fail_processed_task(task)
+    if job.scan_id is not None:
+        fail_scan(job.scan_id, error)
+    else:
+        publish_fedora_message('task.finished', task, {'status': 'fail'})
+    _notify(job)
+
+
+def run_job(job, sync=False):
+    """
+    process the results; failures are retried unless `sync` is set, in which
+    case the exception is propagated to the caller
+    """
+    task = job.task
+    if job.scan_id is None and not sync and \
+            ResultsProcessing.objects.pending().filter(task__parent=task).exists():
+        # diffs need the results of the base scan, do not count this attempt
+        logger.debug("Postponing %s, its subtasks are not processed yet", job)
+        _update(job, state=RESULTS_PROCESSING_STATES['QUEUED'], attempts=job.attempts - 1,
+                date_retry=datetime.datetime.now() + datetime.timedelta(seconds=SUBTASK_WAIT))
+        return
+
+    logger.info("Processing %s", job)
+    try:
+        if job.scan_id is None:
+            process_task_results(task)
+        else:
+            finish_scan(None, job.scan_id, job.filename)
+        publish_task_dir(task.id)
+        TaskResultPaths(task).resolve()
+    except Exception as ex:  # noqa: B902
+        _handle_failure(job, ex, sync)
+        return
+
+    _update(job, state=RESULTS_PROCESSING_STATES['DONE'], error="",
+            date_finished=datetime.datetime.now())
+    if job.message is not None:
+        publish_fedora_message('task.finished', task, job.message)
+    _notify(job)
+
+
+def process_results(request, task, scan=None, filename=None, message=None):
+    """queue the results or process them right away if the queue is disabled"""
+    if settings.ENABLE_ASYNC_RESULTS_PROCESSING:
+        return enqueue_results(request, task, scan, filename, message)
+
+    job = enqueue_results(request, task, scan, filename, message, attempts=1,
+                          state=RESULTS_PROCESSING_STATES['RUNNING'],
+                          date_started=datetime.datetime.now())
+    run_job(job, sync=True)
+    return job
+
+
+def resume_scan(scan_id):
+    """
+    process results of a scan again, e.g. after it failed half way through;
+    stages completed by the previous run are skipped
+    """
+    sb = ScanBinding.objects.by_scan_id(scan_id)
+    job = ResultsProcessing.objects.create(
+        task=sb.task, scan=sb.scan, attempts=1,
+        state=RESULTS_PROCESSING_STATES['RUNNING'],
+        date_started=datetime.datetime.now())
+    run_job(job, sync=True)
+    return job
+
+
+def _heartbeat(stop):
+    while not stop.wait(settings.RESULTS_PROCESSING_LEASE / 3):
+        close_old_connections()
+        try:
+            renew_lease()
+            requeue_stale()
+        except Exception:  # noqa: B902
+            logger.exception("Can't renew lease of the results processor")
+    close_old_connections()
+
+
+def _worker(stop, once):
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            job = claim_job()
+            if job is not None:
+                run_job(job)
+                continue
+        except Exception:  # noqa: B902
+            logger.exception("Results processor failed")
+
+        if once:
+            return
+        stop.wait(POLL_INTERVAL)
+
+
+def process_queue(workers=None, once=False):
+    """
+    process queued results with `workers` threads until interrupted, or
+    until the queue is empty if `once` is set
+    """
+    if workers is None:
+        workers = settings.RESULTS_PROCESSORS
+    if workers < 1:
+        raise ScanException("Number of results processors has to be positive")
+
+    requeue_stale()
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=_worker, args=(stop, once), daemon=True)
+               for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    heartbeat = threading.Thread(target=_heartbeat, args=(stop,), daemon=True)
+    heartbeat.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(0.5)
+    finally:
+        stop.set()
+        for thread in threads + [heartbeat]:
+            thread.join()
+        close_old_connections()
+
+
+def queue_depth():
+    """return number of entries in each state"""
+    return ResultsProcessing.objects.depth()
@@ -29,6 +29,7 @@ from osh.hub.scan.models import (REQUEST_STATES, SCAN_TYPES, AppSettings,
                                  Package, Profile, Scan, ScanBinding, Tag)
 from osh.hub.scan.service import get_latest_binding
 from osh.hub.scan.utils import get_or_fail, is_rebase
+from osh.hub.service.path import get_task_dir
 from osh.hub.service.processing import task_has_results
 
 logger = logging.getLogger(__name__)
@@ -279,7 +280,7 @@ class AbstractTargetScheduler(AbstractScheduler):
         self.store()
         task_id = Task.create_task(**self.task_args)
         task = Task.objects.get(id=task_id)
-        task_dir = Task.get_task_dir(task_id, create=True)
+        task_dir = get_task_dir(task_id, create=True)
 
         if self.task_args['args']['mock_config'] == 'auto':
             move_mock_configs(self.mock_config_tmpdir, task_dir)
@@ -482,6 +483,7 @@ class ClientScanScheduler(AbstractClientScanScheduler):
         self.profile = self.options.get('profile', 'default')
         self.analyzer_models = check_analyzers(self.analyzers)
         self.profile_analyzers, self.profile_args = Profile.objects.get_analyzers_and_args_for_profile(self.profile)
+        self.results_compression = Profile.objects.get(name=self.profile).results_compression
 
         # mock profile
         self.mock_config = get_or_fail('mock_config', self.options)
@@ -555,6 +557,7 @@ class ClientScanScheduler(AbstractClientScanScheduler):
         # profile args < analyzer args < client opts
         csmock_args = self.prepare_csmock_args(self.profile_args, *tuple(analyzer_opts['args']))
         self.task_args['args']['csmock_args'] = csmock_args
+        self.task_args['args']['results_compression'] = self.results_compression
         self.task_args['args']['custom_model_name'] = self.model_name
         self.task_args['args']['su_user'] = AppSettings.setting_get_su_user()
 
@@ -570,7 +573,7 @@ class ClientScanScheduler(AbstractClientScanScheduler):
     def spawn(self):
         task_id = Task.create_task(**self.task_args)
         task = Task.objects.get(id=task_id)
-        task_dir = Task.get_task_dir(task_id, create=True)
+        task_dir = get_task_dir(task_id, create=True)
 
         if self.upload_id:
             # move file to task dir, remove upload record and make the task
@@ -654,6 +657,7 @@ class ClientDiffScanScheduler(ClientScanScheduler):
             'profile': self.task_args['args']['profile'],
             'analyzers': self.task_args['args']['analyzers'],
             'csmock_args': self.task_args['args']['csmock_args'],
+            'results_compression': self.task_args['args']['results_compression'],
             'su_user': self.task_args['args']['su_user'],
             'custom_model_name': self.task_args['args']['custom_model_name'],
             'result_filename': self.determine_result_filename(self.base_build_nvr, label, self.base_is_tarball)
@@ -7,24 +7,87 @@
 
 
 import logging
+import lzma
 import os
 import shlex
+import tarfile
 
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from kobo.hub.models import Task
 from kobo.shortcuts import run
 
 from osh.common.constants import (ERROR_DIFF_FILE, ERROR_HTML_FILE,
                                   ERROR_TXT_FILE, FIXED_DIFF_FILE,
-                                  FIXED_HTML_FILE, FIXED_TXT_FILE)
+                                  FIXED_HTML_FILE, FIXED_TXT_FILE,
+                                  RESULTS_TARBALL_SUFFIXES)
 from osh.hub.other.exceptions import ScanException
-from osh.hub.service.processing import add_title_to_json
+from osh.hub.service.blobstore import BlobStore, unshare
+from osh.hub.service.csmock_parser import ResultsExtractor
+from osh.hub.service.path import get_task_dir, get_task_placement
+from osh.hub.service.processing import (TITLE_ADDED, TITLE_FIXED,
+                                        add_title_to_json, render_reports)
 
 from .models import (SCAN_STATES, SCAN_STATES_FINISHED_BAD, SCAN_TYPES_TARGET,
                      Scan, ScanBinding)
 
 logger = logging.getLogger(__name__)
 
+# files generated by the hub, they are rewritten in place and thus must not be
+# shared with other tasks through the blob store
+HUB_GENERATED_FILES = [
+    ERROR_DIFF_FILE, FIXED_DIFF_FILE,
+    ERROR_HTML_FILE, FIXED_HTML_FILE,
+    ERROR_TXT_FILE, FIXED_TXT_FILE,
+    '*.index.json',
+]
+
+# results tarballs are not shared either: their index is only valid for the
+# size and mtime of the tarball, which differs for a link to an older copy;
+# they are rarely uploaded twice and hashing them costs another full read
+RESULTS_TARBALLS = ['*' + suffix for suffix in RESULTS_TARBALL_SUFFIXES.values()] + ['*.tar.lzma']
+
+
+def get_blob_store(task_id=None):
+    """
+    return BlobStore for deduplication of files of the task (of tasks in
+    TASK_DIR if not given), None if deduplication is disabled
+    """
+    if not settings.BLOB_STORE_DIR:
+        return None
+
+    placement = get_task_placement()
+    volume = None if task_id is None else placement.volume_of(task_id)
+    if volume is None:
+        return BlobStore(settings.BLOB_STORE_DIR)
+    return placement.blob_store(volume)
+
+
+def get_blob_stores():
+    """ return all blob stores, empty list if deduplication is disabled """
+    if not settings.BLOB_STORE_DIR:
+        return []
+    placement = get_task_placement()
+    return [BlobStore(settings.BLOB_STORE_DIR)] + \
+        [placement.blob_store(volume) for volume in placement.volumes]
+
+
+def deduplicate_task_files(task_id, paths=None):
+    """
+    replace files of the task by links to the blob store (all of them unless
+    `paths` are given); return number of bytes saved
+    """
+    store = get_blob_store(task_id)
+    if store is None:
+        return 0
+
+    if paths is None:
+        saved = store.store_tree(get_task_dir(task_id), HUB_GENERATED_FILES + RESULTS_TARBALLS)
+    else:
+        saved = store.store_files(paths)
+    logger.debug("Deduplicated %d bytes of task %s", saved, task_id)
+    return saved
+
 
 def run_diff(task_dir, base_task_dir, nvr, base_nvr):
     """
@@ -50,6 +113,12 @@ old: %s new: %s', old_err, new_err)
         raise ScanException('Error output from csmock does not exist: \
 old: %s new: %s', old_err, new_err)
 
+    # the outputs are rewritten in place, do not change files of other tasks
+    for path in (diff_file_path, fixed_diff_file_path, html_file_path, fixed_html_file_path,
+                 txt_file_path, fixed_txt_file_path, compl_html_file_path,
+                 os.path.join(task_dir, 'csdiff.log'), os.path.join(task_dir, 'csdiff_fixed.log')):
+        unshare(path)
+
     # csdiff [options] old.err new.err
     # whole csdiff call must be in one string, because character '>' cannot be
     # enclosed into quotes -- command '"csdiff" "-j" "old.err" "new.err" ">"
@@ -86,33 +155,30 @@ old: %s new: %s', old_err, new_err)
             raise RuntimeError("'%s' wasn't successfull; path: %s, code: %s" %
                                (fixed_diff_cmd, task_dir, retcode))
 
-        add_title_to_json(diff_file_path, 'Newly introduced findings')
-        add_title_to_json(fixed_diff_file_path, 'Fixed findings')
-
-        run('cshtml --scan-props-placement bottom %s > %s' %
-            (diff_file_path, html_file_path),
-            workdir=task_dir, can_fail=True)
-        run('cshtml --scan-props-placement bottom %s > %s' %
-            (fixed_diff_file_path, fixed_html_file_path),
-            workdir=task_dir, can_fail=True)
-        run('cshtml --scan-props-placement bottom %s > %s' %
-            (new_err, compl_html_file_path),
-            workdir=task_dir, can_fail=True)
-        run('csgrep %s > %s' %
-            (diff_file_path, txt_file_path),
-            workdir=task_dir, can_fail=True)
-        run('csgrep %s > %s' %
-            (fixed_diff_file_path, fixed_txt_file_path),
-            workdir=task_dir, can_fail=True)
+        add_title_to_json(diff_file_path, TITLE_ADDED)
+        add_title_to_json(fixed_diff_file_path, TITLE_FIXED)
+
+        def render(cmd):
+            retcode, _ = run(cmd, workdir=task_dir, can_fail=True)
+            return retcode == 0
+
+        render_reports([
+            (html_file_path, render, ('cshtml --scan-props-placement bottom %s > %s' %
+                                      (diff_file_path, html_file_path),)),
+            (fixed_html_file_path, render, ('cshtml --scan-props-placement bottom %s > %s' %
+                                            (fixed_diff_file_path, fixed_html_file_path),)),
+            (compl_html_file_path, render, ('cshtml --scan-props-placement bottom %s > %s' %
+                                            (new_err, compl_html_file_path),)),
+            (txt_file_path, render, ('csgrep %s > %s' %
+                                     (diff_file_path, txt_file_path),)),
+            (fixed_txt_file_path, render, ('csgrep %s > %s' %
+                                           (fixed_diff_file_path, fixed_txt_file_path),)),
+        ])
 
 
 def extract_logs_from_tarball(task_id, name=None):
     """
         Extracts files from tarball for specified task.
-
-        currently (sep 2012) module tarfile does not support lzma compression
-        so I used program tar (and xz, because RHEL5 does not have latest tar
-        program with lzma compression support)
     """
     task = Task.objects.get(id=task_id)
     task_dir = task.get_task_dir(task.id)
@@ -129,19 +195,19 @@ def extract_logs_from_tarball(task_id, name=None):
                 % (name, task_id))
     else:
         # name wasn't specified, guess tarball name:
-        # file_base (nvr without srcrpm) + tar.xz|tar.lzma
+        # file_base (nvr without srcrpm) + tar.zst|tar.xz|tar.lzma
         file_base = task.label
         if file_base.endswith('.src.rpm'):
             file_base = file_base[:-8]
-        tarball_logs = os.path.join(task_dir, file_base + '.tar.xz')
-        tarball_logs2 = os.path.join(task_dir, file_base + '.tar.lzma')
-        if os.path.isfile(tarball_logs):
-            tar_archive = tarball_logs
-        elif os.path.isfile(tarball_logs2):
-            tar_archive = tarball_logs2
+        candidates = [os.path.join(task_dir, file_base + suffix)
+                      for suffix in ('.tar.zst', '.tar.xz', '.tar.lzma')]
+        for path in candidates:
+            if os.path.isfile(path):
+                tar_archive = path
+                break
         else:
-            error_string = 'There is no tarball (%s, %s) for task %s' % \
-                (tarball_logs, tarball_logs2, task_id)
+            error_string = 'There is no tarball (%s) for task %s' % \
+                (', '.join(candidates), task_id)
             logger.error(error_string)
             raise RuntimeError(error_string)
 
@@ -149,32 +215,13 @@ def extract_logs_from_tarball(task_id, name=None):
         raise RuntimeError('There is no tarball specfied for task %s' %
                            (task_id))
 
-    # xz -cd asd.tar.xz | tar -x --exclude=\*.cov -C ./test/
-    # tar -xzf file.tar.gz -C /output/directory
-    if tar_archive.endswith('xz'):
-        command = ' '.join(['xz', '-cd', shlex.quote(tar_archive),
-                            '|', 'tar', '-x', r'--exclude=\*.cov',
-                            r'--exclude=\*cov-html',
-                            '-C ' + shlex.quote(task_dir)])
-    elif tar_archive.endswith('lzma'):
-        command = ' '.join(['xz', '-cd', '--format=lzma',
-                            shlex.quote(tar_archive),
-                            '|', 'tar', '-x', r'--exclude=\*.cov',
-                            r'--exclude=\*cov-html',
-                            '-C ' + shlex.quote(task_dir)])
-    elif tar_archive.endswith('gz'):
-        command = ['tar', '-xzf',
-                   shlex.quote(tar_archive),
-                   r'--exclude=\*.cov', r'--exclude=\*cov-html',
-                   '-C ' + shlex.quote(task_dir)]
-    else:
-        raise RuntimeError('Unsupported compression format (%s), task id: %s' %
-                           (tar_archive, task_id))
+    # multi-block xz archives are decompressed in parallel
+    rex = ResultsExtractor(tar_archive, output_dir=task_dir, unpack_in_temp=False)
     try:
-        run(command, can_fail=False, stdout=False)
-    except RuntimeError:
-        raise RuntimeError('[%s] Unable to extract tarball archive %s \
-I have used this command: %s' % (task_id, tar_archive, command))
+        rex.extract_tarball(['*.cov', '*cov-html'])
+    except (OSError, EOFError, tarfile.TarError, lzma.LZMAError) as ex:
+        raise RuntimeError('[%s] Unable to extract tarball archive %s: %s' %
+                           (task_id, tar_archive, ex))
 
 
 def get_latest_sb_by_package(release, package):
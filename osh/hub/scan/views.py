@@ -1,16 +1,25 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
-from django.http import HttpResponseRedirect
-from django.shortcuts import render
+import mimetypes
+import os
+
+from django.conf import settings
+from django.http import (HttpResponseForbidden, HttpResponseRedirect,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from django.views.generic.detail import DetailView
 from kobo.django.views.generic import ExtraListView, SearchView
 from kobo.django.xmlrpc.decorators import login_required
+from kobo.hub.models import Task
+from kobo.hub.views import HTML_LOG_MAX_SIZE
+from kobo.hub.views import task_log as kobo_task_log
 
 from osh.hub.osh_xmlrpc.scan import (create_user_diff_task, diff_build,
                                      mock_build)
 from osh.hub.scan.forms import PackageSearchForm, ScanSubmissionForm
+from osh.hub.service.path import TaskResultPaths
 
 from .models import MockConfig, Package
 
@@ -80,3 +89,70 @@ def scan_submission(request):
         raise RuntimeError("Unknown scan type: " + scan_type)
 
     return HttpResponseRedirect(reverse('task/detail', args=(task_id,)))
+
+
+def _iter_file(f, chunk_size=1024 ** 2):
+    with f:
+        yield from iter(lambda: f.read(chunk_size), b'')
+
+
+def task_log(request, id, log_name):
+    """
+    kobo's task/log view which also serves files that have not been unpacked
+    from the results tarball to the task dir, or which are only available in
+    remote results storage
+    """
+    task = get_object_or_404(Task, id=id)
+    log_path = os.path.join(Task.get_task_dir(task.id), log_name)
+    if os.path.exists(log_path) or os.path.exists(log_path + '.gz') or \
+            os.path.normpath(log_name).startswith('..'):
+        return kobo_task_log(request, id, log_name)
+
+    paths = TaskResultPaths(task)
+    key = os.path.join(paths.prefix, log_name)
+    archive = paths.get_archive()
+    if archive is not None and log_name in archive:
+        size = archive.getsize(log_name)
+
+        def iter_chunks(offset):
+            return archive.iter_chunks(log_name, offset)
+    elif not paths.storage.is_local and paths.storage.exists(key):
+        size = paths.storage.stat(key)[0]
+
+        def iter_chunks(offset):
+            # ranged reads, the file is never copied as a whole
+            return _iter_file(paths.storage.open(key, offset))
+    else:
+        return kobo_task_log(request, id, log_name)
+
+    request_format = request.GET.get('format')
+    if request_format == 'raw' or log_name.endswith(tuple(settings.VIEW_RAW_LOG_EXTENSIONS)):
+        offset = int(request.GET.get('offset', 0))
+        mimetype = mimetypes.guess_type(log_name)[0] or 'application/octet-stream'
+        response = StreamingHttpResponse(iter_chunks(offset), content_type=mimetype)
+        response['Content-Length'] = max(size - offset, 0)
+        if request_format == 'raw':
+            response['Content-Disposition'] = 'attachment; filename=%s' % os.path.basename(log_name)
+        return response
+
+    if not log_name.endswith(tuple(settings.VALID_TASK_LOG_EXTENSIONS)):
+        return HttpResponseForbidden("Can display only specific file types: %s" %
+                                     ", ".join(settings.VALID_TASK_LOG_EXTENSIONS))
+
+    # the task is finished, so there is no need to poll for new content
+    offset = max(size - HTML_LOG_MAX_SIZE, 0)
+    content = b''.join(iter_chunks(offset))
+    if offset:
+        content = b'<...trimmed, download required for full log>\n' + content.partition(b'\n')[2]
+
+    context = {
+        "title": "Task log",
+        "offset": size,
+        "task_finished": 1,
+        "next_poll": None,
+        "content": content.decode("utf-8", "replace"),
+        "log_name": log_name,
+        "task": task,
+        "json_url": reverse("task/log-json", args=[task.id, log_name]),
+    }
+    return render(request, "task/log.html", context)
@@ -0,0 +1,581 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Random access to members of results tarballs
+
+Instead of unpacking the whole tarball into the task dir, an index of its
+members (name -> offset and size within the uncompressed tar stream) is built
+once when the results are uploaded and stored next to the tarball.  If the
+tarball is an xz archive, the index also contains the map of its xz blocks so
+that reading a member only needs to decompress the blocks it is stored in.
+
+Tarballs compressed by xz, zstd, gzip and bzip2 are supported.  Reading a
+member of a compressed tarball without a block map decompresses the tarball
+from its start, such tarballs are better unpacked right away (see
+`has_random_access()`).
+"""
+
+import bz2
+import collections
+import fnmatch
+import gzip
+import io
+import json
+import logging
+import lzma
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tarfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from osh.hub.service.blobstore import unshare
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.index.json'
+INDEX_VERSION = 1
+
+# size of chunks in which compressed data are read and members are returned
+READ_CHUNK_SIZE = 1024 * 1024
+
+# filter='data' strips ownership/permissions (Python 3.12+)
+EXTRACT_KWARGS = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+
+# members never extracted from the tarball nor served from it
+ALWAYS_EXCLUDED = ['*debug']
+
+# number of threads decompressing multi-block xz files
+DECOMPRESS_THREADS = os.cpu_count() or 1
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+LZMA_ALONE_MAGIC = b']\0\0'
+XZ_HEADER_MAGIC = b'\xfd7zXZ\x00'
+XZ_FOOTER_MAGIC = b'YZ'
+XZ_HEADER_SIZE = 12
+XZ_FOOTER_SIZE = 12
+COMPRESSED_MAGICS = (b'\x1f\x8b', b'BZh', ZSTD_MAGIC, LZMA_ALONE_MAGIC, XZ_HEADER_MAGIC)
+
+# xz blocks are decompressed whole when a member stored in them is read
+MAX_RANDOM_ACCESS_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def index_path(tarball):
+    return tarball + INDEX_SUFFIX
+
+
+class ExcludeMatcher:
+    """
+    match each path component against exclude patterns to replicate tar's
+    --wildcards-match-slash --exclude
+
+    The patterns are compiled to a single regular expression and results are
+    cached per component, as the same directory names repeat in every path.
+    """
+
+    def __init__(self, patterns):
+        self.regex = re.compile('|'.join(fnmatch.translate(p) for p in patterns)) \
+            if patterns else None
+        self.cache = {}
+
+    def match_component(self, part):
+        try:
+            return self.cache[part]
+        except KeyError:
+            matched = self.cache[part] = self.regex.match(part) is not None
+            return matched
+
+    def __call__(self, name):
+        if self.regex is None:
+            return False
+        return any(self.match_component(part) for part in name.rstrip('/').split('/'))
+
+
+def _read_vli(data, pos):
+    """ decode xz variable-length integer, return tuple (value, new position) """
+    value = 0
+    for i in range(9):
+        byte = data[pos + i]
+        value |= (byte & 0x7f) << (7 * i)
+        if not byte & 0x80:
+            return value, pos + i + 1
+    raise ValueError('invalid variable-length integer in xz index')
+
+
+def _parse_xz_index(data):
+    """ return list of (unpadded size, uncompressed size) of the blocks """
+    if data[0] != 0:
+        raise ValueError('invalid xz index indicator')
+    count, pos = _read_vli(data, 1)
+    records = []
+    for _ in range(count):
+        unpadded, pos = _read_vli(data, pos)
+        uncompressed, pos = _read_vli(data, pos)
+        records.append((unpadded, uncompressed))
+    return records
+
+
+def read_xz_block_map(f):
+    """
+    return list of blocks of the xz file `f` (path or binary file object) as
+    tuples (stream offset, block offset, block size, uncompressed offset,
+    uncompressed size), all offsets are absolute and block sizes exclude
+    padding; concatenated streams are supported
+
+    Return None if the file is not a well-formed xz file.
+    """
+    if isinstance(f, str):
+        with open(f, 'rb') as fo:
+            return read_xz_block_map(fo)
+
+    try:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        streams = []
+        while end > 0:
+            # skip stream padding
+            f.seek(end - 4)
+            if f.read(4) == b'\0\0\0\0':
+                end -= 4
+                continue
+
+            f.seek(end - XZ_FOOTER_SIZE)
+            footer = f.read(XZ_FOOTER_SIZE)
+            if footer[10:] != XZ_FOOTER_MAGIC:
+                return None
+            index_size = (struct.unpack('<I', footer[4:8])[0] + 1) * 4
+            index_start = end - XZ_FOOTER_SIZE - index_size
+            f.seek(index_start)
+            records = _parse_xz_index(f.read(index_size))
+
+            blocks_size = sum(_padded(unpadded) for unpadded, _ in records)
+            stream_start = index_start - blocks_size - XZ_HEADER_SIZE
+            f.seek(stream_start)
+            if f.read(len(XZ_HEADER_MAGIC)) != XZ_HEADER_MAGIC:
+                return None
+            streams.append((stream_start, records))
+            end = stream_start
+    except (OSError, IndexError, ValueError, struct.error):
+        return None
+    finally:
+        f.seek(0)
+
+    blocks = []
+    uncompressed_offset = 0
+    for stream_start, records in reversed(streams):
+        offset = stream_start + XZ_HEADER_SIZE
+        for unpadded, uncompressed in records:
+            blocks.append((stream_start, offset, unpadded, uncompressed_offset, uncompressed))
+            offset += _padded(unpadded)
+            uncompressed_offset += uncompressed
+    return blocks
+
+
+def _padded(size):
+    """ blocks are padded to a multiple of four bytes """
+    return (size + 3) & ~3
+
+
+def _decompress_block(data, size):
+    """ decompress a single xz block preceded by its stream header """
+    out = lzma.LZMADecompressor(format=lzma.FORMAT_XZ).decompress(data)
+    if len(out) != size:
+        raise lzma.LZMAError('corrupted xz block: %d bytes instead of %d' % (len(out), size))
+    return out
+
+
+class ParallelXzReader(io.RawIOBase):
+    """
+    Decompress blocks of a multi-block xz file in a pool of threads
+
+    liblzma releases the GIL, so the blocks are decompressed in parallel.  The
+    data are returned in order and at most `threads` + 1 decompressed blocks
+    are held in memory.
+    """
+
+    def __init__(self, f, blocks, threads):
+        self.f = f
+        self.blocks = iter(blocks)
+        self.window = threads + 1
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.pending = collections.deque()
+        self.headers = {}
+        self.buf = memoryview(b'')
+        self._submit()
+
+    def _submit(self):
+        while len(self.pending) < self.window:
+            block = next(self.blocks, None)
+            if block is None:
+                return
+            stream_offset, offset, size, _, uncompressed_size = block
+            if stream_offset not in self.headers:
+                self.f.seek(stream_offset)
+                self.headers[stream_offset] = self.f.read(XZ_HEADER_SIZE)
+            self.f.seek(offset)
+            data = self.headers[stream_offset] + self.f.read(_padded(size))
+            self.pending.append(self.executor.submit(_decompress_block, data, uncompressed_size))
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buf:
+            if not self.pending:
+                return 0
+            self.buf = memoryview(self.pending.popleft().result())
+            self._submit()
+        n = min(len(b), len(self.buf))
+        b[:n] = self.buf[:n]
+        self.buf = self.buf[n:]
+        return n
+
+    def close(self):
+        for future in self.pending:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+        super().close()
+
+
+class ZstdReader(io.RawIOBase):
+    """
+    Decompress zstd file `f` by the zstd utility as there is no zstd module
+    in the standard library
+    """
+
+    def __init__(self, f):
+        try:
+            fd = f.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            fd = None
+
+        self.feeder = None
+        if fd is not None:
+            # the position of the file descriptor may differ from the buffered one
+            os.lseek(fd, f.tell(), os.SEEK_SET)
+            self.proc = subprocess.Popen(['zstd', '-dcq'], stdin=f, stdout=subprocess.PIPE)
+        else:
+            # e.g. objects in remote storage
+            self.proc = subprocess.Popen(['zstd', '-dcq'], stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE)
+            self.feeder = threading.Thread(target=self._feed, args=(f,), daemon=True)
+            self.feeder.start()
+
+    def _feed(self, f):
+        try:
+            shutil.copyfileobj(f, self.proc.stdin, READ_CHUNK_SIZE)
+        except (BrokenPipeError, ValueError):
+            # closed before reading everything
+            pass
+        finally:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.proc.stdout.readinto(b)
+        if n == 0 and self.proc.wait() != 0:
+            raise OSError('zstd exited with %d' % self.proc.returncode)
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.proc.stdout.close()
+            if self.proc.poll() is None:
+                self.proc.kill()
+            self.proc.wait()
+            if self.feeder is not None:
+                self.feeder.join()
+        super().close()
+
+
+def open_decompressed(f, threads=None):
+    """
+    return file object decompressing `f` according to its magic bytes;
+    multi-block xz files are decompressed by `threads` threads (all CPUs by
+    default), single-block ones serially
+    """
+    magic = f.read(len(XZ_HEADER_MAGIC))
+    f.seek(0)
+    if magic.startswith(b'\x1f\x8b'):
+        return gzip.GzipFile(fileobj=f)
+    if magic.startswith(b'BZh'):
+        return bz2.BZ2File(f)
+    if magic.startswith(ZSTD_MAGIC):
+        return io.BufferedReader(ZstdReader(f), READ_CHUNK_SIZE)
+    if magic.startswith(LZMA_ALONE_MAGIC):
+        return lzma.LZMAFile(f, format=lzma.FORMAT_ALONE)
+    if magic != XZ_HEADER_MAGIC:
+        return f
+
+    if threads is None:
+        threads = DECOMPRESS_THREADS
+    blocks = read_xz_block_map(f) if threads > 1 else None
+    if blocks is None or len(blocks) < 2:
+        return lzma.LZMAFile(f)
+    logger.debug("Decompressing %d xz blocks by %d threads", len(blocks), threads)
+    return io.BufferedReader(ParallelXzReader(f, blocks, threads), READ_CHUNK_SIZE)
+
+
+def has_random_access(tarball):
+    """
+    return True if members of `tarball` can be read through its index without
+    decompressing much more than the member itself: the tarball is either not
+    compressed or it is an xz archive of small enough blocks
+    """
+    blocks = read_xz_block_map(tarball)
+    if blocks is not None:
+        return all(block[4] <= MAX_RANDOM_ACCESS_BLOCK_SIZE for block in blocks)
+
+    with open(tarball, 'rb') as f:
+        magic = f.read(len(XZ_HEADER_MAGIC))
+    return not magic.startswith(COMPRESSED_MAGICS)
+
+
+def iter_members(tarball, exclude_patterns=(), threads=None):
+    """
+    yield tuples (tarfile, member) of members of `tarball` which are not
+    excluded, in a single sequential pass -- the tar stream is never seeked
+    and members are yielded in the order they are stored
+    """
+    is_excluded = ExcludeMatcher(list(exclude_patterns) + ALWAYS_EXCLUDED)
+    with open(tarball, 'rb') as f, open_decompressed(f, threads) as stream, \
+            tarfile.open(fileobj=stream, mode='r|') as tf:
+        for member in tf:
+            if not is_excluded(member.name):
+                yield tf, member
+
+
+def build_index(tarball, exclude_patterns=(), output_dir=None):
+    """
+    index regular files in `tarball` which are not excluded, store the index
+    next to the tarball and return it; if `output_dir` is set, the members
+    are also extracted there within the same pass
+    """
+    st = os.stat(tarball)
+    members = {}
+    for tf, member in iter_members(tarball, exclude_patterns):
+        if member.isreg():
+            members[member.name] = [member.offset_data, member.size]
+        if output_dir is not None:
+            # tarfile rewrites existing files in place
+            unshare(os.path.join(output_dir, member.name))
+            tf.extract(member, path=output_dir, **EXTRACT_KWARGS)
+
+    index = {
+        'version': INDEX_VERSION,
+        'tarball_size': st.st_size,
+        'tarball_mtime': st.st_mtime,
+        'members': members,
+        'blocks': read_xz_block_map(tarball),
+    }
+
+    # write atomically, readers may be looking for the index at the same time
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(tarball), prefix='.index-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, index_path(tarball))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return index
+
+
+class MemberReader(io.RawIOBase):
+    """ read-only file object for a chunk iterator """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buf = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buf:
+            self.buf = next(self.chunks, b'')
+            if not self.buf:
+                return 0
+        n = min(len(b), len(self.buf))
+        b[:n] = self.buf[:n]
+        self.buf = self.buf[n:]
+        return n
+
+    def close(self):
+        self.chunks.close()
+        super().close()
+
+
+class ResultsArchive:
+    """
+    Members of a results tarball accessed through its index; if `storage` is
+    given, `tarball` is a key in the storage which is read by ranged reads
+    """
+
+    def __init__(self, tarball, storage=None):
+        self.tarball = tarball
+        self.storage = storage
+        self._index = None
+
+    def _open(self, path):
+        if self.storage is None:
+            return open(path, 'rb')
+        return self.storage.open(path)
+
+    @classmethod
+    def create(cls, tarball, exclude_patterns=(), output_dir=None):
+        """
+        index the tarball, meant to be called once it is uploaded; the tarball
+        is also unpacked to `output_dir` if it is set
+        """
+        archive = cls(tarball)
+        archive._index = build_index(tarball, exclude_patterns, output_dir)
+        return archive
+
+    def _load_index(self):
+        try:
+            with self._open(index_path(self.tarball)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self.storage is None:
+            st = os.stat(self.tarball)
+            size, mtime = st.st_size, st.st_mtime
+        else:
+            # objects are not modified once stored, their mtime is the time of upload
+            size, mtime = self.storage.stat(self.tarball)[0], index.get('tarball_mtime')
+
+        if index.get('version') != INDEX_VERSION or index['tarball_size'] != size \
+                or index['tarball_mtime'] != mtime:
+            logger.warning("Index of %s is outdated", self.tarball)
+            return None
+        return index
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = self._load_index()
+            if self._index is None:
+                logger.info("Indexing %s", self.tarball)
+                tarball = self.tarball
+                if self.storage is not None:
+                    tarball = self.storage.local_path(self.tarball)
+                self._index = build_index(tarball)
+        return self._index
+
+    @property
+    def members(self):
+        return self.index['members']
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def names(self):
+        return list(self.members)
+
+    def glob(self, pattern):
+        """ return sorted names of members matching `pattern`; '*' does not match '/' """
+        depth = pattern.count('/')
+        return sorted(name for name in self.members
+                      if name.count('/') == depth and fnmatch.fnmatchcase(name, pattern))
+
+    def getsize(self, name):
+        return self.members[name][1]
+
+    def _iter_blocks(self, f, start, end):
+        """ decompress xz blocks covering the uncompressed range [start, end) """
+        headers = {}
+        for stream_offset, offset, size, block_start, block_size in self.index['blocks']:
+            if block_start + block_size <= start:
+                continue
+            if block_start >= end:
+                return
+
+            if stream_offset not in headers:
+                f.seek(stream_offset)
+                headers[stream_offset] = f.read(XZ_HEADER_SIZE)
+            # a block preceded by its stream header makes a valid (truncated) xz stream
+            decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+            pos = block_start
+            out = decompressor.decompress(headers[stream_offset])
+            f.seek(offset)
+            remaining = _padded(size)
+            while pos < end and (remaining > 0 or not decompressor.needs_input):
+                data = b''
+                if decompressor.needs_input:
+                    data = f.read(min(READ_CHUNK_SIZE, remaining))
+                    if not data:
+                        raise EOFError('%s is truncated' % self.tarball)
+                    remaining -= len(data)
+                out = decompressor.decompress(data, READ_CHUNK_SIZE)
+                if pos + len(out) > start:
+                    yield out[max(start - pos, 0):end - pos]
+                pos += len(out)
+
+    def _iter_stream(self, f, start, end):
+        """
+        decompress the tarball sequentially, used if there is no block map;
+        see has_random_access()
+        """
+        with open_decompressed(f, threads=1) as stream:
+            pos = 0
+            if stream is f:
+                # not compressed
+                f.seek(start)
+                pos = start
+            while pos < end:
+                data = stream.read(min(READ_CHUNK_SIZE, end - pos))
+                if not data:
+                    raise EOFError('%s is truncated' % self.tarball)
+                if pos + len(data) > start:
+                    yield data[max(start - pos, 0):]
+                pos += len(data)
+
+    def iter_chunks(self, name, offset=0):
+        """ yield content of member `name` in chunks, starting at `offset` """
+        data_offset, size = self.members[name]
+        start = data_offset + min(offset, size)
+        end = data_offset + size
+        with self._open(self.tarball) as f:
+            if self.index['blocks'] is not None:
+                yield from self._iter_blocks(f, start, end)
+            else:
+                yield from self._iter_stream(f, start, end)
+
+    def open(self, name, offset=0):
+        """ return binary file object reading member `name` """
+        return io.BufferedReader(MemberReader(self.iter_chunks(name, offset)), READ_CHUNK_SIZE)
+
+    def read(self, name):
+        return b''.join(self.iter_chunks(name))
+
+    def extract(self, name, output_dir):
+        """ extract a single member to `output_dir`, return its path """
+        path = os.path.join(output_dir, name)
+        if not os.path.abspath(path).startswith(os.path.abspath(output_dir) + os.sep):
+            raise ValueError('refusing to extract %s outside of %s' % (name, output_dir))
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.extract-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in self.iter_chunks(name):
+                    f.write(chunk)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return path
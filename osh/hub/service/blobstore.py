@@ -0,0 +1,197 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Content-addressed storage of task files
+
+Base scans are re-run frequently and their logs, srpms and results get
+uploaded again and again.  Files stored in the blob store are identified by
+their sha256 digest and hardlinked into task dirs, so identical files occupy
+the disk only once.  The blob store has to live on the same filesystem as the
+task dirs.
+
+The link count of a blob serves as its reference count: removal of a task dir
+(e.g. by osh-retention) drops the links of its files and blobs which are no
+longer linked from any task dir are deleted by `BlobStore.collect_garbage()`.
+
+Stored files are shared between tasks and must never be modified in place,
+they may only be replaced (e.g. by os.replace()) or deleted.  Code rewriting
+files of a task dir in place calls `unshare()` on them first.
+"""
+
+import errno
+import fnmatch
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# smaller files are not worth hashing
+MIN_BLOB_SIZE = 4096
+
+CHUNK_SIZE = 1024 ** 2
+
+
+def file_digest(path):
+    """return sha256 hex digest of the file's content"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def unshare(path):
+    """
+    replace file at `path` by a private copy if it is linked to a blob, so
+    that it can be rewritten in place without changing files of other tasks
+    """
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISREG(st.st_mode) or st.st_nlink < 2:
+        return
+
+    dirname, basename = os.path.split(path)
+    tmp = os.path.join(dirname, '.%s.%s' % (basename, uuid.uuid4().hex))
+    try:
+        shutil.copy2(path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class BlobStore:
+    def __init__(self, root, min_size=MIN_BLOB_SIZE):
+        self.root = root
+        self.min_size = min_size
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def _link(self, src, dst):
+        """atomically replace `dst` by a hardlink to `src`"""
+        dirname, basename = os.path.split(dst)
+        tmp = os.path.join(dirname, '.%s.%s' % (basename, uuid.uuid4().hex))
+        os.link(src, tmp)
+        try:
+            os.replace(tmp, dst)
+        except OSError:
+            os.unlink(tmp)
+            raise
+
+    def store(self, path):
+        """
+        store file at `path` and replace it by a link to the blob with the
+        same content; return digest of the file or None if it was not stored
+        """
+        st = os.lstat(path)
+        if not stat.S_ISREG(st.st_mode) or st.st_size < self.min_size:
+            return None
+
+        digest = file_digest(path)
+        blob = self.blob_path(digest)
+        try:
+            blob_st = os.stat(blob)
+        except FileNotFoundError:
+            blob_st = None
+
+        try:
+            if blob_st is None:
+                # the first copy of the content becomes the blob
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                self._link(path, blob)
+            elif (blob_st.st_dev, blob_st.st_ino) != (st.st_dev, st.st_ino):
+                # the size is checked first, it is cheaper than hashing the blob
+                if blob_st.st_size != st.st_size or file_digest(blob) != digest:
+                    logger.error("Blob %s is corrupted, replacing it by %s", blob, path)
+                    self._link(path, blob)
+                else:
+                    self._link(blob, path)
+        except OSError as ex:
+            if ex.errno != errno.EXDEV:
+                raise
+            logger.warning("Can't deduplicate %s, blob store %s is on another filesystem",
+                           path, self.root)
+            return None
+
+        return digest
+
+    def store_files(self, paths):
+        """store files at `paths`, return number of bytes deduplicated"""
+        saved = 0
+        for path in paths:
+            try:
+                inode = os.lstat(path).st_ino
+                self.store(path)
+                st = os.lstat(path)
+            except OSError as ex:
+                logger.error("Can't store %s in blob store: %s", path, ex)
+                continue
+
+            if st.st_ino != inode:
+                # replaced by a link to an already existing blob
+                saved += st.st_size
+        return saved
+
+    def store_tree(self, top, exclude_patterns=()):
+        """
+        store all regular files below `top` except those with basename
+        matching `exclude_patterns`; return number of bytes deduplicated
+        """
+        return self.store_files(
+            os.path.join(dirpath, name)
+            for dirpath, _, filenames in os.walk(top)
+            for name in filenames
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in exclude_patterns))
+
+    def _iter_blobs(self):
+        try:
+            prefixes = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+
+        for prefix in prefixes:
+            prefix_dir = os.path.join(self.root, prefix)
+            for name in os.listdir(prefix_dir):
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(prefix_dir, name)
+                yield path, os.lstat(path)
+
+    def collect_garbage(self):
+        """
+        delete blobs which are not linked from any task dir; return number
+        of deleted blobs and of bytes reclaimed
+        """
+        count = size = 0
+        for path, st in self._iter_blobs():
+            if st.st_nlink > 1:
+                continue
+
+            # a task which links the blob right now keeps its own link to
+            # the content, only the deduplication of further copies is lost
+            os.unlink(path)
+            count += 1
+            size += st.st_size
+        logger.info("Deleted %d unreferenced blobs (%d bytes)", count, size)
+        return count, size
+
+    def stats(self):
+        """
+        return dictionary with number of blobs, bytes stored on disk and bytes
+        referenced by task dirs; their ratio is the deduplication ratio
+        """
+        result = {'blobs': 0, 'stored_bytes': 0, 'referenced_bytes': 0}
+        for _, st in self._iter_blobs():
+            result['blobs'] += 1
+            result['stored_bytes'] += st.st_size
+            result['referenced_bytes'] += st.st_size * (st.st_nlink - 1)
+        return result
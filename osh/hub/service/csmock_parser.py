@@ -2,18 +2,24 @@
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
 import datetime
-import fnmatch
 import glob
 import json
 import logging
 import os
-import tarfile
+import re
 import tempfile
 
+from osh.hub.service.archive import (ALWAYS_EXCLUDED, EXTRACT_KWARGS,
+                                     iter_members)
+from osh.hub.service.blobstore import unshare
+
 RESULT_FILE_JSON = 'scan-results.js'
 RESULT_FILE_ERR = 'scan-results.err'
 RESULT_FILE_HTML = 'scan-results.html'
 
+# size of chunks in which JSON results are read in the streaming mode
+JSON_READ_CHUNK_SIZE = 64 * 1024
+
 
 logger = logging.getLogger(__name__)
 
@@ -41,24 +47,17 @@ class ResultsExtractor:
         return self._json_path
 
     def extract_tarball(self, exclude_patterns=None):
+        """
+        unpack the tarball in a single sequential pass, members matching
+        `exclude_patterns` (and whole subtrees of matching dirs) are skipped
+        """
         exclude_patterns = exclude_patterns or []
-        exclude_patterns.append("*debug")
         logger.debug('Extracting %s to %s (excluding %s)',
-                     self.path, self.output_dir, exclude_patterns)
-        # filter='data' strips ownership/permissions (Python 3.12+)
-        extract_kwargs = {}
-        if hasattr(tarfile, 'data_filter'):
-            extract_kwargs['filter'] = 'data'
-        with tarfile.open(self.path) as tf:
-            for member in tf.getmembers():
-                # match each path component against exclude patterns
-                # to replicate tar's --wildcards-match-slash --exclude
-                parts = member.name.rstrip('/').split('/')
-                if any(fnmatch.fnmatch(part, p)
-                       for part in parts
-                       for p in exclude_patterns):
-                    continue
-                tf.extract(member, path=self.output_dir, **extract_kwargs)
+                     self.path, self.output_dir, exclude_patterns + ALWAYS_EXCLUDED)
+        for tf, member in iter_members(self.path, exclude_patterns):
+            # tarfile rewrites existing files in place
+            unshare(os.path.join(self.output_dir, member.name))
+            tf.extract(member, path=self.output_dir, **EXTRACT_KWARGS)
 
     def get_json_result_path(self):
         return self.json_path
@@ -76,6 +75,110 @@ class ResultsExtractor:
                 self._json_path = ''
 
 
+class JsonStream:
+    """
+    Incremental reader of JSON values from a file object
+
+    Only the unprocessed part of the file is held in memory, so that large
+    documents can be processed value by value.
+    """
+
+    _whitespace = re.compile(r'[ \t\n\r]*')
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, fp, chunk_size=JSON_READ_CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """ read next chunk of data, drop the already processed ones """
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """ skip whitespace and return the next character """
+        while True:
+            self.pos = self._whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError('unexpected end of JSON data')
+
+    def expect(self, char):
+        """ consume the next character which has to be `char` """
+        if self.peek() != char:
+            raise ValueError('expected %r at position %d of JSON data, got %r'
+                             % (char, self.pos, self.buf[self.pos]))
+        self.pos += 1
+
+    def value(self):
+        """ decode the next complete JSON value """
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # the value is not complete yet
+                if not self._fill():
+                    raise
+                continue
+
+            # a number at the end of the buffer might be truncated
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+
+            self.pos = end
+            return obj
+
+    def separator(self, closing):
+        """ consume ',' and return True or `closing` bracket and return False """
+        char = self.peek()
+        self.pos += 1
+        if char == ',':
+            return True
+        if char == closing:
+            return False
+        raise ValueError('expected "," or %r in JSON data, got %r' % (closing, char))
+
+
+def iter_json_results(fp, chunk_size=JSON_READ_CHUNK_SIZE):
+    """
+    parse csmock JSON results incrementally, yield (key, value) pairs of the
+    top-level object; items of the "defects" array are yielded one by one as
+    ('defects', defect)
+    """
+    stream = JsonStream(fp, chunk_size)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+
+    while True:
+        key = stream.value()
+        stream.expect(':')
+        if key == 'defects':
+            stream.expect('[')
+            if stream.peek() == ']':
+                stream.pos += 1
+            else:
+                while True:
+                    yield key, stream.value()
+                    if not stream.separator(']'):
+                        break
+        else:
+            yield key, stream.value()
+
+        if not stream.separator('}'):
+            break
+
+
 class CsmockAPI:
     """
     Parser for the csmock JSON results:
@@ -103,12 +206,16 @@ class CsmockAPI:
     }
     """
 
-    def __init__(self, json_results_path):
+    def __init__(self, json_results_path, streaming=False):
         """
         path -- path to results in JSON format
+        streaming -- do not load whole results to memory; get_defects()
+                     returns an iterator and scan metadata are parsed lazily
         """
         self.json_results_path = json_results_path
+        self.streaming = streaming
         self._json_result = None
+        self._scan_metadata = None
 
     @property
     def json_result(self):
@@ -117,13 +224,41 @@ class CsmockAPI:
                 self._json_result = json.load(fp)
         return self._json_result
 
+    def _iter_json_results(self):
+        # encoding="utf-8" is needed to load JSON with utf-8 chars on RHEL-8 when running in POSIX locale
+        with open(self.json_results_path, encoding="utf-8") as fp:
+            for key, value in iter_json_results(fp):
+                if key == 'scan':
+                    self._scan_metadata = value
+                yield key, value
+
+    def iter_defects(self):
+        """
+        yield defects one by one without loading whole results to memory
+        """
+        for key, value in self._iter_json_results():
+            if key == 'defects':
+                yield value
+
     def get_defects(self):
         """
         return list of defects: csmock's output is used directly
+
+        In the streaming mode, an iterator over defects is returned instead.
         """
+        if self.streaming and self._json_result is None:
+            return self.iter_defects()
         return self.json_result['defects']
 
     def get_scan_metadata(self):
+        if self.streaming and self._json_result is None:
+            if self._scan_metadata is None:
+                self._scan_metadata = {}
+                for key, _ in self._iter_json_results():
+                    # csmock writes the metadata before defects
+                    if key == 'scan':
+                        break
+            return self._scan_metadata
         return self.json_result.get('scan', {})
 
     def json(self):
@@ -0,0 +1,52 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Stable fingerprints of defects
+
+Similarly to `csdiff -z`, a defect is identified by its checker and the key
+event, while line numbers and directories in the path of the file are
+ignored.  The normalization approximates csdiff's matching rules, equal
+fingerprints match, but different ones have to be verified by csdiff.
+"""
+
+import hashlib
+import posixpath
+import re
+
+# line (and column) numbers in messages, e.g. "foo.c:12:3" or "line 12"
+LINE_NUMBER_RE = re.compile(r'(:|\bline )\d+')
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_path(path):
+    # csdiff -z ignores directory structure when matching defects
+    return posixpath.basename(path)
+
+
+def normalize_message(message):
+    message = LINE_NUMBER_RE.sub(r'\g<1>0', message)
+    return WHITESPACE_RE.sub(' ', message).strip()
+
+
+def defect_fingerprint(defect):
+    """ return hex digest identifying the defect (csmock JSON format) """
+    events = defect.get('events') or [{}]
+    try:
+        key_event = events[int(defect.get('key_event_idx', 0))]
+    except (IndexError, ValueError):
+        key_event = events[0]
+
+    parts = (
+        defect.get('checker', ''),
+        key_event.get('event', ''),
+        normalize_message(key_event.get('message', '')),
+        normalize_path(key_event.get('file_name', '')),
+    )
+    return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+
+def group_fingerprint(fingerprints):
+    """ return hex digest identifying a multiset of defect fingerprints """
+    return hashlib.sha256('\n'.join(sorted(fingerprints)).encode()).hexdigest()
@@ -25,18 +25,21 @@ def load_file_content(file_path):
     return content
 
 
-def load_defects(task_id, with_diff=True, with_results_summary=False):
+def load_defects(task_id, with_diff=True, with_results_summary=False, streaming=False):
     """
     Load defects for provided task
+
+    If streaming is True, defects are returned as iterators which read the
+    results incrementally.
     """
     task = Task.objects.get(id=task_id)
     paths = TaskResultPaths(task)
 
     result = {}
-    result['defects'] = CsmockAPI(paths.get_json_results()).get_defects()
+    result['defects'] = CsmockAPI(paths.get_json_results(), streaming).get_defects()
     if with_diff:
-        result['added'] = CsmockAPI(paths.get_json_added()).get_defects()
-        result['fixed'] = CsmockAPI(paths.get_json_fixed()).get_defects()
+        result['added'] = CsmockAPI(paths.get_json_added(), streaming).get_defects()
+        result['fixed'] = CsmockAPI(paths.get_json_fixed(), streaming).get_defects()
     if with_results_summary:
         result['results_summary'] = load_file_content(paths.get_txt_summary())
     return result
@@ -44,14 +47,13 @@ def load_defects(task_id, with_diff=True, with_results_summary=False):
 
 def get_defect_stats(defects):
     """
-    create dict with stats for provided list of defects:
+    create dict with stats for provided list (or iterable) of defects:
     {
         'defect_type': count,
     }
     """
     result = {}
-    if defects:
-        for defect in defects:
-            result.setdefault(defect['checker'], 0)
-            result[defect['checker']] += 1
+    for defect in defects or ():
+        result.setdefault(defect['checker'], 0)
+        result[defect['checker']] += 1
     return result
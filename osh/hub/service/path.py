@@ -5,17 +5,66 @@
 Functions related to retrieving paths of tasks results
 """
 
+import fnmatch
 import logging
 import os
-from glob import glob
 
-from kobo.hub.models import Task
+from django.conf import settings
 
 import osh.common.constants
+from osh.common.manifest import MANIFEST_SUFFIX, file_digest, load_manifest
+from osh.hub.scan.models import ResolvedResultPaths, ResultsManifest
+from osh.hub.service.archive import ResultsArchive
+from osh.hub.service.placement import TaskDirPlacement, relative_task_dir
+from osh.hub.service.storage import create_storage
 
 logger = logging.getLogger(__name__)
 
 
+def get_task_placement():
+    return TaskDirPlacement(settings.TASK_DIR, settings.TASK_VOLUMES,
+                            settings.TASK_VOLUME_PLACEMENT,
+                            deduplicate=bool(settings.BLOB_STORE_DIR))
+
+
+def get_task_dir(task_id, create=False):
+    """
+    return path of the task dir like kobo's Task.get_task_dir() does; when
+    created, the task dir is placed on one of TASK_VOLUMES (if configured)
+    """
+    return get_task_placement().task_dir(task_id, create)
+
+
+def get_results_storage():
+    """ return storage of task results configured by RESULTS_STORAGE """
+    return create_storage(settings.RESULTS_STORAGE, settings.TASK_DIR)
+
+
+def publish_task_dir(task_id):
+    """
+    store files of the task dir to the results storage, a no-op unless task
+    results are stored remotely
+    """
+    storage = get_results_storage()
+    if storage.is_local and storage.root == os.path.abspath(settings.TASK_DIR):
+        return
+
+    task_dir = get_task_dir(task_id)
+    prefix = relative_task_dir(task_id)
+    for dirpath, _, filenames in os.walk(task_dir):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            storage.put(os.path.join(prefix, os.path.relpath(path, task_dir)), path)
+    logger.debug("Published task dir of task %s", task_id)
+
+
+def _glob_names(names, pattern):
+    """ return sorted `names` matching `pattern`; '*' does not match '/' """
+    depth = pattern.count('/')
+    return sorted(name for name in names
+                  if name.count('/') == depth and fnmatch.fnmatchcase(name, pattern))
+
+
 class TaskResultPaths:
 
     def __init__(self, task):
@@ -24,7 +73,22 @@ class TaskResultPaths:
         """
 
         self.task = task
-        self.task_dir = Task.get_task_dir(task.id, create=True)
+        # the task dir is created on demand, looking up results of processed
+        # tasks does not touch the filesystem at all
+        self.task_dir = get_task_dir(task.id)
+        self.storage = get_results_storage()
+        self.prefix = relative_task_dir(task.id)
+        self._archive = None
+        self._manifest = None
+        self._resolved = None
+
+    def _glob(self, pattern):
+        """ return keys of files of the task matching `pattern` """
+        return self.storage.glob(os.path.join(self.prefix, pattern))
+
+    def list_files(self):
+        """ return names of files in the task dir in the results storage """
+        return [os.path.relpath(key, self.prefix) for key in self._glob('*')]
 
     def get_json_added(self):
         return os.path.join(self.task_dir, osh.common.constants.ERROR_DIFF_FILE)
@@ -44,8 +108,152 @@ class TaskResultPaths:
     def get_txt_fixed(self):
         return os.path.join(self.task_dir, osh.common.constants.FIXED_TXT_FILE)
 
+    def get_resolved(self):
+        """
+        return ResolvedResultPaths of the task, None if the paths have not
+        been resolved yet (the results are not processed or were removed)
+        """
+        if self._resolved is None:
+            # False if there is no record, so that it is not queried again
+            self._resolved = ResolvedResultPaths.objects.for_task(self.task) or False
+        return self._resolved or None
+
+    def resolve(self):
+        """
+        resolve paths to results of the processed task and store them in the
+        database, lookups of the paths do not probe the task dir afterwards
+        """
+        self._resolved = False
+        files = self.list_results_files()
+        json_results = _glob_names(files, '*/' + osh.common.constants.SCAN_RESULTS_FILENAME)
+        try:
+            tarball = self.get_tarball_key()
+        except RuntimeError:
+            tarball = ''
+
+        self._resolved = ResolvedResultPaths.objects.record(
+            self.task,
+            tarball=tarball,
+            json_results=json_results[0] if len(json_results) == 1 else '',
+            diffed=self.is_diffed(),
+            files=files,
+        )
+        return self._resolved
+
+    def list_results_files(self):
+        """
+        return names of all files of the task relative to the task dir, those
+        not unpacked from the results tarball and not cached locally included
+        """
+        resolved = self.get_resolved()
+        if resolved is not None:
+            return resolved.files
+
+        files = set(self.task.logs.list)
+        archive = self.get_archive()
+        if archive is not None:
+            files.update(archive.names())
+        if not self.storage.is_local:
+            files.update(self.list_files())
+        return sorted(files)
+
+    def is_diffed(self):
+        resolved = self.get_resolved()
+        if resolved is not None:
+            return resolved.diffed
+        return os.path.exists(self.get_json_added()) or os.path.exists(self.get_json_fixed())
+
+    def get_manifest(self):
+        """
+        return ResultsManifest of the task, None if the worker did not upload
+        any; the manifest is the authoritative list of files in the results
+        """
+        if self._manifest is None:
+            # False if there is no manifest, so that it is not queried again
+            self._manifest = ResultsManifest.objects.for_task(self.task) or False
+        return self._manifest or None
+
+    def load_manifest(self):
+        """
+        check the results tarball against the manifest uploaded by the worker
+        and store the manifest in the database; return None if there is none
+        """
+        keys = self._glob('*' + MANIFEST_SUFFIX)
+        if not keys:
+            return None
+
+        try:
+            with self.storage.open(keys[-1]) as f:
+                manifest = load_manifest(f)
+        except ValueError as ex:
+            raise RuntimeError("invalid results manifest %s: %s" % (keys[-1], ex))
+
+        key = os.path.join(self.prefix, manifest['tarball']['name'])
+        try:
+            with self.storage.open(key) as f:
+                size, sha256 = file_digest(f)
+        except FileNotFoundError:
+            raise RuntimeError("results tarball %s listed in manifest does not exist" % key)
+        if size != manifest['tarball']['size'] or sha256 != manifest['tarball']['sha256']:
+            raise RuntimeError("results tarball %s does not match its manifest" % key)
+
+        self._manifest = ResultsManifest.objects.record(self.task, manifest)
+        return self._manifest
+
+    def get_archive(self):
+        """
+        return ResultsArchive of the results tarball, or None if there is none
+        """
+        if self._archive is None:
+            try:
+                key = self.get_tarball_key()
+            except RuntimeError:
+                return None
+            if self.storage.is_local:
+                self._archive = ResultsArchive(self.storage.local_path(key))
+            else:
+                self._archive = ResultsArchive(key, self.storage)
+        return self._archive
+
+    def _extract_member(self, manifest, name):
+        """ return path to member `name` of the results, checked against the manifest """
+        path = os.path.join(self.task_dir, name)
+        if os.path.exists(path):
+            return path
+
+        archive = self.get_archive()
+        if archive is None:
+            raise RuntimeError("can't find results tarball of task %s" % self.task)
+        get_task_dir(self.task.id, create=True)
+        path = archive.extract(name, self.task_dir)
+        with open(path, 'rb') as f:
+            if file_digest(f)[1] != manifest.files[name]['sha256']:
+                os.unlink(path)
+                raise RuntimeError("%s does not match the manifest of results" % name)
+        return path
+
+    def _get_result_file(self, filename):
+        """
+        return paths to `filename` in results dir, extract it from the results
+        tarball if it has not been unpacked to the task dir
+        """
+        manifest = self.get_manifest()
+        if manifest is not None:
+            return [self._extract_member(manifest, name)
+                    for name in manifest.glob('*/' + filename)]
+
+        keys = self._glob(os.path.join('*', filename))
+        if keys:
+            return [self.storage.local_path(key) for key in keys]
+
+        archive = self.get_archive()
+        if archive is None:
+            return []
+        get_task_dir(self.task.id, create=True)
+        return [archive.extract(name, self.task_dir) for name in archive.glob('*/' + filename)]
+
     def get_json_defects_in_patches(self):
-        g = glob(os.path.join(self.task_dir, '*', osh.common.constants.DEFECTS_IN_PATCHES_FILE))
+        g = self._get_result_file(osh.common.constants.DEFECTS_IN_PATCHES_FILE)
         if len(g) == 1:
             return g[0]
         else:
@@ -53,24 +261,52 @@ class TaskResultPaths:
             raise RuntimeError('defects in patches file not found: "%s"' % g)
 
     def get_json_results(self):
-        g = glob(os.path.join(self.task_dir, '*', osh.common.constants.SCAN_RESULTS_FILENAME))
+        g = self._get_result_file(osh.common.constants.SCAN_RESULTS_FILENAME)
         if len(g) == 1:
             return g[0]
         else:
             logger.warning("json results not found: '%s', task %s", g, self.task)
             raise RuntimeError('json results not found: "%s"' % g)
 
+    def has_json_results(self):
+        resolved = self.get_resolved()
+        if resolved is not None:
+            return bool(resolved.json_results)
+        manifest = self.get_manifest()
+        if manifest is not None:
+            return len(manifest.glob('*/' + osh.common.constants.SCAN_RESULTS_FILENAME)) == 1
+        try:
+            return os.path.exists(self.get_json_results())
+        except RuntimeError:
+            return False
+
     def get_txt_summary(self):
-        g = glob(os.path.join(self.task_dir, '*', osh.common.constants.SCAN_RESULTS_SUMMARY))
+        g = self._get_result_file(osh.common.constants.SCAN_RESULTS_SUMMARY)
         if len(g) == 1:
             return g[0]
         else:
             logger.warning("result's summary not found: '%s', task %s", g, self.task)
             raise RuntimeError("result's summary not found: '%s'" % g)
 
-    def get_tarball_path(self):
-        glob_paths = glob(os.path.join(self.task_dir, '*.tar.xz'))
-        # usually we have just one .tar.xz but, if we analyze an usptream
+    def get_tarball_key(self):
+        """ return key of the results tarball in the results storage """
+        resolved = self.get_resolved()
+        if resolved is not None and resolved.tarball:
+            return resolved.tarball
+
+        manifest = self.get_manifest()
+        if manifest is not None:
+            return os.path.join(self.prefix, manifest.tarball)
+
+        # results of profiles using zstd take precedence over .tar.xz, which
+        # may also be the upstream tarball being analyzed
+        for compression in ('zstd', 'xz'):
+            suffix = osh.common.constants.RESULTS_TARBALL_SUFFIXES[compression]
+            glob_paths = self._glob('*' + suffix)
+            if glob_paths:
+                break
+
+        # usually we have just one tarball but, if we analyze an usptream
         # tarball which itself has .tar.xz suffix, we need to pick a file
         # ending -results.tar.xz, which appears second in the glob results
         if len(glob_paths) in [1, 2]:
@@ -78,3 +314,6 @@ class TaskResultPaths:
         else:
             logger.error("Can't figure out results tarball %s, for task %s", glob_paths, self.task)
             raise RuntimeError("can't find results tarball: '%s'" % glob_paths)
+
+    def get_tarball_path(self):
+        return self.storage.local_path(self.get_tarball_key())
@@ -0,0 +1,207 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Placement of task dirs on multiple volumes
+
+kobo keeps all task dirs in TASK_DIR, which makes a single filesystem the I/O
+bottleneck of a busy hub.  To spread the load, task dirs are created on one
+of the configured volumes and TASK_DIR only holds symlinks to them.  kobo and
+OSH keep accessing task dirs through their paths in TASK_DIR, so the lookup of
+a task dir costs just the resolution of a symlink.
+
+The volume of a new task dir is chosen by a placement strategy:
+
+hash
+    stable hash of the task ID and the volume path, tasks are spread evenly
+    across the volumes
+free-space
+    the volume with the most free space at the time the task dir is created
+
+Files of task dirs may be hardlinked to the blob store of their volume (see
+osh.hub.service.blobstore).  Links can't cross volumes, files shared before
+a move are therefore stored in the blob store of the target volume.
+"""
+
+import logging
+import os
+import shutil
+import uuid
+import zlib
+
+from osh.hub.service.blobstore import BlobStore
+
+logger = logging.getLogger(__name__)
+
+# blob store of a volume, relative to the volume
+VOLUME_BLOB_STORE = '.blobs'
+
+
+def relative_task_dir(task_id):
+    """return path of the task dir relative to TASK_DIR (as kobo lays it out)"""
+    task_id = int(task_id)
+    return os.path.join(str(task_id // 1000000 * 1000000),
+                        str(task_id // 10000 * 10000),
+                        str(task_id))
+
+
+class HashPlacement:
+    # task dirs stay on the volume they have been placed on
+    stable = True
+
+    def choose(self, task_id, volumes):
+        # rendezvous hashing, adding a volume only moves task dirs to it
+        return max(volumes, key=lambda volume: zlib.crc32(('%s:%s' % (task_id, volume)).encode()))
+
+
+class FreeSpacePlacement:
+    stable = False
+
+    def choose(self, task_id, volumes):
+        def free_space(volume):
+            st = os.statvfs(volume)
+            return st.f_bavail * st.f_frsize
+        return max(volumes, key=free_space)
+
+
+PLACEMENT_STRATEGIES = {
+    'hash': HashPlacement,
+    'free-space': FreeSpacePlacement,
+}
+
+
+class TaskDirPlacement:
+    def __init__(self, task_root, volumes, strategy='hash', deduplicate=False):
+        if strategy not in PLACEMENT_STRATEGIES:
+            raise ValueError("Unknown task dir placement strategy: %s" % strategy)
+
+        self.task_root = os.path.abspath(task_root)
+        self.volumes = [os.path.abspath(volume) for volume in volumes]
+        self.strategy = PLACEMENT_STRATEGIES[strategy]()
+        self.deduplicate = deduplicate
+
+    def blob_store(self, volume):
+        """return BlobStore of the volume, None if deduplication is disabled"""
+        if not self.deduplicate:
+            return None
+        return BlobStore(os.path.join(volume, VOLUME_BLOB_STORE))
+
+    def link_path(self, task_id):
+        """return path of the task dir in TASK_DIR"""
+        return os.path.join(self.task_root, relative_task_dir(task_id))
+
+    def target_volume(self, task_id):
+        """return volume the task dir belongs to according to the strategy"""
+        return self.strategy.choose(task_id, self.volumes)
+
+    def volume_of(self, task_id):
+        """
+        return volume the task dir is placed on, None if it is stored in
+        TASK_DIR itself or does not exist
+        """
+        link = self.link_path(task_id)
+        if not os.path.islink(link):
+            return None
+
+        target = os.path.realpath(link)
+        for volume in self.volumes:
+            if os.path.commonpath([volume, target]) == volume:
+                return volume
+        return None
+
+    def _link(self, task_id, path):
+        """atomically point the task dir in TASK_DIR to `path`"""
+        link = self.link_path(task_id)
+        os.makedirs(os.path.dirname(link), mode=0o755, exist_ok=True)
+        tmp = '%s.%s' % (link, uuid.uuid4().hex)
+        os.symlink(path, tmp)
+        os.replace(tmp, link)
+
+    def task_dir(self, task_id, create=False):
+        """
+        return path of the task dir in TASK_DIR; with `create`, a missing
+        task dir is created on the volume chosen by the placement strategy
+        """
+        link = self.link_path(task_id)
+        if not create or not self.volumes or os.path.lexists(link):
+            if create:
+                os.makedirs(link, mode=0o755, exist_ok=True)
+            return link
+
+        path = os.path.join(self.target_volume(task_id), relative_task_dir(task_id))
+        os.makedirs(path, mode=0o755, exist_ok=True)
+        os.makedirs(os.path.dirname(link), mode=0o755, exist_ok=True)
+        try:
+            os.symlink(path, link)
+        except FileExistsError:
+            # placed concurrently by another process
+            pass
+        return link
+
+    def move(self, task_id, volume):
+        """move existing task dir to `volume`"""
+        link = self.link_path(task_id)
+        source = os.path.realpath(link)
+        path = os.path.join(volume, relative_task_dir(task_id))
+        if source == path:
+            return
+
+        # files linked to a blob store, the copies are not
+        shared = [os.path.relpath(os.path.join(dirpath, name), source)
+                  for dirpath, _, filenames in os.walk(source)
+                  for name in filenames
+                  if os.lstat(os.path.join(dirpath, name)).st_nlink > 1]
+
+        # copy to a temporary location first so that an interrupted move
+        # does not leave incomplete task dir behind
+        tmp = '%s.%s' % (path, uuid.uuid4().hex)
+        shutil.copytree(source, tmp, symlinks=True)
+        stale = None
+        if os.path.lexists(path):
+            # copy left behind by an interrupted move, the task dir in
+            # TASK_DIR still points to the source
+            stale = '%s.%s' % (path, uuid.uuid4().hex)
+            os.rename(path, stale)
+        os.replace(tmp, path)
+        if stale is not None:
+            shutil.rmtree(stale)
+
+        if os.path.islink(link):
+            self._link(task_id, path)
+        else:
+            # task dir stored in TASK_DIR itself
+            old = '%s.%s' % (link, uuid.uuid4().hex)
+            os.rename(link, old)
+            os.symlink(path, link)
+            source = old
+        shutil.rmtree(source)
+        logger.info("Moved task dir %s from %s to %s", link, source, path)
+
+        store = self.blob_store(volume)
+        if store is not None and shared:
+            store.store_files(os.path.join(path, name) for name in shared)
+
+    def rebalance(self, task_ids, dry_run=False):
+        """
+        move task dirs stored in TASK_DIR itself to the volumes, as well as
+        those not placed according to a stable placement strategy; return
+        list of (task_id, volume) of the moved task dirs
+        """
+        moved = []
+        for task_id in task_ids:
+            link = self.link_path(task_id)
+            if not os.path.lexists(link):
+                continue
+
+            current = self.volume_of(task_id)
+            if current is not None and not self.strategy.stable:
+                continue
+
+            volume = self.target_volume(task_id)
+            if volume == current:
+                continue
+
+            if not dry_run:
+                self.move(task_id, volume)
+            moved.append((task_id, volume))
+        return moved
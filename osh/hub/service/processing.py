@@ -8,65 +8,186 @@ Util functions related to processing data -- results of analysis
 import json
 import logging
 import os
-import shlex
+import posixpath
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import pycsdiff
 from kobo.shortcuts import run
 
-from osh.common.constants import CSDIFF_ARGS
+from osh.hub.service.blobstore import unshare
 from osh.hub.service.path import TaskResultPaths
 
 logger = logging.getLogger(__name__)
 
+TITLE_ADDED = 'Newly introduced findings'
+TITLE_FIXED = 'Fixed findings'
 
-def _run(command, workdir):
-    """ kobo.shortcuts.run wrapper with predefined setup and logging """
-    retcode, output = run(command,
-                          workdir=workdir,
-                          stdout=False,
-                          can_fail=True,
-                          return_stdout=False,
-                          show_cmd=False)
+# maximum number of reports rendered concurrently
+RENDER_WORKERS = 4
+
+
+def _run(command, workdir, input_data=None):
+    """
+    kobo.shortcuts.run wrapper with predefined setup and logging
+
+    if input_data is set, it is passed to the command on stdin
+    """
+    if input_data is None:
+        retcode, output = run(command,
+                              workdir=workdir,
+                              stdout=False,
+                              can_fail=True,
+                              return_stdout=False,
+                              show_cmd=False)
+    else:
+        retcode = subprocess.run(command, shell=True, cwd=workdir,
+                                 input=input_data.encode('utf-8')).returncode
     if retcode != 0:
         logger.critical("'%s' wasn't successfull; path: %s, code: %s",
                         command, workdir, retcode)
     return retcode == 0
 
 
-def csdiff(old, new, result, workdir):
+def read_json_results(path):
+    """ return content of JSON results as a string """
+    # encoding="utf-8" is needed to load JSON with utf-8 chars on RHEL-8 when running in POSIX locale
+    with open(path, encoding="utf-8") as fd:
+        return fd.read()
+
+
+def _defect_key(defect):
+    events = defect.get('events') or [{}]
+    try:
+        key_event = events[int(defect.get('key_event_idx', 0))]
+    except (IndexError, ValueError):
+        key_event = events[0]
+    return (defect.get('checker'), key_event.get('event'),
+            key_event.get('file_name'), key_event.get('line'), len(events))
+
+
+def _strip_dirs(results):
+    """
+    strip directories from file names of all events in parsed `results`,
+    which is how `csdiff -z` (--ignore-path) matches defects; return tuple
+    (JSON string of the stripped results, keys of the stripped defects)
+    """
+    defects = [
+        dict(defect, events=[
+            dict(event, file_name=posixpath.basename(event['file_name']))
+            if 'file_name' in event else event
+            for event in defect.get('events', [])])
+        for defect in results.get('defects', [])
+    ]
+    return json.dumps(dict(results, defects=defects)), [_defect_key(d) for d in defects]
+
+
+def _restore_paths(diff, keys, originals):
+    """
+    replace stripped defects of parsed `diff` by the `originals` they come
+    from, csdiff prints them in their original order; `keys` are keys of
+    the stripped originals; return False if they can't be mapped
+    """
+    candidates = zip(keys, originals)
+    defects = []
+    for defect in diff.get('defects', []):
+        key = _defect_key(defect)
+        for candidate_key, original in candidates:
+            if candidate_key == key:
+                defects.append(original)
+                break
+        else:
+            return False
+
+    diff['defects'] = defects
+    return True
+
+
+def diff_scans(old, new):
     """
-    use csdiff with constants.CSDIFF_ARGS arguments
-    compare `old` and `new` files and store the diff in `result`
-    all three files have '.err' type
+    compare `old` and `new` results (JSON strings) using csdiff's python
+    binding while ignoring directories in paths (like `csdiff -z`), return
+    tuple (added, fixed) of parsed JSON results
+
+    The binding has no -z option.  The results are diffed with directories
+    stripped instead and the diffed defects are mapped back to the original
+    ones.  Each side is parsed and stripped once for both directions.
     """
-    # whole csdiff call must be in one string, because character '>' cannot be
-    # enclosed into quotes -- command '"csdiff" "-j" "old.err" "new.err" ">"
-    # "csdiff.out"' does not work
-    diff_cmd = ' '.join(['csdiff', CSDIFF_ARGS, shlex.quote(old),
-                         shlex.quote(new), '>', result])
-    return _run(diff_cmd, workdir)
+    old_results = json.loads(old)
+    new_results = json.loads(new)
+    old_stripped, old_keys = _strip_dirs(old_results)
+    new_stripped, new_keys = _strip_dirs(new_results)
 
+    added = json.loads(pycsdiff.diff_scans(old_stripped, new_stripped))
+    fixed = json.loads(pycsdiff.diff_scans(new_stripped, old_stripped))
+    if _restore_paths(added, new_keys, new_results.get('defects', [])) \
+            and _restore_paths(fixed, old_keys, old_results.get('defects', [])):
+        return added, fixed
 
-def csdiff_new_defects(old, new, result, task_dir):
-    """ create file with newly introduced findings"""
-    return csdiff(old, new, result, task_dir)
+    # never store stripped paths
+    logger.warning("Unable to map diffed defects back to the original ones, "
+                   "diffing without ignoring directories")
+    return json.loads(pycsdiff.diff_scans(old, new)), json.loads(pycsdiff.diff_scans(new, old))
 
 
-def csdiff_fixed_defects(old, new, result, task_dir):
-    """ create file with fixed findings"""
-    return csdiff(new, old, result, task_dir)
+def write_json_results(results, path, title):
+    """ set title of the parsed JSON `results`, store them to `path` and return them as a string """
+    results.setdefault('scan', {})['title'] = title
+    data = json.dumps(results, indent=4)
+    unshare(path)
+    with open(path, "w", encoding="utf-8") as fd:
+        fd.write(data)
+    return data
 
 
-def cshtml(input_file, output_file, workdir):
-    """ generate HTML report """
+def cshtml(input_file, output_file, workdir, input_data=None):
+    """ generate HTML report; read input_data from stdin if set """
+    if input_data is not None:
+        input_file = '-'
     cmd = 'csgrep --prune-events 1 --mode json %s | cshtml - > %s' % \
         (input_file, output_file)
-    return _run(cmd, workdir)
+    unshare(os.path.join(workdir, output_file))
+    return _run(cmd, workdir, input_data)
 
 
-def csgrep_err(input_file, output_file, workdir):
-    """ generate ERR text files """
+def csgrep_err(input_file, output_file, workdir, input_data=None):
+    """ generate ERR text files; read input_data from stdin if set """
+    if input_data is not None:
+        input_file = '-'
     cmd = 'csgrep --prune-events 1 %s > %s' % (input_file, output_file)
-    return _run(cmd, workdir)
+    unshare(os.path.join(workdir, output_file))
+    return _run(cmd, workdir, input_data)
+
+
+def _timed(name, func, args):
+    """ run func(*args), log its duration and never raise """
+    start = time.monotonic()
+    try:
+        succ = func(*args) is not False
+    except Exception as ex:  # noqa: B902
+        logger.error("Rendering of %s failed: %s", name, ex)
+        succ = False
+    logger.debug("Rendering of %s took %.2f s (%s)", name,
+                 time.monotonic() - start, 'ok' if succ else 'failed')
+    return succ
+
+
+def render_reports(jobs, max_workers=RENDER_WORKERS):
+    """
+    run independent rendering jobs concurrently in a bounded pool of threads
+
+    jobs -- list of tuples (name, callable, args); a job fails if its callable
+            raises or returns False, which does not affect the other jobs
+
+    return dict {name: success}
+    """
+    if not jobs:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+        futures = {name: executor.submit(_timed, name, func, args)
+                   for name, func, args in jobs}
+    return {name: future.result() for name, future in futures.items()}
 
 
 class TaskDiffer:
@@ -79,35 +200,32 @@ class TaskDiffer:
     def generate_diff_files(self):
         """
         create diffs, html reports and .err files
+
+        Results of both tasks are read only once, added and fixed findings
+        are computed in-process and stored with the title already set.
+        The reports are rendered from the in-memory results.
         """
-        succ = csdiff_new_defects(
-            self.base_paths.get_json_results(),
-            self.paths.get_json_results(),
-            self.paths.get_json_added(),
-            self.paths.task_dir
-        )
-        if succ:
-            f_succ = csdiff_new_defects(
-                self.paths.get_json_results(),
-                self.base_paths.get_json_results(),
-                self.paths.get_json_fixed(),
-                self.paths.task_dir
-            )
-
-            if f_succ:
-                # these are basicly optional, don't fail if one of them
-                # was not successfull
-                add_title_to_json(self.paths.get_json_added(), 'Newly introduced findings')
-                add_title_to_json(self.paths.get_json_fixed(), 'Fixed findings')
-
-                cshtml(self.paths.get_json_added(), self.paths.get_html_added(), self.paths.task_dir)
-                cshtml(self.paths.get_json_fixed(), self.paths.get_html_fixed(), self.paths.task_dir)
-                csgrep_err(self.paths.get_json_added(), self.paths.get_txt_added(), self.paths.task_dir)
-                csgrep_err(self.paths.get_json_fixed(), self.paths.get_txt_fixed(), self.paths.task_dir)
-            else:
-                return False
-        else:
+        try:
+            base = read_json_results(self.base_paths.get_json_results())
+            target = read_json_results(self.paths.get_json_results())
+            added, fixed = diff_scans(base, target)
+        except (OSError, RuntimeError, ValueError) as ex:
+            logger.critical("Unable to diff results of tasks %s and %s: %s",
+                            self.base_task, self.task, ex)
             return False
+
+        added_data = write_json_results(added, self.paths.get_json_added(), TITLE_ADDED)
+        fixed_data = write_json_results(fixed, self.paths.get_json_fixed(), TITLE_FIXED)
+
+        # these are basicly optional, don't fail if one of them
+        # was not successfull
+        task_dir = self.paths.task_dir
+        render_reports([
+            (self.paths.get_html_added(), cshtml, (None, self.paths.get_html_added(), task_dir, added_data)),
+            (self.paths.get_html_fixed(), cshtml, (None, self.paths.get_html_fixed(), task_dir, fixed_data)),
+            (self.paths.get_txt_added(), csgrep_err, (None, self.paths.get_txt_added(), task_dir, added_data)),
+            (self.paths.get_txt_fixed(), csgrep_err, (None, self.paths.get_txt_fixed(), task_dir, fixed_data)),
+        ])
         return True
 
     def diff_results(self):
@@ -125,6 +243,7 @@ class TaskDiffer:
 
 def add_title_to_json(path, title):
     # encoding="utf-8" is needed to load JSON with utf-8 chars on RHEL-8 when running in POSIX locale
+    unshare(path)
     with open(path, "r+", encoding="utf-8") as fd:
         loaded_json = json.load(fd)
         loaded_json['scan']['title'] = title
@@ -134,13 +253,8 @@ def add_title_to_json(path, title):
 
 
 def task_has_results(task):
-    trp = TaskResultPaths(task)
-    try:
-        return os.path.exists(trp.get_json_results())
-    except RuntimeError:
-        return False
+    return TaskResultPaths(task).has_json_results()
 
 
 def task_is_diffed(task):
-    trp = TaskResultPaths(task)
-    return os.path.exists(trp.get_json_added()) or os.path.exists(trp.get_json_fixed())
+    return TaskResultPaths(task).is_diffed()
@@ -0,0 +1,266 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Storage backends for task results
+
+Files of tasks are addressed by keys relative to TASK_DIR, e.g.
+'1000000/1230000/1234567/scan-results.js'.  LocalStorage keeps them in a
+local directory (TASK_DIR itself by default).  S3Storage keeps them in an S3
+compatible object storage shared by several hub nodes; files are still
+uploaded to and processed in the local TASK_DIR, published to the bucket once
+processed and cached locally when a local path is needed.
+
+Reads are streamed: `open()` returns a seekable binary file object which only
+fetches the ranges of the file which are actually read.
+"""
+
+import fnmatch
+import glob
+import io
+import logging
+import os
+import shutil
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# size of ranged reads from object storage
+RANGE_SIZE = 1024 ** 2
+
+
+def _glob_prefix(pattern):
+    """return the part of the pattern preceding its first wildcard"""
+    for i, char in enumerate(pattern):
+        if char in '*?[':
+            return pattern[:i]
+    return pattern
+
+
+def _glob_match(key, pattern):
+    """'*' does not match '/', as in glob.glob()"""
+    return key.count('/') == pattern.count('/') and fnmatch.fnmatchcase(key, pattern)
+
+
+class LocalStorage:
+    """ results stored in a local directory """
+
+    is_local = True
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError('%s is outside of %s' % (key, self.root))
+        return path
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def stat(self, key):
+        """ return tuple (size, mtime) of the file """
+        st = os.stat(self.path(key))
+        return st.st_size, st.st_mtime
+
+    def glob(self, pattern):
+        """ return sorted keys of files matching `pattern` """
+        return sorted(os.path.relpath(path, self.root)
+                      for path in glob.glob(os.path.join(self.root, pattern))
+                      if os.path.isfile(path))
+
+    def open(self, key, offset=0):
+        f = open(self.path(key), 'rb')
+        f.seek(offset)
+        return f
+
+    def read(self, key):
+        with self.open(key) as f:
+            return f.read()
+
+    def put(self, key, path):
+        """ store local file at `path` under `key` """
+        dst = self.path(key)
+        if os.path.exists(dst) and os.path.samefile(path, dst):
+            return
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copyfile(path, dst)
+
+    def delete(self, key):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix):
+        """ delete all files with keys in directory `prefix` """
+        shutil.rmtree(self.path(prefix), ignore_errors=True)
+
+    def local_path(self, key):
+        """ return path to a local copy of the file """
+        return self.path(key)
+
+
+class S3RangeReader(io.RawIOBase):
+    """ seekable file object reading an S3 object by ranged GET requests """
+
+    def __init__(self, client, bucket, key, size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def _get(self, length):
+        end = min(self.pos + length, self.size) - 1
+        response = self.client.get_object(Bucket=self.bucket, Key=self.key,
+                                          Range='bytes=%d-%d' % (self.pos, end))
+        data = response['Body'].read()
+        self.pos += len(data)
+        return data
+
+    def readinto(self, b):
+        if self.pos >= self.size:
+            return 0
+        data = self._get(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def readall(self):
+        if self.pos >= self.size:
+            return b''
+        return self._get(self.size - self.pos)
+
+
+class S3Storage:
+    """ results stored in an S3 compatible object storage """
+
+    is_local = False
+
+    def __init__(self, bucket, prefix='', cache_dir=None, endpoint_url=None, **client_kwargs):
+        # optional dependency, only needed if the S3 backend is configured
+        import boto3
+
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, **client_kwargs)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache = LocalStorage(cache_dir or tempfile.gettempdir())
+
+    def _object_key(self, key):
+        return self.prefix + key
+
+    def exists(self, key):
+        try:
+            self.stat(key)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def stat(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except self.client.exceptions.ClientError as ex:
+            if ex.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                raise FileNotFoundError(key) from ex
+            raise
+        return response['ContentLength'], response['LastModified'].timestamp()
+
+    def glob(self, pattern):
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(Bucket=self.bucket,
+                                   Prefix=self._object_key(_glob_prefix(pattern)))
+        for page in pages:
+            for obj in page.get('Contents', []):
+                key = obj['Key'][len(self.prefix):]
+                if _glob_match(key, pattern):
+                    keys.append(key)
+        return sorted(keys)
+
+    def open(self, key, offset=0):
+        size = self.stat(key)[0]
+        reader = S3RangeReader(self.client, self.bucket, self._object_key(key), size)
+        reader.seek(offset)
+        return io.BufferedReader(reader, RANGE_SIZE)
+
+    def read(self, key):
+        response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        return response['Body'].read()
+
+    def put(self, key, path):
+        self.client.upload_file(path, self.bucket, self._object_key(key))
+        # the local copy can serve as a cache
+        self.cache.put(key, path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        self.cache.delete(key)
+
+    def delete_prefix(self, prefix):
+        """ delete all objects with keys in directory `prefix` """
+        prefix = prefix.rstrip('/') + '/'
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._object_key(prefix)):
+            objects = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if objects:
+                self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects})
+        self.cache.delete_prefix(prefix)
+
+    def local_path(self, key):
+        """ download the file to the local cache unless it is there """
+        path = self.cache.path(key)
+        if os.path.exists(path):
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.download-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                self.client.download_fileobj(self.bucket, self._object_key(key), f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return path
+
+
+STORAGE_BACKENDS = {
+    'local': LocalStorage,
+    's3': S3Storage,
+}
+
+
+def create_storage(config, task_dir):
+    """
+    return storage configured by `config`, a dictionary with the 'BACKEND'
+    name and keyword arguments of the backend in lower case
+    """
+    config = {key.lower(): value for key, value in config.items()}
+    backend = config.pop('backend', 'local')
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError("Unknown results storage backend: %s" % backend)
+
+    if backend == 'local':
+        config.setdefault('root', task_dir)
+    else:
+        # files are cached in TASK_DIR, where they are uploaded to by workers
+        config.setdefault('cache_dir', task_dir)
+    return STORAGE_BACKENDS[backend](**config)
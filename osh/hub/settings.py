@@ -203,6 +203,49 @@ ENABLE_SINGLE_USE_WORKERS = False
 # Enabling this option requires `fedora-messaging` package
 ENABLE_FEDORA_MESSAGING = False
 
+# Process results uploaded by workers asynchronously by osh-results-processor
+# instead of blocking the finish_task/finish_scan XML-RPC calls
+ENABLE_ASYNC_RESULTS_PROCESSING = False
+# Number of threads processing the results in osh-results-processor
+RESULTS_PROCESSORS = 4
+# Failed processing is retried after RESULTS_PROCESSING_RETRY_DELAY seconds
+# multiplied by the number of attempts so far
+RESULTS_PROCESSING_MAX_ATTEMPTS = 3
+RESULTS_PROCESSING_RETRY_DELAY = 60
+# Running entries whose processor has not renewed its lease for
+# RESULTS_PROCESSING_LEASE seconds (e.g. it got killed) are queued again
+RESULTS_PROCESSING_LEASE = 300
+
+# Unpack whole results tarballs into task dirs.  Otherwise, results tarballs
+# are only indexed and their members are read from them on demand.  Tarballs
+# compressed without an xz block map (e.g. by zstd) are always unpacked.
+RESULTS_FULL_UNPACK = False
+
+# Volumes (directories on separate filesystems) to spread task dirs across,
+# TASK_DIR then only holds symlinks to the task dirs.  New task dirs are placed
+# by a stable hash of the task ID ('hash') or on the volume with the most free
+# space ('free-space').  Existing task dirs are moved by the
+# rebalance_task_dirs management command.
+TASK_VOLUMES = []
+TASK_VOLUME_PLACEMENT = 'hash'
+
+# Storage of task results.  'local' keeps them in TASK_DIR, 's3' publishes
+# them to an S3 compatible object storage shared by multiple hub nodes once
+# they are processed (requires boto3), e.g.:
+# RESULTS_STORAGE = {
+#     'BACKEND': 's3',
+#     'BUCKET': 'osh-results',
+#     'PREFIX': 'tasks/',
+#     'ENDPOINT_URL': 'https://s3.example.com',
+# }
+RESULTS_STORAGE = {'BACKEND': 'local'}
+
+# Content-addressed store which identical files of tasks are hardlinked from,
+# it has to be on the same filesystem as TASK_DIR.  Task dirs placed on
+# TASK_VOLUMES use a store in the .blobs directory of their volume instead.
+# None disables deduplication.
+BLOB_STORE_DIR = None
+
 SEND_BUS_MESSAGE_UMB = True
 SEND_BUS_MESSAGE_KAFKA = False
 KAFKA_API_VERSION = (2, 8, 0)
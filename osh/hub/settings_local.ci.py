@@ -94,6 +94,9 @@ FILES_PATH = '/var/lib/osh/hub'
 # Files for kobo tasks with predefined structure
 TASK_DIR = os.path.join(FILES_PATH, 'tasks')
 
+# Content-addressed store of deduplicated task files
+BLOB_STORE_DIR = os.path.join(TASK_DIR, '.blobs')
+
 # Root directory for uploaded files
 UPLOAD_DIR = os.path.join(FILES_PATH, 'upload')
 
@@ -20,9 +20,9 @@ from osh.hub.scan.models import Scan, ScanBinding, SystemRelease
 from osh.hub.scan.service import (diff_fixed_defects_between_releases,
                                   diff_fixed_defects_in_package,
                                   diff_new_defects_between_releases,
-                                  diff_new_defects_in_package)
+                                  diff_new_defects_in_package, get_blob_stores)
 from osh.hub.stats.utils import stat_function
-from osh.hub.waiving.models import Defect, Result, ResultGroup, Waiver
+from osh.hub.waiving.models import Result, ResultGroup, Waiver
 
 #######
 # SCANS
@@ -108,87 +108,92 @@ def get_lines_by_release():
 #########
 
 
+def count_defects(bindings, counter):
+    """ return sum of the defect counter of results of the scan bindings """
+    return bindings.aggregate(sum=Sum('result__' + counter))['sum'] or 0
+
+
 @stat_function(1, "DEFECTS", "Fixed defects",
                "Number of defects that were marked as 'fixed'.")
 def get_total_fixed_defects():
-    return Defect.objects.enabled().fixed().count()
+    return count_defects(ScanBinding.objects.enabled(), 'fixed_defects_counter')
 
 
 @stat_function(1, "DEFECTS", "Fixed defects",
                "Number of fixed defects found by release.")
 def get_fixed_defects_by_release():
     releases = SystemRelease.objects.filter(active=True)
-    return {r: Defect.objects.enabled().by_release(r).fixed().count()
+    return {r: count_defects(ScanBinding.objects.enabled().by_release(r), 'fixed_defects_counter')
             for r in releases}
 
 
 @stat_function(2, "DEFECTS", "Fixed defects in rebases",
                "Number of defects that were marked as 'fixed' in rebases.")
 def get_total_fixed_defects_in_rebases():
-    return Defect.objects.enabled().rebases().fixed().count()
+    return count_defects(ScanBinding.objects.enabled().rebases(), 'fixed_defects_counter')
 
 
 @stat_function(2, "DEFECTS", "Fixed defects in rebases",
                "Number of fixed defects found in rebases by release.")
 def get_fixed_defects_in_rebases_by_release():
     releases = SystemRelease.objects.filter(active=True)
-    return {r: Defect.objects.enabled().rebases().by_release(r).fixed().count()
+    return {r: count_defects(ScanBinding.objects.enabled().rebases().by_release(r), 'fixed_defects_counter')
             for r in releases}
 
 
 @stat_function(3, "DEFECTS", "Fixed defects in updates",
                "Number of defects that were marked as 'fixed' in updates.")
 def get_total_fixed_defects_in_updates():
-    return Defect.objects.enabled().updates().fixed().count()
+    return count_defects(ScanBinding.objects.enabled().updates(), 'fixed_defects_counter')
 
 
 @stat_function(3, "DEFECTS", "Fixed defects in updates",
                "Number of fixed defects found in updates by release.")
 def get_fixed_defects_in_updates_by_release():
     releases = SystemRelease.objects.filter(active=True)
-    return {r: Defect.objects.enabled().updates().by_release(r).fixed().count()
+    return {r: count_defects(ScanBinding.objects.enabled().updates().by_release(r), 'fixed_defects_counter')
             for r in releases}
 
 
 @stat_function(4, "DEFECTS", "New defects",
                "Number of newly introduced defects.")
 def get_total_new_defects():
-    return Defect.objects.enabled().new().count()
+    return count_defects(ScanBinding.objects.enabled(), 'new_defects_counter')
 
 
 @stat_function(4, "DEFECTS", "New defects",
                "Number of newly introduced defects by release.")
 def get_new_defects_by_release():
     releases = SystemRelease.objects.filter(active=True)
-    return {r: Defect.objects.enabled().by_release(r).new().count()
+    return {r: count_defects(ScanBinding.objects.enabled().by_release(r), 'new_defects_counter')
             for r in releases}
 
 
 @stat_function(5, "DEFECTS", "New defects in rebases",
                "Number of newly introduced defects in rebases.")
 def get_total_new_defects_in_rebases():
-    return Defect.objects.enabled().rebases().new().count()
+    return count_defects(ScanBinding.objects.enabled().rebases(), 'new_defects_counter')
 
 
 @stat_function(5, "DEFECTS", "New defects in rebases",
                "Number of newly introduced defects in rebases by release.")
 def get_new_defects_in_rebases_by_release():
     releases = SystemRelease.objects.filter(active=True)
-    return {r: Defect.objects.enabled().rebases().by_release(r).new().count()
+    return {r: count_defects(ScanBinding.objects.enabled().rebases().by_release(r), 'new_defects_counter')
             for r in releases}
 
 
 @stat_function(6, "DEFECTS", "New defects in updates",
                "Number of newly introduced defects in updates.")
 def get_total_new_defects_in_updates():
-    return Defect.objects.enabled().updates().new().count()
+    return count_defects(ScanBinding.objects.enabled().updates(), 'new_defects_counter')
 
 
 @stat_function(6, "DEFECTS", "New defects in updates",
                "Number of newly introduced defects in updates by release.")
 def get_new_defects_in_updates_by_release():
     releases = SystemRelease.objects.filter(active=True)
-    return {r: Defect.objects.enabled().updates().by_release(r).new().count()
+    return {r: count_defects(ScanBinding.objects.enabled().updates().by_release(r), 'new_defects_counter')
             for r in releases}
 
 
@@ -497,3 +502,32 @@ def get_minutes_spent_scanning():
     # e.g. Sum over an empty QuerySet or only a field with Null values
     sum = results.aggregate(sum=Sum('scanning_time'))['sum'] or 0
     return sum // 60
+
+
+#########
+# STORAGE
+#########
+
+
+def _blob_store_stats():
+    result = {'blobs': 0, 'stored_bytes': 0, 'referenced_bytes': 0}
+    for store in get_blob_stores():
+        for key, value in store.stats().items():
+            result[key] += value
+    return result
+
+
+@stat_function(1, "STORAGE", "Deduplicated bytes",
+               "Number of bytes saved by sharing identical files of tasks.")
+def get_deduplicated_bytes():
+    stats = _blob_store_stats()
+    return stats['referenced_bytes'] - stats['stored_bytes']
+
+
+@stat_function(2, "STORAGE", "Deduplication ratio",
+               "Size of deduplicated files of tasks relative to the size of their stored copies (in percent).")
+def get_deduplication_ratio():
+    stats = _blob_store_stats()
+    if not stats['stored_bytes']:
+        return 0
+    return stats['referenced_bytes'] * 100 // stats['stored_bytes']
@@ -5,6 +5,8 @@ from django.contrib import admin
 from django.urls import include, path
 from django.views.generic.base import TemplateView
 
+from osh.hub.scan.views import task_log
+
 admin.autodiscover()
 
 
@@ -16,6 +18,8 @@ urlpatterns = [
     # path('admin/doc/', include('django.contrib.admindocs.urls')),
 
     path("auth/", include("kobo.hub.urls.auth")),
+    # serves also files which are only stored in results tarballs
+    path("task/<int:id>/log/<path:log_name>", task_log, name="task/log"),
     path("task/", include("kobo.hub.urls.task")),
     path("info/arch/", include("kobo.hub.urls.arch")),
     path("info/channel/", include("kobo.hub.urls.channel")),
@@ -0,0 +1,27 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+from django.core.management.base import BaseCommand, CommandError
+
+from osh.hub.waiving.models import Result
+
+
+class Command(BaseCommand):
+    help = "Check that counters of defects of results and result groups match the stored defects"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='recompute the counters which do not match')
+
+    def handle(self, *args, **options):
+        results = Result.objects.with_wrong_defect_counters().order_by('id')
+        count = 0
+        for result in results.iterator():
+            count += 1
+            self.stdout.write("Result %s has wrong counters of defects" % result)
+            if options['fix']:
+                result.count_defects()
+
+        if count and not options['fix']:
+            raise CommandError("%d results have wrong counters of defects, rerun with --fix" % count)
+        self.stdout.write("Fixed %d results" % count if count else "All counters of defects are correct")
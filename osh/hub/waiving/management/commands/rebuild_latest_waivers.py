@@ -0,0 +1,21 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+from django.core.management.base import BaseCommand
+
+from osh.hub.waiving.models import LatestWaiver
+
+
+class Command(BaseCommand):
+    help = "Rebuild the table of latest waivers from the history of waivers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--if-empty', action='store_true',
+                            help='do nothing if the table is already populated')
+
+    def handle(self, *args, **options):
+        if options['if_empty'] and LatestWaiver.objects.exists():
+            return
+
+        count = LatestWaiver.objects.rebuild()
+        self.stdout.write("Stored latest waivers of %d checker groups" % count)
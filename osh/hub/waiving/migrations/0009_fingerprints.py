@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waiving', '0008_remove_resultgroup_defects_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='defect',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash identifying the defect across scans', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='resultgroup',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash of fingerprints of all defects in the group', max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scan', '0021_resultscheckpoint'),
+        ('waiving', '0009_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestWaiver',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_valid', models.BooleanField(default=True, help_text='There is no newer run which needs inspection')),
+                ('checker_group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waiving.checkergroup')),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scan.package')),
+                ('release', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scan.systemrelease')),
+                ('waiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waiving.waiver')),
+            ],
+            options={
+                'unique_together': {('package', 'release', 'checker_group')},
+            },
+        ),
+    ]
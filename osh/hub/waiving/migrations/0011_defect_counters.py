@@ -0,0 +1,49 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+from osh.hub.waiving.models import DEFECT_COUNTERS, SubqueryCount
+
+
+def count_defects(apps, schema_editor):
+    Defect = apps.get_model('waiving', 'Defect')
+    Result = apps.get_model('waiving', 'Result')
+    ResultGroup = apps.get_model('waiving', 'ResultGroup')
+
+    ResultGroup.objects.update(defects_counter=SubqueryCount(
+        Defect.objects.filter(result_group=models.OuterRef('pk')).values('id')))
+    for defect_type, field in DEFECT_COUNTERS.items():
+        Result.objects.update(**{field: SubqueryCount(Defect.objects.filter(
+            result_group__result=models.OuterRef('pk'),
+            result_group__defect_type=defect_type).values('id'))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waiving', '0010_latestwaiver'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='result',
+            name='fixed_defects_counter',
+            field=models.PositiveIntegerField(default=0, help_text='Number of defects in result groups with fixed defects'),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='new_defects_counter',
+            field=models.PositiveIntegerField(default=0, help_text='Number of defects in result groups with new defects'),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='previously_waived_defects_counter',
+            field=models.PositiveIntegerField(default=0, help_text='Number of defects in previously waived result groups'),
+        ),
+        migrations.AddField(
+            model_name='resultgroup',
+            name='defects_counter',
+            field=models.PositiveIntegerField(default=0, help_text='Number of defects associated with this group'),
+        ),
+        migrations.RunPython(count_defects, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import collections
 import datetime
 import logging
 
@@ -8,8 +9,8 @@ from django.conf import settings
 from django.db import models, transaction
 from kobo.types import Enum, EnumItem
 
-from osh.hub.scan.models import (SCAN_TYPES, AnalyzerVersion, Package,
-                                 SystemRelease)
+from osh.hub.scan.models import (SCAN_TYPES, AnalyzerVersion, Package, Scan,
+                                 ScanTree, SystemRelease)
 
 logger = logging.getLogger(__name__)
 
@@ -77,6 +78,56 @@ RESULT_GROUP_PROCESSED = (
     RESULT_GROUP_STATES['CONTAINS_BUG'],
 )
 
+# counters of defects of Result by the defect type of their result groups
+DEFECT_COUNTERS = {
+    DEFECT_STATES['NEW']: 'new_defects_counter',
+    DEFECT_STATES['FIXED']: 'fixed_defects_counter',
+    DEFECT_STATES['PREVIOUSLY_WAIVED']: 'previously_waived_defects_counter',
+}
+
+
+class SubqueryCount(models.Subquery):
+    """
+    number of rows of a queryset referring to the outer query by OuterRef
+    """
+    template = '(SELECT COUNT(*) FROM (%(subquery)s) _count)'
+    output_field = models.PositiveIntegerField()
+
+
+class ResultMixin:
+    def with_defects_recount(self):
+        """
+        annotate results with the actual numbers of their defects as
+        recount_<counter> for each of DEFECT_COUNTERS
+        """
+        return self.annotate(**{
+            'recount_' + field: SubqueryCount(Defect.objects.filter(
+                result_group__result=models.OuterRef('pk'),
+                result_group__defect_type=defect_type).values('id'))
+            for defect_type, field in DEFECT_COUNTERS.items()
+        })
+
+    def with_wrong_defect_counters(self):
+        """
+        return results whose counters of defects, or counters of defects of
+        their result groups, do not match the stored defects
+        """
+        rgs = ResultGroup.objects.with_defects_recount() \
+            .exclude(defects_counter=models.F('defects_recount'))
+        wrong = models.Q(id__in=rgs.values('result'))
+        for field in DEFECT_COUNTERS.values():
+            wrong |= ~models.Q(**{field: models.F('recount_' + field)})
+        return self.with_defects_recount().filter(wrong)
+
+
+class ResultQuerySet(models.query.QuerySet, ResultMixin):
+    pass
+
+
+class ResultManager(models.Manager, ResultMixin):
+    def get_queryset(self):
+        return ResultQuerySet(self.model, using=self._db)
+
 
 class Result(models.Model):
     """
@@ -91,6 +142,16 @@ class Result(models.Model):
 
     analyzers = models.ManyToManyField(AnalyzerVersion)
 
+    # kept up to date by count_defects()
+    new_defects_counter = models.PositiveIntegerField(
+        default=0, help_text="Number of defects in result groups with new defects")
+    fixed_defects_counter = models.PositiveIntegerField(
+        default=0, help_text="Number of defects in result groups with fixed defects")
+    previously_waived_defects_counter = models.PositiveIntegerField(
+        default=0, help_text="Number of defects in previously waived result groups")
+
+    objects = ResultManager()
+
     def save(self, *args, **kwargs):
         ''' On save, update timestamps '''
         if not self.id:
@@ -101,9 +162,27 @@ class Result(models.Model):
         get_latest_by = "date_submitted"
 
     def get_defects_count(self, defect_type):
-        rgs = ResultGroup.objects.filter(result=self,
-                                         defect_type=defect_type)
-        return Defect.objects.filter(result_group__in=rgs).count()
+        return getattr(self, DEFECT_COUNTERS[defect_type])
+
+    def count_defects(self):
+        """
+        recompute counters of defects of this result and of its result
+        groups; call it whenever defects or result groups change their type
+        """
+        rgs = list(self.resultgroup_set.with_defects_recount())
+        changed = [rg for rg in rgs if rg.defects_counter != rg.defects_recount]
+        for rg in changed:
+            rg.defects_counter = rg.defects_recount
+        ResultGroup.objects.bulk_update(changed, ['defects_counter'])
+
+        counts = collections.Counter()
+        for rg in rgs:
+            counts[rg.defect_type] += rg.defects_counter
+        for defect_type, field in DEFECT_COUNTERS.items():
+            setattr(self, field, counts[defect_type])
+        self.save(update_fields=list(DEFECT_COUNTERS.values()))
+        # the scan tree of the package displays the counters
+        ScanTree.objects.filter(package__scan__scanbinding__result=self).delete()
 
     def new_defects_count(self):
         return self.get_defects_count(DEFECT_STATES['NEW'])
@@ -162,6 +241,16 @@ class Result(models.Model):
         return "#%d" % self.id
 
 
+class JSONArrayElement(models.Func):
+    """
+    element of a JSON array at the index given by an integer expression,
+    e.g. the key event of a defect (PostgreSQL only)
+    """
+    arg_joiner = ' -> '
+    template = '(%(expressions)s)'
+    output_field = models.JSONField()
+
+
 class DefectMixin:
     def by_release(self, release):
         return self.filter(
@@ -187,6 +276,14 @@ class DefectMixin:
         return self.filter(
             result_group__result__scanbinding__scan__scan_type=SCAN_TYPES['REBASE'])
 
+    def with_key_event(self):
+        """
+        do not load events of the defects, only their key events as
+        key_event_data; all events can be loaded for a single defect later
+        """
+        return self.defer('events').annotate(
+            key_event_data=JSONArrayElement('events', 'key_event'))
+
 
 class DefectQuerySet(models.query.QuerySet, DefectMixin):
     pass
@@ -232,6 +329,9 @@ current defect",
     events = models.JSONField(default=list,
                               help_text="List of defect related events.")
 
+    fingerprint = models.CharField(max_length=64, blank=True, null=True, db_index=True,
+                                   help_text="Hash identifying the defect across scans")
+
     objects = DefectManager()
 
     def __str__(self):
@@ -280,6 +380,32 @@ class ResultGroupMixin:
         return self.filter(
             result__scanbinding__scan__scan_type=SCAN_TYPES['REBASE'])
 
+    def with_display_data(self):
+        """
+        annotate rgs with the state of their latest waiver, which
+        get_state_to_display() would query per rg
+        """
+        latest_waivers = Waiver.waivers.filter(result_group=models.OuterRef('pk')).order_by('-date')
+        return self.annotate(
+            latest_waiver_state=models.Subquery(latest_waivers.values('state')[:1]),
+        )
+
+    def latest_waiver_ids(self):
+        """
+        return IDs of the latest waivers of the processed rgs, as returned by
+        has_waiver() for each of them, resolved by a single query
+        """
+        latest_waivers = Waiver.waivers.filter(result_group=models.OuterRef('pk')).order_by('-date')
+        ids = self.filter(state__in=RESULT_GROUP_PROCESSED) \
+            .annotate(latest_waiver_id=models.Subquery(latest_waivers.values('id')[:1])) \
+            .values_list('latest_waiver_id', flat=True)
+        return [waiver_id for waiver_id in ids if waiver_id is not None]
+
+    def with_defects_recount(self):
+        """ annotate rgs with the actual number of their defects as defects_recount """
+        return self.annotate(defects_recount=SubqueryCount(
+            Defect.objects.filter(result_group=models.OuterRef('pk')).values('id')))
+
 
 class ResultGroupQuerySet(models.query.QuerySet, ResultGroupMixin):
     pass
@@ -308,6 +434,11 @@ class ResultGroup(models.Model):
         default=DEFECT_STATES["UNKNOWN"],
         choices=DEFECT_STATES.get_mapping(),
         help_text="Type of defects that are associated with this group.")
+    fingerprint = models.CharField(max_length=64, blank=True, null=True, db_index=True,
+                                   help_text="Hash of fingerprints of all defects in the group")
+    # kept up to date by Result.count_defects()
+    defects_counter = models.PositiveIntegerField(
+        default=0, help_text="Number of defects associated with this group")
 
     objects = ResultGroupManager()
 
@@ -319,8 +450,7 @@ class ResultGroup(models.Model):
 
     def has_fix_later_waiver(self):
         """ is waiver associated with this rg fix later? """
-        w = self.has_waiver()
-        return w and w.is_fix_later()
+        return self.get_latest_waiver_state() == WAIVER_TYPES['FIX_LATER']
 
     def is_waived(self):
         return self.state == RESULT_GROUP_STATES['WAIVED']
@@ -356,6 +486,18 @@ class ResultGroup(models.Model):
             else:
                 return waivers.latest()
 
+    def get_latest_waiver_state(self):
+        """
+        return state of the latest waiver, None if there is none
+        """
+        if self.state not in RESULT_GROUP_PROCESSED:
+            return None
+        # annotated by ResultGroupMixin.with_display_data()
+        if hasattr(self, 'latest_waiver_state'):
+            return self.latest_waiver_state
+        w = self.has_waiver()
+        return w.state if w else None
+
     def is_marked_as_bug(self):
         """
         return True if there is latest waiver with type IS_A_BUG
@@ -364,25 +506,22 @@ class ResultGroup(models.Model):
         if self.contains_bug():
             return True
         # old style
-        w = self.has_waiver()
-        if w:
-            return w.is_bug()
-        else:
-            return False
+        return self.get_latest_waiver_state() == WAIVER_TYPES['IS_A_BUG']
 
     @property
     def defects_count(self):
-        return Defect.objects.filter(result_group=self).count()
+        return self.defects_counter
 
     def get_state_to_display(self):
         """
         return state for CSS class
         """
+        defects_count = self.defects_count
         if self.defect_type == DEFECT_STATES['FIXED']:
-            return 'INFO' if self.defects_count > 0 else 'PASSED'
+            return 'INFO' if defects_count > 0 else 'PASSED'
 
         if self.defect_type in (DEFECT_STATES["NEW"], DEFECT_STATES["PREVIOUSLY_WAIVED"]):
-            if self.defects_count == 0:
+            if defects_count == 0:
                 return 'PASSED'
 
             if self.is_marked_as_bug() and self.is_waived():
@@ -595,6 +734,85 @@ waived for specific Result", on_delete=models.CASCADE)
         return cls(message=text, result_group=rg,
                    user=user, state=WAIVER_TYPES['COMMENT'])
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        LatestWaiver.objects.refresh_for(self.result_group)
+
+
+class LatestWaiverManager(models.Manager):
+    def refresh(self, package_id, release_id, checker_group_id):
+        """ recompute the entry for the given package, release and checker group """
+        key = dict(package_id=package_id, release_id=release_id, checker_group_id=checker_group_id)
+        waiver = Waiver.waivers.filter(
+            result_group__checker_group=checker_group_id,
+            result_group__result__scanbinding__scan__package=package_id,
+            result_group__result__scanbinding__scan__tag__release=release_id,
+        ).select_related('result_group__result').first()
+        if waiver is None:
+            self.filter(**key).delete()
+            return None
+
+        # if there is a newer run which needs inspection, the waiver is not valid
+        is_valid = not ResultGroup.objects.filter(
+            checker_group=checker_group_id,
+            result__scanbinding__scan__package=package_id,
+            result__scanbinding__scan__tag__release=release_id,
+            result__date_submitted__gt=waiver.result_group.result.date_submitted,
+            state=RESULT_GROUP_STATES['NEEDS_INSPECTION'],
+        ).exists()
+        entry, _ = self.update_or_create(defaults={'waiver': waiver, 'is_valid': is_valid}, **key)
+        return entry
+
+    def refresh_for(self, rg):
+        """ recompute the entry for the package, release and checker group of rg """
+        scan = Scan.objects.filter(scanbinding__result=rg.result_id) \
+            .values_list('package_id', 'tag__release_id').first()
+        if scan is not None:
+            self.refresh(scan[0], scan[1], rg.checker_group_id)
+
+    def invalidate(self, package_id, release_id, checker_group_ids, date_submitted):
+        """ a run submitted at date_submitted needs inspection of these checker groups """
+        self.filter(
+            package=package_id,
+            release=release_id,
+            checker_group__in=checker_group_ids,
+            waiver__result_group__result__date_submitted__lt=date_submitted,
+        ).update(is_valid=False)
+
+    def rebuild(self):
+        """ recompute all entries from scratch, return their number """
+        with transaction.atomic():
+            self.all().delete()
+            keys = Waiver.waivers.values_list(
+                'result_group__result__scanbinding__scan__package',
+                'result_group__result__scanbinding__scan__tag__release',
+                'result_group__checker_group',
+            ).order_by().distinct()
+            for key in keys:
+                self.refresh(*key)
+        return self.count()
+
+
+class LatestWaiver(models.Model):
+    """
+    Latest active waiver of each checker group for package in release, kept
+    up to date when waivers are submitted or removed and results are loaded
+    """
+    package = models.ForeignKey(Package, on_delete=models.CASCADE)
+    release = models.ForeignKey(SystemRelease, on_delete=models.CASCADE)
+    checker_group = models.ForeignKey(CheckerGroup, on_delete=models.CASCADE)
+    waiver = models.ForeignKey(Waiver, on_delete=models.CASCADE)
+    is_valid = models.BooleanField(default=True,
+                                   help_text="There is no newer run which needs inspection")
+
+    objects = LatestWaiverManager()
+
+    class Meta:
+        unique_together = ('package', 'release', 'checker_group')
+
+    def __str__(self):
+        return "%s %s %s: %s" % (self.package, self.release, self.checker_group, self.waiver)
+
 
 class WaivingLogMixin:
     def not_deleted(self):
@@ -0,0 +1,15 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+from osh.hub.waiving.models import ResultGroup
+
+
+def get_latest_waiver_ids(package, release):
+    """
+    return IDs of the latest waivers of processed result groups of the
+    package in the release
+    """
+    return ResultGroup.objects.filter(
+        result__scanbinding__scan__package=package,
+        result__scanbinding__scan__tag__release=release,
+    ).latest_waiver_ids()
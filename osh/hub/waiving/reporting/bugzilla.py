@@ -9,7 +9,8 @@ from django.conf import settings
 from django.urls import reverse
 
 from osh.hub.other import get_or_none
-from osh.hub.waiving.models import WAIVER_TYPES, Bugzilla, ResultGroup, Waiver
+from osh.hub.waiving.models import WAIVER_TYPES, Bugzilla, Waiver
+from osh.hub.waiving.reporting import get_latest_waiver_ids
 
 
 def get_client():
@@ -24,23 +25,24 @@ def has_bug(package, release):
     return get_or_none(Bugzilla, package=package, release=release)
 
 
-def get_unreported_bugs(package, release):
+def get_unreported_bugs(package, release, latest_waiver_ids=None):
     """
-    return IS_A_BUG waivers that weren't reported yet
+    return IS_A_BUG waivers that weren't reported yet; callers which have
+    already resolved `latest_waiver_ids` of the package in the release may
+    pass them
     """
-    rgs = ResultGroup.objects.select_related().filter(
-        result__scanbinding__scan__package=package,
-        result__scanbinding__scan__tag__release=release,
-    )
+    if latest_waiver_ids is None:
+        latest_waiver_ids = get_latest_waiver_ids(package, release)
     waivers = Waiver.waivers.filter(
         result_group__result__scanbinding__scan__package=package,
         result_group__result__scanbinding__scan__tag__release=release,
         state__in=[WAIVER_TYPES['IS_A_BUG'], WAIVER_TYPES['FIX_LATER']],
         bz__isnull=True,
-        id__in=[rg.has_waiver().id for rg in rgs if rg.has_waiver()]
-    )
+        id__in=latest_waiver_ids,
+    ).order_by('date')
+    # evaluated once, the result cache serves the callers' checks and counts
     if waivers:
-        return waivers.order_by('date')
+        return waivers
 
 
 def format_waivers(waivers, request):
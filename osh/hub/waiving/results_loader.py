@@ -3,16 +3,20 @@
 
 import logging
 
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, transaction
 from kobo.hub.models import Task
 
 from osh.common.constants import DEFAULT_CHECKER_GROUP
-from osh.hub.scan.models import AnalyzerVersion, AppSettings
-from osh.hub.service.csmock_parser import (CsmockAPI, ResultsExtractor,
-                                           parse_elapsed_time)
+from osh.hub.scan.models import (RESULTS_STAGES, AnalyzerVersion, AppSettings,
+                                 ResultsCheckpoint)
+from osh.hub.scan.service import deduplicate_task_files
+from osh.hub.service.archive import ResultsArchive, has_random_access
+from osh.hub.service.csmock_parser import CsmockAPI, parse_elapsed_time
+from osh.hub.service.fingerprint import defect_fingerprint, group_fingerprint
 from osh.hub.service.path import TaskResultPaths
-from osh.hub.service.processing import (TaskDiffer, task_has_results,
-                                        task_is_diffed)
+from osh.hub.service.processing import TaskDiffer
 from osh.hub.waiving.models import (DEFECT_STATES, RESULT_GROUP_STATES,
                                     Checker, CheckerGroup, Defect, Result,
                                     ResultGroup)
@@ -20,6 +24,9 @@ from osh.hub.waiving.service import find_processed_in_past
 
 logger = logging.getLogger(__name__)
 
+# number of defects inserted into the database by a single query
+DEFECTS_BULK_SIZE = 1000
+
 
 class TaskResultsProcessor:
     """
@@ -41,14 +48,22 @@ class TaskResultsProcessor:
         self.exclude_dirs = exclude_dirs
 
     def unpack_results(self):
-        tb_path = self.target_paths.get_tarball_path()
-        if task_has_results(self.target_task):
+        if ResultsCheckpoint.objects.reached(self.target_task, RESULTS_STAGES['UNPACKED']):
             logger.info("Results are already unpacked for task %s", self.target_task)
             return
 
-        logger.debug('Unpacking %s', tb_path)
-        rex = ResultsExtractor(tb_path, output_dir=self.target_task_dir, unpack_in_temp=False)
-        rex.extract_tarball(self.exclude_dirs)
+        # the manifest is optional, results of older workers do not have it
+        self.target_paths.load_manifest()
+        tb_path = self.target_paths.get_tarball_path()
+
+        # files are read from the tarball on demand unless full unpack is
+        # enabled or reads of single files would decompress the whole tarball
+        output_dir = None
+        if settings.RESULTS_FULL_UNPACK or not has_random_access(tb_path):
+            output_dir = self.target_task_dir
+        logger.debug('Indexing %s (unpacking to %s)', tb_path, output_dir)
+        ResultsArchive.create(tb_path, self.exclude_dirs or [], output_dir)
+        deduplicate_task_files(self.target_task.id)
 
         try:
             with open(self.target_paths.get_txt_summary()) as f:
@@ -62,13 +77,18 @@ class TaskResultsProcessor:
             # skip if summary is not available
             pass
 
+        ResultsCheckpoint.objects.record(self.target_task, RESULTS_STAGES['UNPACKED'])
+
     def generate_diffs(self):
         if self.base_task:
-            if task_is_diffed(self.target_task):
+            if ResultsCheckpoint.objects.reached(self.target_task, RESULTS_STAGES['DIFFED']):
                 logger.info("Task '%s' is already diffed.", self.target_task)
                 return True
             td = TaskDiffer(self.target_task, self.base_task)
-            return td.diff_results()
+            if not td.diff_results():
+                return False
+            ResultsCheckpoint.objects.record(self.target_task, RESULTS_STAGES['DIFFED'])
+            return True
 
 
 class ScanResultsProcessor:
@@ -110,18 +130,25 @@ class ResultsLoader:
         """
         self.sb = sb
         self.scan = sb.scan
-        self.result = None
-        task = Task.objects.get(id=sb.task.id)
-        paths = TaskResultPaths(task)
-        self.all = CsmockAPI(paths.get_json_results())
+        self.result = sb.result
+        self.task = Task.objects.get(id=sb.task.id)
+        paths = TaskResultPaths(self.task)
+        self.all = CsmockAPI(paths.get_json_results(), streaming=True)
         if self.scan.is_errata_scan():
-            self.added = CsmockAPI(paths.get_json_added())
-            self.fixed = CsmockAPI(paths.get_json_fixed())
+            self.added = CsmockAPI(paths.get_json_added(), streaming=True)
+            self.fixed = CsmockAPI(paths.get_json_fixed(), streaming=True)
 
     def create_result(self):
-        """ create result model """
-        self.result = Result()
-        self.result.save()  # save for sake of m2m analyzers relation
+        """ create result model, or reset the one left by an unfinished run """
+        if self.result is None:
+            self.result = Result()
+            self.result.save()  # save for sake of m2m analyzers relation
+        else:
+            logger.info("Discarding defects of unfinished %s", self.result)
+            Defect.objects.filter(result_group__result=self.result).delete()
+            # keep result groups which users have already waived
+            ResultGroup.objects.filter(result=self.result, waiver__isnull=True).delete()
+            self.result.count_defects()
         analyzers = self.all.get_analyzers()
         if analyzers:
             self.result.set_analyzers(analyzers)
@@ -138,51 +165,142 @@ class ResultsLoader:
 
     def store_defects(self, defects, defect_state):
         """ put defects in database """
+        store_defects(self.result, defects, defect_state)
+
+    def stage(self, stage):
+        """ is the stage still to be done? """
+        if ResultsCheckpoint.objects.reached(self.task, RESULTS_STAGES[stage]):
+            logger.info("Skipping stage %s of %s, already done", stage, self.sb)
+            return False
+        return True
+
+    def checkpoint(self, stage):
+        ResultsCheckpoint.objects.record(self.task, RESULTS_STAGES[stage])
+
+    def load(self):
+        """ create result and store its defects in a single transaction """
+        try:
+            with transaction.atomic():
+                self.create_result()
+                if self.scan.is_errata_scan():
+                    if self.scan.is_newpkg_scan():
+                        self.store_defects(self.all.get_defects(), DEFECT_STATES['NEW'])
+                    else:
+                        self.store_defects(self.fixed.get_defects(), DEFECT_STATES['FIXED'])
+                        self.store_defects(self.added.get_defects(), DEFECT_STATES['NEW'])
+                self.checkpoint('LOADED')
+        except BaseException:
+            # the result created (or reset) by the rolled back transaction is
+            # gone, a retry has to start from the state stored in the database
+            self.sb.refresh_from_db(fields=['result'])
+            self.result = self.sb.result
+            raise
+
+    def process(self):
+        """ process scan, skipping the stages completed by previous runs """
+        if self.stage('LOADED'):
+            self.load()
+
+        if not self.scan.is_errata_scan():
+            return
+
+        if self.stage('MATCHED'):
+            with transaction.atomic():
+                find_processed_in_past(self.result)
+                self.checkpoint('MATCHED')
+
+
+def is_internal_warning(defect):
+    """ is the key event of the defect an internal warning of the analyzer? """
+    try:
+        key_idx = int(defect['key_event_idx'])
+        key_evt = defect['events'][key_idx]
+        return key_evt['event'] == 'internal warning'
+    except:  # noqa: B901, E722
+        return False
+
+
+def get_or_create_checker(name):
+    """ return checker with the given name, create it in default group if needed """
+    try:
+        # get_or_create fails here, because there will be integrity
+        # error on group atribute
+        return Checker.objects.select_related('group').get(name=name)
+    except ObjectDoesNotExist:
+        pass
+
+    if name.startswith("FB."):
+        # assign numerous FindBugs checkers to FindBugs automatically
+        default_group = "FindBugs"
+    else:
+        default_group = DEFAULT_CHECKER_GROUP
+    checker = Checker()
+    checker.group, _ = CheckerGroup.objects.get_or_create(name=default_group)
+    checker.name = name
+    checker.save()
+    return checker
+
+
+def get_or_create_result_group(result, checker_group, defect_state):
+    """ return result group for the given checker group with initial state set """
+    rg, _ = ResultGroup.objects.get_or_create(
+        checker_group=checker_group,
+        result=result,
+        defect_type=defect_state)
+
+    if rg.state == RESULT_GROUP_STATES['UNKNOWN']:
+        if defect_state == DEFECT_STATES['NEW']:
+            rg.state = RESULT_GROUP_STATES['NEEDS_INSPECTION']
+        elif defect_state == DEFECT_STATES['FIXED']:
+            rg.state = RESULT_GROUP_STATES['INFO']
+        rg.save()
+
+    return rg
+
+
+def store_defects(result, defects, defect_state):
+    """
+    put defects in database
+
+    Checkers and result groups are resolved only once per distinct value and
+    defects are written using chunked bulk inserts.  Defects are numbered
+    within their result group in the order they come in and fingerprinted.
+    """
+    checkers = {}
+    result_groups = {}
+    orders = {}
+    fingerprints = {}
+    batch = []
+
+    with transaction.atomic():
         for defect in defects:
-            try:
-                key_idx = int(defect['key_event_idx'])
-                key_evt = defect['events'][key_idx]
-                if key_evt['event'] == 'internal warning':
-                    # skip internal warnings
-                    continue
-            except:  # noqa: B901, E722
-                pass
-            d = Defect()
-            json_checker_name = defect['checker']
+            if is_internal_warning(defect):
+                # skip internal warnings
+                continue
 
             # truncate to fit into the corresponding db field
-            json_checker_name = json_checker_name[:64]
-
-            try:
-                # get_or_create fails here, because there will be integrity
-                # error on group atribute
-                checker = Checker.objects.get(name=json_checker_name)
-            except ObjectDoesNotExist:
-                if json_checker_name.startswith("FB."):
-                    # assign numerous FindBugs checkers to FindBugs automatically
-                    default_group = "FindBugs"
-                else:
-                    default_group = DEFAULT_CHECKER_GROUP
-                checker = Checker()
-                checker.group, _ = CheckerGroup.objects.get_or_create(name=default_group)
-                checker.name = json_checker_name
-                checker.save()
-
-            rg, created = ResultGroup.objects.get_or_create(
-                checker_group=checker.group,
-                result=self.result,
-                defect_type=defect_state)
-
-            if rg.state == RESULT_GROUP_STATES['UNKNOWN']:
-                if defect_state == DEFECT_STATES['NEW']:
-                    rg.state = RESULT_GROUP_STATES['NEEDS_INSPECTION']
-                elif defect_state == DEFECT_STATES['FIXED']:
-                    rg.state = RESULT_GROUP_STATES['INFO']
-
-            rg.save()
+            checker_name = defect['checker'][:64]
 
+            checker = checkers.get(checker_name)
+            if checker is None:
+                checker = get_or_create_checker(checker_name)
+                checkers[checker_name] = checker
+
+            rg = result_groups.get(checker.group_id)
+            if rg is None:
+                rg = get_or_create_result_group(result, checker.group, defect_state)
+                result_groups[checker.group_id] = rg
+                orders[rg.id] = rg.defect_set.aggregate(models.Max('order'))['order__max'] or 0
+                fingerprints[rg.id] = []
+                if orders[rg.id]:
+                    fingerprints[rg.id].extend(rg.defect_set.values_list('fingerprint', flat=True))
+
+            orders[rg.id] += 1
+
+            d = Defect()
             d.checker = checker
             d.result_group = rg
+            d.order = orders[rg.id]
             d.annotation = defect.get('annotation', None)
             d.defect_identifier = defect.get('defect_id', None)
             d.function = defect.get('function', None)
@@ -192,33 +310,41 @@ class ResultsLoader:
                 d.function = str(d.function)[:128]
 
             d.cwe = defect.get('cwe', None)
-            d.result = self.result
             d.state = defect_state
             d.key_event = defect['key_event_idx']
             d.events = defect['events']
-            d.save()
+            d.fingerprint = defect_fingerprint(defect)
+            fingerprints[rg.id].append(d.fingerprint)
+            batch.append(d)
 
-    def process(self):
-        """ process scan """
-        self.create_result()
-        if self.scan.is_errata_scan():
-            if self.scan.is_newpkg_scan():
-                self.store_defects(self.all.get_defects(), DEFECT_STATES['NEW'])
-            else:
-                self.store_defects(self.fixed.get_defects(), DEFECT_STATES['FIXED'])
-                self.store_defects(self.added.get_defects(), DEFECT_STATES['NEW'])
+            if len(batch) >= DEFECTS_BULK_SIZE:
+                Defect.objects.bulk_create(batch)
+                batch = []
+
+        if batch:
+            Defect.objects.bulk_create(batch)
+
+        for rg in result_groups.values():
+            if None in fingerprints[rg.id]:
+                # defects stored before fingerprints were introduced
+                continue
+            rg.fingerprint = group_fingerprint(fingerprints[rg.id])
+            rg.save(update_fields=['fingerprint'])
 
-            find_processed_in_past(self.result)
+        result.count_defects()
 
-            for rg in ResultGroup.objects.filter(result=self.result):
-                counter = 1
-                for defect in Defect.objects.filter(result_group=rg):
-                    defect.order = counter
-                    defect.save()
-                    counter += 1
+    logger.debug("Stored defects of %d checkers in %d result groups for %s",
+                 len(checkers), len(result_groups), result)
 
 
 def process_scan(sb):
+    """
+    unpack, diff and load results of the scan into the database
+
+    Completed stages are recorded as ResultsCheckpoint of the task, so calling
+    this again for a scan which failed half way through resumes the processing
+    at the first unfinished stage.
+    """
     exclude_dirs = AppSettings.settings_get_results_tb_exclude_dirs()
     rp = ScanResultsProcessor(sb, exclude_dirs=exclude_dirs)
     rp.unpack_results()
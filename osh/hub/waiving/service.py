@@ -11,9 +11,12 @@ import json
 import logging
 
 import pycsdiff
+from django.db.models import Sum
 
-from .models import (DEFECT_STATES, RESULT_GROUP_STATES, Defect, ResultGroup,
-                     Waiver, WaivingLog)
+from osh.hub.scan.models import Scan
+
+from .models import (DEFECT_STATES, RESULT_GROUP_STATES, Defect, LatestWaiver,
+                     Result, ResultGroup, WaivingLog)
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +24,9 @@ logger = logging.getLogger(__name__)
 __all__ = (
     'get_unwaived_rgs',
     'compare_result_groups',
+    'csdiff_compare_result_groups',
     'get_last_waiver',
+    'get_last_waivers',
     'display_in_result',
 )
 
@@ -31,30 +36,45 @@ def find_processed_in_past(result):
     When new scan is imported, check which defects were waived in past
     or marked as bugs.
     """
-
     # get all RGs, that does not have waiver
-    for rg in get_unwaived_rgs(result):
+    rgs = list(get_unwaived_rgs(result))
+    if not rgs:
+        return
+
+    scan = Scan.objects.select_related('tag').get(scanbinding__result=result)
+    waivers = get_last_waivers(rgs, scan.package_id, scan.tag.release_id)
+
+    waived_ids = []
+    bug_ids = []
+    for rg in rgs:
         # was RG waived in past?
-        w = get_last_waiver(
-            rg.checker_group,
-            rg.result.scanbinding.scan.package,
-            rg.result.scanbinding.scan.tag.release,
-            exclude=rg.id,
-        )
-        # compare defects in these 2 result groups using pycsdiff
+        w = waivers.get(rg.id)
+        # compare defects in these 2 result groups
         if w and compare_result_groups(rg, w.result_group):
             if w.is_bug():
-                rg.set_bug_confirmed()
+                bug_ids.append(rg.id)
             else:
-                # they match! -- change states
-                rg.state = RESULT_GROUP_STATES['PREVIOUSLY_WAIVED']
-                rg.defect_type = DEFECT_STATES['PREVIOUSLY_WAIVED']
-                rg.save()
+                waived_ids.append(rg.id)
+
+    if bug_ids:
+        ResultGroup.objects.filter(id__in=bug_ids).update(
+            state=RESULT_GROUP_STATES['CONTAINS_BUG'])
+
+    if waived_ids:
+        # they match! -- change states, also for defects
+        ResultGroup.objects.filter(id__in=waived_ids).update(
+            state=RESULT_GROUP_STATES['PREVIOUSLY_WAIVED'],
+            defect_type=DEFECT_STATES['PREVIOUSLY_WAIVED'])
+        Defect.objects.filter(result_group__in=waived_ids).update(
+            state=DEFECT_STATES['PREVIOUSLY_WAIVED'])
+        result.count_defects()
 
-                # also changes states for defects
-                for d in Defect.objects.filter(result_group=rg):
-                    d.state = DEFECT_STATES['PREVIOUSLY_WAIVED']
-                    d.save()
+    # waivers of groups which still need inspection are no longer valid
+    matched = set(waived_ids + bug_ids)
+    LatestWaiver.objects.invalidate(
+        scan.package_id, scan.tag.release_id,
+        [rg.checker_group_id for rg in rgs if rg.id not in matched],
+        result.date_submitted)
 
 
 def get_unwaived_rgs(result):
@@ -87,6 +107,16 @@ def get_serializable_dict(query):
 
 
 def compare_result_groups(rg1, rg2):
+    """
+        Compare defects of two distinct result groups using fingerprints
+        computed at ingest; csdiff decides if they differ or are missing
+    """
+    if rg1.fingerprint and rg1.fingerprint == rg2.fingerprint:
+        return True
+    return csdiff_compare_result_groups(rg1, rg2)
+
+
+def csdiff_compare_result_groups(rg1, rg2):
     """
         Compare defects of two distinct result groups
         use csdiff tool -- python binding
@@ -107,41 +137,45 @@ def compare_result_groups(rg1, rg2):
     return not (r_s1['defects'] or r_s2['defects'])
 
 
-def get_last_waiver(checker_group, package, release, exclude=None):
+def get_last_waiver(checker_group, package, release):
     """
     Try to get base waiver for specific checkergroup, package, release;
-     return None if there is newer run with change in waiving;
-    exclude specified resultgroup
-    """
-    waivers = Waiver.waivers.filter(
-        result_group__checker_group=checker_group,
-        result_group__result__scanbinding__scan__package=package,
-        result_group__result__scanbinding__scan__tag__release=release,
-    )
-    if waivers:
-        latest_waiver = waivers.latest()
-        # return all RGs newer that latest_waiver's run, if these are changed
-        # it means that last waiver is not valid
-        rgs = ResultGroup.objects.filter(
-            result__date_submitted__gt=latest_waiver.result_group.result.date_submitted,
-            checker_group=latest_waiver.result_group.checker_group,
-            result__scanbinding__scan__package=latest_waiver.result_group.result.scanbinding.scan.package,
-            result__scanbinding__scan__tag__release=latest_waiver.result_group.result.scanbinding.scan.tag.release,
-        ).exclude(id=exclude).values_list('state', flat=True).distinct()
-        if RESULT_GROUP_STATES['NEEDS_INSPECTION'] in rgs:
-            return None
-        else:
-            return latest_waiver
-    else:
+     return None if there is newer run with change in waiving
+    """
+    lw = LatestWaiver.objects.filter(
+        checker_group=checker_group,
+        package=package,
+        release=release,
+    ).select_related('waiver__result_group__result').first()
+    if lw is None or not lw.is_valid:
         return None
+    return lw.waiver
+
+
+def get_last_waivers(rgs, package_id, release_id):
+    """
+    Batched get_last_waiver() for result groups of a single result:
+    return {rg.id: waiver} with the latest valid waiver of the same checker
+    group, package and release for each of `rgs` which has one
+    """
+    by_checker_group = {rg.checker_group_id: rg for rg in rgs}
+    latest_waivers = LatestWaiver.objects.filter(
+        checker_group__in=by_checker_group,
+        package=package_id,
+        release=release_id,
+        is_valid=True,
+    ).select_related('waiver__result_group')
+    return {by_checker_group[lw.checker_group_id].id: lw.waiver for lw in latest_waivers}
 
 
 def display_in_result(rg):
     """
-    return data that are displayed in waiver
+    return data that are displayed in waiver; `rg` should be fetched
+    with ResultGroup.objects.with_display_data() to avoid further queries
     """
+    defects_count = rg.defects_count
     response = {'group_state': rg.get_state_to_display()}
-    response['defects_count'] = rg.defects_count
+    response['defects_count'] = defects_count
     response['defects_state'] = DEFECT_STATES.get_value(rg.defect_type)
     return response
 
@@ -153,9 +187,8 @@ def waiver_condition(result_group):
 
 def get_scans_new_defects_count(scan_id):
     """Return number of newly introduced bugs for particular scan"""
-    rgs = ResultGroup.objects.filter(result__scanbinding__scan__id=scan_id,
-                                     defect_type=DEFECT_STATES['NEW'])
-    return Defect.objects.filter(result_group__in=rgs).count()
+    return Result.objects.filter(scanbinding__scan__id=scan_id) \
+        .aggregate(count=Sum('new_defects_counter'))['count'] or 0
 
 
 def get_waivers_for_rg(rg):
@@ -3,11 +3,11 @@
 
 from django.urls import path
 
-from osh.hub.waiving.views import (ResultsListView, et_latest,
+from osh.hub.waiving.views import (ResultsListView, defect_events, et_latest,
                                    etmapping_latest, fixed_defects, new_bz,
                                    new_jira, newest_result, previously_waived,
-                                   remove_waiver, result, update_bz,
-                                   update_jira, waiver)
+                                   remove_waiver, result, result_navigation,
+                                   result_tab, update_bz, update_jira, waiver)
 
 urlpatterns = [
     path("", ResultsListView.as_view(), name="waiving/list"),
@@ -21,12 +21,20 @@ urlpatterns = [
          previously_waived,
          name="waiving/previously_waived"),
 
+    path("defect/<int:defect_id>/events/",
+         defect_events,
+         name="waiving/defect/events"),
+
     path("<int:waiver_id>/remove",
          remove_waiver,
          name="waiving/waiver/remove"),
 
     path("<int:sb_id>/",
          result, name="waiving/result"),
+    path("<int:sb_id>/tab/<str:tab>/",
+         result_tab, name="waiving/result/tab"),
+    path("<int:sb_id>/navigation/",
+         result_navigation, name="waiving/result/navigation"),
     path("<str:package_name>/<str:release_tag>/newest/",
          newest_result,
          name="waiving/result/newest"),
@@ -1,14 +1,18 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import collections
 import datetime
+import json
 import logging
 import os
 from urllib.parse import urlencode
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import Http404, HttpResponseRedirect
+from django.core.paginator import Paginator
+from django.db.models import Count
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from django.views.generic.list import ListView
@@ -24,20 +28,24 @@ from osh.hub.scan.models import (SCAN_STATES, SCAN_TYPES, SCAN_TYPES_TARGET,
 from osh.hub.scan.notify import send_notif_new_comment
 from osh.hub.scan.service import get_latest_sb_by_package
 from osh.hub.scan.xmlrpc_helper import scan_notification_email
-from osh.hub.service.processing import task_has_results
+from osh.hub.service.path import TaskResultPaths
 from osh.hub.waiving.forms import ScanListSearchForm, WaiverForm
 from osh.hub.waiving.models import (DEFECT_STATES, RESULT_GROUP_STATES,
                                     WAIVER_LOG_ACTIONS, WAIVER_TYPES,
                                     WAIVER_TYPES_HELP_TEXTS, Bugzilla,
-                                    CheckerGroup, Defect, JiraBug, ResultGroup,
-                                    Waiver, WaivingLog)
-from osh.hub.waiving.reporting import bugzilla, jira
+                                    CheckerGroup, Defect, JiraBug,
+                                    LatestWaiver, ResultGroup, Waiver,
+                                    WaivingLog)
+from osh.hub.waiving.reporting import bugzilla, get_latest_waiver_ids, jira
 from osh.hub.waiving.service import (apply_waiver, display_in_result,
                                      get_last_waiver, get_unwaived_rgs,
                                      get_waivers_for_rg, waiver_condition)
 
 logger = logging.getLogger(__name__)
 
+# number of defects displayed on a page of a result group
+DEFECTS_PER_PAGE = 100
+
 
 def get_common_context(request, sb):
     """
@@ -80,8 +88,10 @@ def get_result_context(request, sb):
     context['bz_url'] = settings.BZ_URL
     context['jira_url'] = settings.JIRA_URL
 
-    unrep_bz_waivers = bugzilla.get_unreported_bugs(package, release)
-    unrep_jira_waivers = jira.get_unreported_bugs(package, release)
+    # resolved once for both trackers
+    latest_waiver_ids = get_latest_waiver_ids(package, release)
+    unrep_bz_waivers = bugzilla.get_unreported_bugs(package, release, latest_waiver_ids)
+    unrep_jira_waivers = jira.get_unreported_bugs(package, release, latest_waiver_ids)
 
     context['bugzilla'] = get_or_none(Bugzilla,
                                       package=package,
@@ -101,28 +111,14 @@ def get_result_context(request, sb):
     else:
         context['unreported_bugs_count_jira'] = 0
 
-    # numbers
+    # numbers, the groups of the tabs are loaded by result_tab()
     if sb.result:
-        n_out, n_count = get_waiving_data(sb.result,
-                                          defect_type=DEFECT_STATES['NEW'])
-        new_defects = get_tupled_data(n_out)
-
-        f_out, f_count = get_waiving_data(sb.result,
-                                          defect_type=DEFECT_STATES['FIXED'])
-        fixed_defects = get_tupled_data(f_out)
-
-        o_out, o_count = get_waiving_data(
-            sb.result,
-            defect_type=DEFECT_STATES['PREVIOUSLY_WAIVED'])
-        old_defects = get_tupled_data(o_out)
-        context['output_new'] = new_defects
-        context['output_fixed'] = fixed_defects
-        context['output_old'] = old_defects
+        counts = get_waiving_counts(sb.result)
 
         # number of active groups in each tab
-        context['new_count'] = n_count
-        context['fixed_count'] = f_count
-        context['old_count'] = o_count
+        context['new_count'] = counts[DEFECT_STATES['NEW']]
+        context['fixed_count'] = counts[DEFECT_STATES['FIXED']]
+        context['old_count'] = counts[DEFECT_STATES['PREVIOUSLY_WAIVED']]
     elif sb.scan.state == SCAN_STATES['FAILED']:
         context['not_finished'] = "Scan wasn't successful."
     elif sb.scan.state == SCAN_STATES['CANCELED']:
@@ -131,17 +127,7 @@ one)."
     else:
         context['not_finished'] = "Scan not complete."
     context['sb'] = sb
-    # links for other runs
-    context['first_sb'] = sb.scan.get_first_scan_binding()
-    context['newest_sb'] = \
-        get_latest_sb_by_package(release, sb.scan.package)
-    context['previous_sb'] = getattr(sb.scan.get_child_scan(),
-                                     'scanbinding', None)
-    context['next_sb'] = getattr(sb.scan.parent, 'scanbinding', None)
-    ids = list(sb.scan.all_scans_in_release().values_list('id', flat=True))
-    if sb.scan.id in ids:
-        context['scan_order'] = ids.index(sb.scan.id) + 1
-    context['scans_count'] = len(ids)
+    # links for other runs are loaded by result_navigation()
 
     # only show the type for non-regular scans
     if sb.scan.scan_type != SCAN_TYPES['ERRATA']:
@@ -172,9 +158,11 @@ def create_log_dict(title, icon, icon_link, files, logs_list):
 
 def add_logs_to_context(sb):
     logs = []
-    logs_list = sb.task.logs.list
+    # resolved once the results have been processed
+    paths = TaskResultPaths(sb.task)
+    logs_list = paths.list_results_files()
 
-    if task_has_results(sb.task):
+    if paths.has_json_results():
         log_prefix = os.path.join(sb.scan.nvr, 'scan-results')
     else:
         log_prefix = os.path.join(sb.scan.nvr, 'run1', 'results')
@@ -206,24 +194,53 @@ def add_logs_to_context(sb):
     return {'logs': [x for x in logs if x]}
 
 
-def get_waiving_data(result_object, defect_type):
-    """return list of checker_groups with states and counts"""
-    output = {}
-    count = 0
-    # checker_group: result_group
-    for group in CheckerGroup.objects.filter(enabled=True):
-        try:
-            rg = ResultGroup.objects.get(checker_group=group,
-                                         result=result_object,
-                                         defect_type=defect_type)
-        except ObjectDoesNotExist:
-            output[group] = {}
-        else:
-            count += 1
-            view_data = display_in_result(rg)
-            view_data['id'] = rg.id
-            output[group] = view_data
-    return output, count
+def get_waiving_data(result_object, defect_types):
+    """
+    return {defect_type: (output, count)}, output is a dict of checker_groups
+    with states and counts; the result groups of all `defect_types` are
+    fetched by a single query
+    """
+    groups = list(CheckerGroup.objects.filter(enabled=True))
+    rgs = ResultGroup.objects.filter(result=result_object, defect_type__in=defect_types,
+                                     checker_group__enabled=True).with_display_data()
+    rgs_by_group = {(rg.checker_group_id, rg.defect_type): rg for rg in rgs}
+
+    data = {}
+    for defect_type in defect_types:
+        output = {}
+        count = 0
+        # checker_group: result_group
+        for group in groups:
+            rg = rgs_by_group.get((group.id, defect_type))
+            if rg is None:
+                output[group] = {}
+            else:
+                count += 1
+                view_data = display_in_result(rg)
+                view_data['id'] = rg.id
+                output[group] = view_data
+        data[defect_type] = (output, count)
+    return data
+
+
+def get_waiving_counts(result_object):
+    """return {defect_type: number of result groups of enabled checker groups}"""
+    rgs = ResultGroup.objects.filter(result=result_object, checker_group__enabled=True)
+    return collections.Counter(dict(
+        rgs.values_list('defect_type').annotate(count=Count('id')).order_by()))
+
+
+def add_defects_to_context(context, request, result_group_id, defect_state):
+    """
+    add page of defects of the result group requested by ?page= to context,
+    only key events of the defects are loaded
+    """
+    defects = Defect.objects.filter(result_group=result_group_id, state=defect_state) \
+        .with_key_event().select_related('checker').order_by('order')
+    page = Paginator(defects, DEFECTS_PER_PAGE).get_page(request.GET.get('page'))
+    context['defects'] = page
+    context['page_obj'] = page
+    context['paginator'] = page.paginator
 
 
 def get_tupled_data(output):
@@ -423,6 +440,7 @@ def waiver_post(form, request, sb, result_group_object, url_name,
         Defect.objects.filter(result_group=result_group_object).\
             update(state=DEFECT_STATES['NEW'])
         result_group_object.save()
+        result_group_object.result.count_defects()
 
     # update states of sb and rg; eventually of whole run
     apply_waiver(result_group_object, sb, w)
@@ -497,8 +515,7 @@ def waiver(request, sb_id, result_group_id):
     context.update(get_result_context(request, sb))
 
     context['active_group'] = result_group_object
-    context['defects'] = Defect.objects.filter(result_group=result_group_id,
-                                               state=DEFECT_STATES['NEW']).order_by("order")
+    add_defects_to_context(context, request, result_group_id, DEFECT_STATES['NEW'])
     context['waiving_logs'] = get_waivers_for_rg(result_group_object)
 
     context['defects_list_class'] = 'new'
@@ -524,6 +541,7 @@ def remove_waiver(request, waiver_id):
         if sb.scan.is_waived() and not waiver_condition(waiver.result_group):
             ResultGroup.objects.filter(id=waiver.result_group.id).update(
                 state=RESULT_GROUP_STATES['NEEDS_INSPECTION'])
+            LatestWaiver.objects.refresh_for(waiver.result_group)
             sb.scan.set_state(SCAN_STATES['DISPUTED'])
             if wl.user != waiver.user:
                 scan_notification_email(request, sb.scan.id)
@@ -547,8 +565,7 @@ def fixed_defects(request, sb_id, result_group_id):
     context = get_result_context(request, sb)
 
     context['active_group'] = get_object_or_404(ResultGroup, id=result_group_id)
-    context['defects'] = Defect.objects.filter(result_group=result_group_id,
-                                               state=DEFECT_STATES['FIXED']).order_by("order")
+    add_defects_to_context(context, request, result_group_id, DEFECT_STATES['FIXED'])
     context['display_form'] = False
     context['display_waivers'] = False
     context['form_message'] = "This group can't be waived, because these \
@@ -594,8 +611,7 @@ def previously_waived(request, sb_id, result_group_id):
         context['matching_waiver'] = w
 
     context['active_group'] = ResultGroup.objects.get(id=result_group_id)
-    context['defects'] = Defect.objects.filter(result_group=result_group_id,
-                                               state=DEFECT_STATES['PREVIOUSLY_WAIVED']).order_by("order")
+    add_defects_to_context(context, request, result_group_id, DEFECT_STATES['PREVIOUSLY_WAIVED'])
     context['waiving_logs'] = WaivingLog.objects.filter(
         waiver__result_group=result_group_id).exclude(
         state=WAIVER_LOG_ACTIONS['DELETE'])
@@ -620,6 +636,76 @@ def result(request, sb_id):
     return render(request, "waiving/result.html", context)
 
 
+# tab of the result page: (type of defects, view displaying defects of a group)
+RESULT_TABS = {
+    'new': (DEFECT_STATES['NEW'], 'waiving/waiver'),
+    'fixed': (DEFECT_STATES['FIXED'], 'waiving/fixed_defects'),
+    'old': (DEFECT_STATES['PREVIOUSLY_WAIVED'], 'waiving/previously_waived'),
+}
+
+
+def _json_response(data):
+    return HttpResponse(json.dumps(data).encode(),
+                        content_type='application/json; charset=utf8')
+
+
+def result_tab(request, sb_id, tab):
+    """
+    Provide checker groups of a tab of the result page, only the visible tab
+    is loaded by the page
+    """
+    if tab not in RESULT_TABS:
+        raise Http404('Unknown tab: ' + tab)
+    sb = get_object_or_404(ScanBinding, id=sb_id)
+    if sb.result is None:
+        raise Http404('Scan %s has no results' % sb.scan)
+
+    defect_type, url_name = RESULT_TABS[tab]
+    output, count = get_waiving_data(sb.result, [defect_type])[defect_type]
+    rows = []
+    for row in get_tupled_data(output):
+        cells = []
+        for group, view_data in row.items():
+            cell = {'name': group.name}
+            if view_data:
+                cell.update(view_data, url=reverse(url_name, args=(sb.id, view_data['id'])))
+            cells.append(cell)
+        rows.append(cells)
+
+    return _json_response({'count': count, 'rows': rows})
+
+
+def result_navigation(request, sb_id):
+    """
+    Provide links to other scans of the package in the release
+    """
+    sb = get_object_or_404(ScanBinding, id=sb_id)
+    release = sb.scan.tag.release if sb.scan.tag else None
+
+    def link(binding):
+        if binding is None:
+            return None
+        return {'url': reverse('waiving/result', args=(binding.id,)), 'nvr': binding.scan.nvr}
+
+    scan_order, scans_count = sb.scan.get_order_in_release()
+    return _json_response({
+        'first': link(sb.scan.get_first_scan_binding()),
+        'previous': link(getattr(sb.scan.get_child_scan(), 'scanbinding', None)),
+        'next': link(getattr(sb.scan.parent, 'scanbinding', None)),
+        'newest': link(get_latest_sb_by_package(release, sb.scan.package)),
+        'scan_order': scan_order,
+        'scans_count': scans_count,
+    })
+
+
+def defect_events(request, defect_id):
+    """
+    Provide all events of a defect, lists of defects only show key events
+    """
+    defect = get_object_or_404(Defect.objects.only('key_event', 'events'), id=defect_id)
+    return _json_response({'key_event': defect.key_event, 'events': defect.events})
+
+
 def newest_result(request, package_name, release_tag):
     """
     Display latest result for specified package -- this is available on
@@ -1,8 +1,10 @@
 import io
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, call, patch
+from urllib.error import HTTPError
 
 from osh.client.commands.cmd_download_results import Download_Results
+from osh.client.commands.shortcuts import fetch_results
 from osh.tests.client import OSHCLITestBase
 
 
@@ -51,3 +53,35 @@ class TestDownloadResults(OSHCLITestBase, unittest.TestCase):
             for task_id in tasks:
                 error_message = f"Task {task_id} does not exist!"
                 self.assertIn(error_message, output)
+
+
+class TestFetchResults(unittest.TestCase):
+    def setUp(self):
+        self.hub = MagicMock()
+        self.hub.client.task_url.return_value = 'https://hub/task/1/'
+
+    def fetch(self, args):
+        self.hub.scan.get_task_info.return_value = {'args': args}
+        with patch('sys.stderr', new=io.StringIO()):
+            return fetch_results(self.hub, '/tmp', 1)
+
+    @patch('osh.client.commands.shortcuts.urlretrieve')
+    def test_zstd(self, fake_urlretrieve):
+        self.assertTrue(self.fetch({'result_filename': 'pkg-1.0-1', 'results_compression': 'zstd'}))
+        fake_urlretrieve.assert_called_once_with(
+            'https://hub/task/1/log/pkg-1.0-1.tar.zst?format=raw', '/tmp/pkg-1.0-1.tar.zst')
+
+    @patch('osh.client.commands.shortcuts.urlretrieve')
+    def test_fallback(self, fake_urlretrieve):
+        fake_urlretrieve.side_effect = [HTTPError('url', 404, 'Not Found', {}, None), None]
+        self.assertTrue(self.fetch({'build': 'pkg-1.0-1'}))
+        fake_urlretrieve.assert_has_calls([
+            call('https://hub/task/1/log/pkg-1.0-1.tar.xz?format=raw', '/tmp/pkg-1.0-1.tar.xz'),
+            call('https://hub/task/1/log/pkg-1.0-1.tar.zst?format=raw', '/tmp/pkg-1.0-1.tar.zst'),
+        ])
+
+    @patch('osh.client.commands.shortcuts.urlretrieve')
+    def test_not_found(self, fake_urlretrieve):
+        fake_urlretrieve.side_effect = HTTPError('url', 404, 'Not Found', {}, None)
+        self.assertFalse(self.fetch({'build': 'pkg-1.0-1'}))
+        self.assertEqual(fake_urlretrieve.call_count, 2)
@@ -0,0 +1,66 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+import hashlib
+import io
+import json
+import lzma
+import os
+import tempfile
+import unittest
+
+from osh.common.manifest import (build_manifest, load_manifest, manifest_path,
+                                 write_manifest)
+from osh.tests.hub.service.test_archive import make_tarball
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.results = {
+            'scan': {'analyzer-version-gcc': '12.3.1', 'analyzer-version-cppcheck': '2.13'},
+            'defects': [{'checker': 'GCC_WARNING'}, {'checker': 'GCC_WARNING'},
+                        {'checker': 'CPPCHECK_WARNING'}],
+        }
+        self.files = {
+            'pkg-1.0/scan-results.js': json.dumps(self.results).encode(),
+            'pkg-1.0/debug/raw-results.js': b'{"defects": []}',
+            'pkg-1.0/logs/build.log': os.urandom(100 * 1024),
+        }
+        self.tarball = os.path.join(self.tmpdir.name, 'pkg-1.0.tar.xz')
+        with open(self.tarball, 'wb') as f:
+            f.write(lzma.compress(make_tarball(self.files)))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_build(self):
+        manifest = build_manifest(self.tarball)
+        self.assertEqual(set(manifest['files']), set(self.files))
+        for name, data in self.files.items():
+            self.assertEqual(manifest['files'][name], {
+                'size': len(data),
+                'sha256': hashlib.sha256(data).hexdigest(),
+            })
+        # only the top-level scan results are summarized
+        self.assertEqual(manifest['defects'], {'GCC_WARNING': 2, 'CPPCHECK_WARNING': 1})
+        self.assertEqual(manifest['analyzers'], {'gcc': '12.3.1', 'cppcheck': '2.13'})
+
+    def test_write_and_load(self):
+        path = write_manifest(build_manifest(self.tarball), self.tarball)
+        self.assertEqual(path, manifest_path(self.tarball))
+        with open(path) as f:
+            manifest = load_manifest(f)
+
+        with open(self.tarball, 'rb') as f:
+            data = f.read()
+        self.assertEqual(manifest['tarball'], {
+            'name': 'pkg-1.0.tar.xz',
+            'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(),
+        })
+
+    def test_invalid(self):
+        for data in ('[]', '{"version": 0}', '{"version": 1, "files": {}}'):
+            with self.assertRaises(ValueError):
+                load_manifest(io.StringIO(data))
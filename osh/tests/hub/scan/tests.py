@@ -3,10 +3,29 @@
 
 """`osh.hub.scan` tests."""
 
-from django.test import TestCase
+import datetime
+import os
+import pathlib
+import socket
+import time
+from unittest.mock import patch
 
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from kobo.hub.models import TASK_STATES, Task, Worker
+
+from osh.hub.osh_xmlrpc import worker
 from osh.hub.scan.compare import (CSS_CLASS_BASE, CSS_CLASS_OTHER,
                                   get_compare_title)
+from osh.hub.scan.models import (RESULTS_PROCESSING_STATES, SCAN_STATES,
+                                 Package, ResultsProcessing, Scan, ScanBinding,
+                                 ScanTree)
+from osh.hub.scan.results_queue import (claim_job, renew_lease, requeue_stale,
+                                        run_job)
+from osh.hub.waiving.models import Result
 
 
 class CompareTestSuite(TestCase):
@@ -259,3 +278,149 @@ class CompareTestSuite(TestCase):
                 f'<span class="{CSS_CLASS_BASE}">el8</span>'
             )
         )
+
+
+class ResultsQueueTestCase(TestCase):
+    def setUp(self):
+        fixture_path = pathlib.Path(__file__).parents[1] / 'waiving/fixtures/initial_test_data.json'
+        call_command('loaddata', fixture_path, verbosity=0)
+
+        self.request = RequestFactory().post('/xmlrpc/worker/')
+        self.request.user = get_user_model().objects.get(username='worker/localhost')
+        self.request.worker = Worker.objects.get(id=1)
+
+    @override_settings(ENABLE_ASYNC_RESULTS_PROCESSING=True)
+    @patch('osh.hub.scan.results_queue.send_task_notification')
+    @patch('osh.hub.scan.results_queue.process_task_results')
+    def test_finish_task_is_queued(self, process_task_results, send_task_notification):
+        process_task_results.side_effect = lambda task: time.sleep(2)
+
+        start = time.monotonic()
+        worker.finish_task(self.request, 2)
+        worker.email_task_notification(self.request, 2)
+        self.assertLess(time.monotonic() - start, 1)
+
+        # nothing is processed nor sent until the processor gets to it
+        job = ResultsProcessing.objects.get(task_id=2)
+        self.assertEqual(job.state, RESULTS_PROCESSING_STATES['QUEUED'])
+        self.assertTrue(job.notify)
+        process_task_results.assert_not_called()
+        send_task_notification.assert_not_called()
+
+        run_job(claim_job())
+        job.refresh_from_db()
+        self.assertEqual(job.state, RESULTS_PROCESSING_STATES['DONE'])
+        self.assertEqual(job.attempts, 1)
+        process_task_results.assert_called_once_with(job.task)
+        send_task_notification.assert_called_once()
+        self.assertIsNone(claim_job())
+
+    @override_settings(ENABLE_ASYNC_RESULTS_PROCESSING=True, RESULTS_PROCESSING_MAX_ATTEMPTS=2)
+    @patch('osh.hub.scan.results_queue.process_task_results')
+    def test_failed_processing_is_retried(self, process_task_results):
+        process_task_results.side_effect = OSError('disk full')
+        worker.finish_task(self.request, 2)
+        # kobo closes the task once finish_task() returns
+        Task.objects.filter(id=2).update(state=TASK_STATES['CLOSED'])
+
+        job = claim_job()
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.state, RESULTS_PROCESSING_STATES['QUEUED'])
+        self.assertIn('disk full', job.error)
+        # postponed until the retry delay passes
+        self.assertIsNone(claim_job())
+
+        ResultsProcessing.objects.update(date_retry=None)
+        run_job(claim_job())
+        job.refresh_from_db()
+        self.assertEqual(job.state, RESULTS_PROCESSING_STATES['FAILED'])
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(Task.objects.get(id=2).state, TASK_STATES['FAILED'])
+
+    @override_settings(ENABLE_ASYNC_RESULTS_PROCESSING=True, RESULTS_PROCESSING_LEASE=60)
+    def test_requeue_stale(self):
+        worker.finish_task(self.request, 2)
+        job = claim_job()
+        self.assertEqual(job.processor, '%s:%d' % (socket.gethostname(), os.getpid()))
+
+        # the lease of a live processor is not taken over by others
+        self.assertEqual(requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.state, RESULTS_PROCESSING_STATES['RUNNING'])
+
+        # the processor got killed and stopped renewing its lease
+        expired = datetime.datetime.now() - datetime.timedelta(seconds=61)
+        ResultsProcessing.objects.filter(id=job.id).update(processor='dead:1', date_heartbeat=expired)
+        self.assertEqual(renew_lease(), 0)
+        self.assertEqual(requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.state, RESULTS_PROCESSING_STATES['QUEUED'])
+        self.assertEqual(job.processor, "")
+        self.assertEqual(claim_job().id, job.id)
+
+    @patch('osh.hub.scan.results_queue.process_task_results')
+    def test_finish_task_sync(self, process_task_results):
+        worker.finish_task(self.request, 2)
+        process_task_results.assert_called_once()
+        self.assertEqual(ResultsProcessing.objects.get(task_id=2).state,
+                         RESULTS_PROCESSING_STATES['DONE'])
+
+
+class ScanTreeTestCase(TestCase):
+    """
+    Scan tree displayed on the page of a package
+    """
+
+    def setUp(self):
+        fixture_path = pathlib.Path(__file__).parents[1] / 'waiving/fixtures/initial_test_data.json'
+        call_command('loaddata', fixture_path, verbosity=0)
+        self.package = Package.objects.get(id=1)
+        self.last = Scan.objects.get(id=1)
+        self.last.state = SCAN_STATES['NEEDS_INSPECTION']
+        self.last.save()
+
+    def add_respins(self, count):
+        """ add `count` respins to the end of the chain of scans """
+        for i in range(count):
+            respin = self.last.clone_scan()
+            respin.nvr = 'python-six-1.9.0-%d.respin.el7' % respin.id
+            respin.state = SCAN_STATES['PASSED']
+            respin.save()
+            ScanBinding.objects.create(scan=respin, result=Result.objects.create(
+                new_defects_counter=respin.id, fixed_defects_counter=1))
+            self.last.parent = respin
+            self.last.save()
+            self.last = respin
+
+    def test_query_count_does_not_depend_on_scans(self):
+        self.add_respins(2)
+        with CaptureQueriesContext(connection) as small:
+            self.package.display_scan_tree()
+
+        self.add_respins(100)
+        with CaptureQueriesContext(connection) as large:
+            tree = self.package.display_scan_tree()
+        self.assertEqual(len(large), len(small))
+
+        self.assertEqual(tree.count('╰──'), 102)
+        self.assertIn('%s</a> (PASSED) New defects: %d, fixed defects: 1' % (
+            self.last.nvr, self.last.id), tree)
+        self.assertIn('python-six-1.9.0-2.el7</a> (NEEDS_INSPECTION)</div>', tree)
+
+    def test_cached_tree(self):
+        self.add_respins(2)
+        tree = self.package.display_scan_tree()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.package.display_scan_tree(), tree)
+
+        # changed state of a scan
+        self.last.state = SCAN_STATES['WAIVED']
+        self.last.save()
+        self.assertFalse(ScanTree.objects.filter(package=self.package).exists())
+        self.assertIn('%s</a> (WAIVED)' % self.last.nvr, self.package.display_scan_tree())
+
+        # changed counters of defects
+        self.last.scanbinding.result.count_defects()
+        self.assertIn('%s</a> (WAIVED) New defects: 0' % self.last.nvr,
+                      self.package.display_scan_tree())
@@ -0,0 +1,206 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+import gzip
+import io
+import lzma
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from osh.hub.service.archive import (ExcludeMatcher, ParallelXzReader,
+                                     ResultsArchive, has_random_access,
+                                     index_path, iter_members,
+                                     open_decompressed, read_xz_block_map)
+from osh.hub.service.csmock_parser import ResultsExtractor
+
+
+def make_tarball(files):
+    """return uncompressed tar stream with `files` (dict name: content)"""
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tf:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+class TestResultsArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.files = {
+            'pkg-1.0/scan-results.js': b'{"defects": []}\n',
+            'pkg-1.0/scan-results-summary.txt': b'no defects\n',
+            'pkg-1.0/debug/huge.log': b'x' * 1000,
+        }
+        # incompressible logs spanning multiple xz blocks
+        for i in range(8):
+            self.files['pkg-1.0/logs/%d.log' % i] = os.urandom(100 * 1024)
+        self.tar = make_tarball(self.files)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def check_members(self, archive):
+        self.assertNotIn('pkg-1.0/debug/huge.log', archive)
+        for name, data in self.files.items():
+            if name in archive:
+                self.assertEqual(archive.read(name), data)
+                self.assertEqual(archive.open(name, offset=5).read(), data[5:])
+                self.assertEqual(archive.getsize(name), len(data))
+
+    def test_single_block(self):
+        path = self.write('results.tar.xz', lzma.compress(self.tar))
+        archive = ResultsArchive.create(path)
+        self.assertEqual(len(archive.index['blocks']), 1)
+        self.check_members(archive)
+
+    def test_multiple_blocks(self):
+        # concatenated xz streams, each of them containing a single block
+        chunk = 64 * 1024
+        data = b''.join(lzma.compress(self.tar[i:i + chunk])
+                        for i in range(0, len(self.tar), chunk))
+        path = self.write('results.tar.xz', data + b'\0' * 4)
+
+        blocks = read_xz_block_map(path)
+        self.assertEqual(len(blocks), (len(self.tar) + chunk - 1) // chunk)
+        self.assertEqual(sum(block[4] for block in blocks), len(self.tar))
+
+        archive = ResultsArchive.create(path)
+        self.check_members(archive)
+
+    def test_no_block_map(self):
+        path = self.write('results.tar', self.tar)
+        self.assertIsNone(read_xz_block_map(path))
+        self.check_members(ResultsArchive.create(path))
+
+    @unittest.skipUnless(shutil.which('zstd'), 'zstd not available')
+    def test_zstd(self):
+        path = self.write('results.tar.zst', subprocess.run(
+            ['zstd', '-q', '-c'], input=self.tar, stdout=subprocess.PIPE, check=True).stdout)
+        self.assertIsNone(read_xz_block_map(path))
+        archive = ResultsArchive.create(path)
+        self.check_members(archive)
+        names = [member.name for _, member in iter_members(path, ['debug'])]
+        self.assertEqual(names, archive.names())
+
+    def test_random_access(self):
+        self.assertTrue(has_random_access(self.write('results.tar', self.tar)))
+        path = self.write('results.tar.xz', lzma.compress(self.tar))
+        self.assertTrue(has_random_access(path))
+        with patch('osh.hub.service.archive.MAX_RANDOM_ACCESS_BLOCK_SIZE', 64 * 1024):
+            self.assertFalse(has_random_access(path))
+        self.assertFalse(has_random_access(self.write('results.tar.gz', gzip.compress(self.tar))))
+
+    def test_index_is_reused(self):
+        path = self.write('results.tar.xz', lzma.compress(self.tar))
+        ResultsArchive.create(path, ['logs'])
+        self.assertTrue(os.path.exists(index_path(path)))
+
+        archive = ResultsArchive(path)
+        self.assertEqual(archive.names(), ['pkg-1.0/scan-results.js',
+                                           'pkg-1.0/scan-results-summary.txt'])
+        self.assertEqual(archive.glob('*/scan-results.js'), ['pkg-1.0/scan-results.js'])
+        self.assertEqual(archive.glob('*.js'), [])
+
+    def test_extract(self):
+        path = self.write('results.tar.xz', lzma.compress(self.tar))
+        archive = ResultsArchive.create(path)
+        out = archive.extract('pkg-1.0/scan-results.js', self.tmpdir.name)
+        self.assertEqual(out, os.path.join(self.tmpdir.name, 'pkg-1.0', 'scan-results.js'))
+        with open(out, 'rb') as f:
+            self.assertEqual(f.read(), self.files['pkg-1.0/scan-results.js'])
+        # nothing else has been extracted
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir.name, 'pkg-1.0')), ['scan-results.js'])
+
+
+class TestParallelDecompression(unittest.TestCase):
+    def setUp(self):
+        self.data = b''.join(os.urandom(1024) * 64 for _ in range(20))
+        chunk = 100 * 1024
+        self.xz = b''.join(lzma.compress(self.data[i:i + chunk])
+                           for i in range(0, len(self.data), chunk))
+
+    def test_multiple_blocks(self):
+        f = io.BytesIO(self.xz)
+        with open_decompressed(f, threads=4) as stream:
+            self.assertIsInstance(stream.raw, ParallelXzReader)
+            self.assertEqual(stream.read(), self.data)
+
+    def test_single_block(self):
+        f = io.BytesIO(lzma.compress(self.data))
+        with open_decompressed(f, threads=4) as stream:
+            self.assertIsInstance(stream, lzma.LZMAFile)
+            self.assertEqual(stream.read(), self.data)
+
+    def test_serial(self):
+        with open_decompressed(io.BytesIO(self.xz), threads=1) as stream:
+            self.assertIsInstance(stream, lzma.LZMAFile)
+            self.assertEqual(stream.read(), self.data)
+
+    def test_corrupted_block(self):
+        xz = bytearray(self.xz)
+        xz[len(xz) // 2] ^= 0xff
+        with open_decompressed(io.BytesIO(bytes(xz)), threads=4) as stream:
+            with self.assertRaises(lzma.LZMAError):
+                stream.read()
+
+    def test_tarball(self):
+        files = {'pkg/%d.log' % i: os.urandom(50 * 1024) for i in range(10)}
+        tar = make_tarball(files)
+        with tempfile.NamedTemporaryFile(suffix='.tar.xz') as f:
+            for i in range(0, len(tar), 64 * 1024):
+                f.write(lzma.compress(tar[i:i + 64 * 1024]))
+            f.flush()
+            names = [member.name for _, member in iter_members(f.name, threads=3)]
+        self.assertEqual(names, list(files))
+
+
+class TestExcludeMatcher(unittest.TestCase):
+    def test_components(self):
+        is_excluded = ExcludeMatcher(['*debug', 'raw-results'])
+        self.assertTrue(is_excluded('pkg/debug'))
+        self.assertTrue(is_excluded('pkg/debug/'))
+        self.assertTrue(is_excluded('pkg/rpmdebug/file.c'))
+        self.assertTrue(is_excluded('pkg/raw-results/gcc/out.txt'))
+        self.assertFalse(is_excluded('pkg/debugging/file.c'))
+        self.assertFalse(is_excluded('pkg/raw-results.txt'))
+
+    def test_no_patterns(self):
+        self.assertFalse(ExcludeMatcher([])('pkg/debug'))
+
+
+class TestResultsExtractor(unittest.TestCase):
+    def test_single_pass(self):
+        files = {
+            'pkg-1.0/scan-results.js': b'{}',
+            'pkg-1.0/raw-results/gcc.log': b'gcc',
+            'pkg-1.0/debug/huge.log': b'x' * 1000,
+            'pkg-1.0/logs/build.log': b'build',
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'results.tar.xz')
+            with open(path, 'wb') as f:
+                f.write(lzma.compress(make_tarball(files)))
+
+            rex = ResultsExtractor(path, output_dir=tmpdir, unpack_in_temp=False)
+            # the members must not be listed in advance
+            with patch.object(tarfile.TarFile, 'getmembers', side_effect=AssertionError):
+                rex.extract_tarball(['raw-results'])
+
+            extracted = sorted(os.path.relpath(os.path.join(root, name), tmpdir)
+                               for root, _, names in os.walk(tmpdir) for name in names)
+            self.assertEqual(extracted, ['pkg-1.0/logs/build.log',
+                                         'pkg-1.0/scan-results.js',
+                                         'results.tar.xz'])
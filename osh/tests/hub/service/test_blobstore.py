@@ -0,0 +1,115 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from osh.hub.service.blobstore import BlobStore, file_digest, unshare
+
+
+class TestBlobStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = BlobStore(os.path.join(self.tmpdir.name, '.blobs'), min_size=16)
+        self.log = os.urandom(64 * 1024)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_task(self, task_id, files):
+        task_dir = os.path.join(self.tmpdir.name, str(task_id))
+        for name, data in files.items():
+            path = os.path.join(task_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+        return task_dir
+
+    def test_store(self):
+        first = self.write_task(1, {'build.log': self.log})
+        second = self.write_task(2, {'build.log': self.log})
+
+        digest = self.store.store(os.path.join(first, 'build.log'))
+        self.assertEqual(digest, file_digest(os.path.join(second, 'build.log')))
+        self.assertEqual(self.store.store(os.path.join(second, 'build.log')), digest)
+
+        blob = os.stat(self.store.blob_path(digest))
+        self.assertEqual(blob.st_nlink, 3)
+        self.assertTrue(os.path.samestat(blob, os.stat(os.path.join(second, 'build.log'))))
+
+        # storing the same file again is a no-op
+        self.store.store(os.path.join(second, 'build.log'))
+        self.assertEqual(os.stat(self.store.blob_path(digest)).st_nlink, 3)
+        self.assertEqual(os.listdir(second), ['build.log'])
+
+    def test_corrupted_blob(self):
+        first = self.write_task(1, {'build.log': self.log})
+        digest = self.store.store(os.path.join(first, 'build.log'))
+
+        # rewritten in place, the size is the same
+        with open(os.path.join(first, 'build.log'), 'r+b') as f:
+            f.write(b'corrupted')
+
+        second = self.write_task(2, {'build.log': self.log})
+        self.assertEqual(self.store.store(os.path.join(second, 'build.log')), digest)
+        self.assertEqual(file_digest(self.store.blob_path(digest)), digest)
+        self.assertEqual(os.stat(os.path.join(second, 'build.log')).st_nlink, 2)
+
+    def test_unshare(self):
+        first = self.write_task(1, {'build.log': self.log})
+        second = self.write_task(2, {'build.log': self.log})
+        self.store.store_tree(first)
+        self.store.store_tree(second)
+
+        path = os.path.join(second, 'build.log')
+        unshare(path)
+        self.assertEqual(os.stat(path).st_nlink, 1)
+        with open(path, 'ab') as f:
+            f.write(b'appended')
+
+        # neither the blob nor the other task are affected
+        with open(os.path.join(first, 'build.log'), 'rb') as f:
+            self.assertEqual(f.read(), self.log)
+        self.assertEqual(os.stat(os.path.join(first, 'build.log')).st_nlink, 2)
+        self.assertEqual(os.listdir(second), ['build.log'])
+
+    def test_small_files(self):
+        task_dir = self.write_task(1, {'small': b'x'})
+        self.assertIsNone(self.store.store(os.path.join(task_dir, 'small')))
+        self.assertFalse(os.path.exists(self.store.root))
+
+    def test_store_tree(self):
+        files = {
+            'pkg/scan-results.js': b'{"defects": []}' * 100,
+            'pkg/build.log': self.log,
+            'added.js': b'{"defects": []}' * 100,
+        }
+        self.assertEqual(self.store.store_tree(self.write_task(1, files), ['added.*']), 0)
+        saved = self.store.store_tree(self.write_task(2, files), ['added.*'])
+        self.assertEqual(saved, len(self.log) + 1500)
+
+        stats = self.store.stats()
+        self.assertEqual(stats['blobs'], 2)
+        self.assertEqual(stats['referenced_bytes'], 2 * stats['stored_bytes'])
+
+        # hub generated files are never shared
+        self.assertEqual(os.stat(os.path.join(self.tmpdir.name, '2', 'added.js')).st_nlink, 1)
+
+    def test_collect_garbage(self):
+        shared = {'build.log': self.log}
+        first = self.write_task(1, dict(shared, own=os.urandom(1024)))
+        second = self.write_task(2, shared)
+        self.store.store_tree(first)
+        self.store.store_tree(second)
+
+        # the shared blob is kept until the last task is removed
+        shutil.rmtree(first)
+        self.assertEqual(self.store.collect_garbage(), (1, 1024))
+        with open(os.path.join(second, 'build.log'), 'rb') as f:
+            self.assertEqual(f.read(), self.log)
+
+        shutil.rmtree(second)
+        self.assertEqual(self.store.collect_garbage(), (1, len(self.log)))
+        self.assertEqual(self.store.stats()['blobs'], 0)
@@ -1,9 +1,18 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
 import unittest
 
-from osh.hub.service.csmock_parser import parse_elapsed_time
+from osh.hub.service.csmock_parser import (CsmockAPI, iter_json_results,
+                                           parse_elapsed_time)
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..'))
 
 
 class TestParseElapsedTime(unittest.TestCase):
@@ -21,3 +30,101 @@ class TestParseElapsedTime(unittest.TestCase):
 
     def test_large_hours(self):
         self.assertEqual(parse_elapsed_time("100:00:00"), 360000)
+
+
+def write_results(path, defects_count, scan_first=True):
+    """write synthetic csmock results without holding them in memory"""
+    scan = json.dumps({'tool': 'csmock', 'analyzer-version-gcc': '14.2.1'})
+    with open(path, 'w') as f:
+        f.write('{\n')
+        if scan_first:
+            f.write('    "scan": %s,\n' % scan)
+        f.write('    "defects": [')
+        for i in range(defects_count):
+            if i:
+                f.write(',')
+            json.dump({
+                'checker': 'CHECKER_%d' % (i % 10),
+                'key_event_idx': 0,
+                'cwe': 476,
+                'events': [{
+                    'file_name': 'src/file_%d.c' % i,
+                    'line': i,
+                    'event': 'warning',
+                    'message': 'synthetic defect – #%d %s' % (i, 'x' * 512),
+                }],
+            }, f, indent=4)
+        f.write(']')
+        if not scan_first:
+            f.write(',\n    "scan": %s' % scan)
+        f.write('\n}\n')
+
+
+class TestStreamingCsmockAPI(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'scan-results.js')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_same_as_json_load(self):
+        write_results(self.path, 100)
+        with open(self.path) as f:
+            expected = json.load(f)
+
+        api = CsmockAPI(self.path, streaming=True)
+        self.assertEqual(api.get_scan_metadata(), expected['scan'])
+        self.assertEqual(list(api.get_defects()), expected['defects'])
+        self.assertEqual(api.get_analyzers(), [{'name': 'gcc', 'version': '14.2.1'}])
+
+    def test_scan_after_defects(self):
+        write_results(self.path, 3, scan_first=False)
+        api = CsmockAPI(self.path, streaming=True)
+        self.assertEqual(api.get_scan_metadata()['tool'], 'csmock')
+        self.assertEqual(len(list(api.get_defects())), 3)
+
+    def test_small_chunks(self):
+        write_results(self.path, 20)
+        with open(self.path) as f:
+            expected = json.load(f)
+        # values spanning many chunks must be decoded correctly
+        with open(self.path) as f:
+            items = list(iter_json_results(f, chunk_size=7))
+        self.assertEqual([v for k, v in items if k == 'defects'], expected['defects'])
+
+    def test_empty(self):
+        with open(self.path, 'w') as f:
+            f.write('{"scan": {}, "defects": []}')
+        api = CsmockAPI(self.path, streaming=True)
+        self.assertEqual(list(api.get_defects()), [])
+        self.assertEqual(api.get_scan_metadata(), {})
+
+    def test_truncated(self):
+        with open(self.path, 'w') as f:
+            f.write('{"scan": {}, "defects": [{"checker": "A"}, {"chec')
+        with self.assertRaises(ValueError):
+            list(CsmockAPI(self.path, streaming=True).get_defects())
+
+    def test_peak_rss(self):
+        """streaming a multi-hundred-MB file must keep the memory bounded"""
+        write_results(self.path, 300 * 1024)
+        size = os.path.getsize(self.path)
+        self.assertGreater(size, 200 * 1024 * 1024)
+
+        # measure the peak RSS of a fresh interpreter parsing the results
+        script = textwrap.dedent('''
+            import resource, sys
+            from osh.hub.service.csmock_parser import CsmockAPI
+            base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            api = CsmockAPI(sys.argv[1], streaming=True)
+            count = sum(1 for _ in api.get_defects())
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            print(count, (peak - base) * 1024)
+        ''')
+        out = subprocess.check_output([sys.executable, '-c', script, self.path],
+                                      cwd=ROOT_DIR, text=True)
+        count, rss_growth = map(int, out.split())
+
+        self.assertEqual(count, 300 * 1024)
+        self.assertLess(rss_growth, 32 * 1024 * 1024)
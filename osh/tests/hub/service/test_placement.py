@@ -0,0 +1,152 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+import collections
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from osh.hub.service.blobstore import BlobStore
+from osh.hub.service.placement import (VOLUME_BLOB_STORE, FreeSpacePlacement,
+                                       TaskDirPlacement, relative_task_dir)
+
+
+class TestTaskDirPlacement(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.task_root = os.path.join(self.tmpdir.name, 'tasks')
+        self.volumes = [os.path.join(self.tmpdir.name, 'vol%d' % i) for i in range(3)]
+        for volume in self.volumes:
+            os.mkdir(volume)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, task_dir, name, data='log'):
+        with open(os.path.join(task_dir, name), 'w') as f:
+            f.write(data)
+
+    def test_layout(self):
+        self.assertEqual(relative_task_dir(1234567), '1000000/1230000/1234567')
+        placement = TaskDirPlacement(self.task_root, [])
+        task_dir = placement.task_dir(1234567, create=True)
+        self.assertEqual(task_dir, os.path.join(self.task_root, '1000000/1230000/1234567'))
+        self.assertTrue(os.path.isdir(task_dir))
+        self.assertFalse(os.path.islink(task_dir))
+
+    def test_hash(self):
+        placement = TaskDirPlacement(self.task_root, self.volumes)
+        counts = collections.Counter()
+        for task_id in range(1, 301):
+            task_dir = placement.task_dir(task_id, create=True)
+            self.write(task_dir, 'stdout.log')
+
+            volume = placement.volume_of(task_id)
+            self.assertEqual(volume, placement.target_volume(task_id))
+            self.assertTrue(os.path.isfile(os.path.join(volume, relative_task_dir(task_id),
+                                                        'stdout.log')))
+            # lookups do not depend on the placement
+            self.assertEqual(task_dir, placement.link_path(task_id))
+            counts[volume] += 1
+
+        self.assertEqual(set(counts), set(self.volumes))
+        self.assertTrue(all(count > 50 for count in counts.values()))
+
+        # the task dir stays where it is
+        placement.task_dir(1, create=True)
+        self.assertEqual(placement.volume_of(1), placement.target_volume(1))
+
+    def test_free_space(self):
+        def statvfs(path):
+            free = 1000 if path == self.volumes[1] else 10
+            return os.statvfs_result((4096, 4096, 0, 0, free, 0, 0, 0, 0, 255))
+
+        placement = TaskDirPlacement(self.task_root, self.volumes, 'free-space')
+        self.assertIsInstance(placement.strategy, FreeSpacePlacement)
+        with patch('os.statvfs', side_effect=statvfs):
+            placement.task_dir(42, create=True)
+        self.assertEqual(placement.volume_of(42), self.volumes[1])
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            TaskDirPlacement(self.task_root, self.volumes, 'random')
+
+    def test_rebalance(self):
+        # task dirs created before the volumes have been configured
+        legacy = TaskDirPlacement(self.task_root, [])
+        for task_id in range(1, 11):
+            task_dir = legacy.task_dir(task_id, create=True)
+            self.write(task_dir, 'stdout.log', str(task_id))
+
+        # a volume has been added
+        placement = TaskDirPlacement(self.task_root, self.volumes[:2])
+        self.assertEqual(len(placement.rebalance(range(1, 11))), 10)
+
+        placement = TaskDirPlacement(self.task_root, self.volumes)
+        moved = placement.rebalance(range(1, 12), dry_run=True)
+        self.assertTrue(all(volume == self.volumes[2] for _, volume in moved))
+        self.assertEqual(placement.rebalance(range(1, 12)), moved)
+        self.assertEqual(placement.rebalance(range(1, 12)), [])
+
+        for task_id in range(1, 11):
+            self.assertEqual(placement.volume_of(task_id), placement.target_volume(task_id))
+            with open(os.path.join(placement.link_path(task_id), 'stdout.log')) as f:
+                self.assertEqual(f.read(), str(task_id))
+
+        # nothing is left behind
+        leftovers = [name for volume in self.volumes[:2] for _, _, names in os.walk(volume)
+                     for name in names]
+        self.assertEqual(len(leftovers), 10 - len(moved))
+
+    def test_rebalance_keeps_files_shared(self):
+        # task dirs in TASK_DIR share their logs through its blob store
+        legacy = TaskDirPlacement(self.task_root, [])
+        store = BlobStore(os.path.join(self.tmpdir.name, 'blobs'), min_size=16)
+        log = os.urandom(64 * 1024)
+        for task_id in range(1, 11):
+            task_dir = legacy.task_dir(task_id, create=True)
+            self.write(task_dir, 'build.log', log.hex())
+            self.write(task_dir, 'own.log', os.urandom(64 * 1024).hex())
+            store.store(os.path.join(task_dir, 'build.log'))
+
+        placement = TaskDirPlacement(self.task_root, self.volumes, deduplicate=True)
+        moved = placement.rebalance(range(1, 11))
+        self.assertEqual(len(moved), 10)
+
+        per_volume = collections.Counter(volume for _, volume in moved)
+        for task_id, volume in moved:
+            task_dir = placement.link_path(task_id)
+            # linked from the blob store of the volume and the other task dirs on it
+            st = os.stat(os.path.join(task_dir, 'build.log'))
+            self.assertEqual(st.st_nlink, per_volume[volume] + 1)
+            self.assertEqual(os.stat(os.path.join(task_dir, 'own.log')).st_nlink, 1)
+            blobs = BlobStore(os.path.join(volume, VOLUME_BLOB_STORE)).stats()
+            self.assertEqual(blobs['blobs'], 1)
+
+        # the blobs of TASK_DIR are no longer linked from any task dir
+        self.assertEqual(store.collect_garbage(), (1, 2 * len(log)))
+
+    def test_interrupted_move(self):
+        TaskDirPlacement(self.task_root, self.volumes[:1]).task_dir(1, create=True)
+        placement = TaskDirPlacement(self.task_root, self.volumes[:2])
+        self.write(placement.link_path(1), 'stdout.log', 'new')
+
+        # the task dir was copied, but the move got interrupted before
+        # the symlink in TASK_DIR was switched
+        with patch.object(placement, '_link', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                placement.move(1, self.volumes[1])
+        self.assertEqual(placement.volume_of(1), self.volumes[0])
+
+        # the task dir has changed in the meantime
+        self.write(placement.link_path(1), 'stdout.log', 'newer')
+        placement.move(1, self.volumes[1])
+        self.assertEqual(placement.volume_of(1), self.volumes[1])
+        with open(os.path.join(placement.link_path(1), 'stdout.log')) as f:
+            self.assertEqual(f.read(), 'newer')
+
+        # neither the source nor the stale copy is left behind
+        for volume in self.volumes[:2]:
+            self.assertEqual(os.listdir(os.path.dirname(os.path.join(volume, relative_task_dir(1)))),
+                             [] if volume == self.volumes[0] else ['1'])
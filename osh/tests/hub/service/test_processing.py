@@ -0,0 +1,87 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+import json
+import time
+import unittest
+from unittest.mock import patch
+
+from osh.hub.service.processing import diff_scans, render_reports
+
+
+def defect(checker, file_name, line, message):
+    return {
+        'checker': checker,
+        'key_event_idx': 0,
+        'events': [{
+            'file_name': file_name,
+            'line': line,
+            'event': 'error',
+            'message': message,
+            'verbosity_level': 0,
+        }],
+    }
+
+
+def results(*defects):
+    return json.dumps({'scan': {}, 'defects': list(defects)})
+
+
+def fail():
+    raise RuntimeError("renderer crashed")
+
+
+class TestRenderReports(unittest.TestCase):
+    def test_failure_isolation(self):
+        result = render_reports([
+            ('ok', lambda: True, ()),
+            ('none', lambda: None, ()),
+            ('false', lambda: False, ()),
+            ('raises', fail, ()),
+        ])
+        self.assertEqual(result, {'ok': True, 'none': True, 'false': False, 'raises': False})
+
+    def test_concurrency(self):
+        start = time.monotonic()
+        result = render_reports([(str(i), time.sleep, (0.5,)) for i in range(4)], max_workers=4)
+        self.assertTrue(all(result.values()))
+        # the latency is close to the slowest job, not the sum of all of them
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_empty(self):
+        self.assertEqual(render_reports([]), {})
+
+
+class TestDiffScans(unittest.TestCase):
+    def test_ignore_path(self):
+        old = results(defect('COMPILER_WARNING', 'src/lib/foo.c', 12, 'unused variable'))
+        new = results(defect('COMPILER_WARNING', 'lib/foo.c', 12, 'unused variable'))
+        added, fixed = diff_scans(old, new)
+        self.assertEqual(added['defects'], [])
+        self.assertEqual(fixed['defects'], [])
+
+    def test_original_paths(self):
+        old = results(defect('COMPILER_WARNING', 'src/lib/foo.c', 12, 'unused variable'))
+        new = results(defect('COMPILER_WARNING', 'lib/foo.c', 12, 'unused variable'),
+                      defect('SHELLCHECK_WARNING', 'scripts/build.sh', 3, 'quote this'))
+        added, fixed = diff_scans(old, new)
+        self.assertEqual([d['events'][0]['file_name'] for d in added['defects']],
+                         ['scripts/build.sh'])
+        self.assertEqual(fixed['defects'], [])
+
+    @patch('osh.hub.service.processing.pycsdiff')
+    def test_unmapped_defects(self, pycsdiff):
+        # defects printed in other than their original order can't be mapped
+        def reversed_diff(old, new):
+            diff = json.loads(new)
+            diff['defects'].reverse()
+            return json.dumps(diff)
+        pycsdiff.diff_scans.side_effect = reversed_diff
+
+        new = results(defect('COMPILER_WARNING', 'lib/foo.c', 12, 'unused variable'),
+                      defect('SHELLCHECK_WARNING', 'scripts/build.sh', 3, 'quote this'))
+        added, _ = diff_scans(results(), new)
+        # diffed again without stripping the paths
+        self.assertEqual(pycsdiff.diff_scans.call_count, 4)
+        self.assertEqual([d['events'][0]['file_name'] for d in added['defects']],
+                         ['scripts/build.sh', 'lib/foo.c'])
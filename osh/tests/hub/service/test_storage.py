@@ -0,0 +1,147 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+import importlib.util
+import lzma
+import os
+import tempfile
+import unittest
+
+from osh.hub.service.archive import ResultsArchive, index_path
+from osh.hub.service.storage import LocalStorage, create_storage
+from osh.tests.hub.service.test_archive import make_tarball
+
+HAS_MOTO = all(importlib.util.find_spec(name) for name in ('boto3', 'moto'))
+
+
+class StorageTests:
+    """ tests common to all backends, `self.storage` is set up by subclasses """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.log = os.urandom(3 * 1024 ** 2 + 17)
+        self.files = {
+            '0/0/1/stdout.log': self.log,
+            '0/0/1/pkg-1.0/scan-results.js': b'{}',
+            '0/0/1/pkg-1.0/raw/gcc.log': b'gcc',
+            '0/0/2/stdout.log': b'other task',
+        }
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def put_files(self):
+        for key, data in self.files.items():
+            path = os.path.join(self.tmpdir.name, 'upload', key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+            self.storage.put(key, path)
+
+    def test_glob(self):
+        self.put_files()
+        self.assertEqual(self.storage.glob('0/0/1/*'), ['0/0/1/stdout.log'])
+        self.assertEqual(self.storage.glob('0/0/1/*/scan-results.js'),
+                         ['0/0/1/pkg-1.0/scan-results.js'])
+        self.assertEqual(self.storage.glob('0/0/*/stdout.log'),
+                         ['0/0/1/stdout.log', '0/0/2/stdout.log'])
+        self.assertEqual(self.storage.glob('0/0/3/*'), [])
+
+    def test_read(self):
+        self.put_files()
+        self.assertTrue(self.storage.exists('0/0/1/stdout.log'))
+        self.assertFalse(self.storage.exists('0/0/1/missing.log'))
+        self.assertEqual(self.storage.stat('0/0/1/stdout.log')[0], len(self.log))
+        self.assertEqual(self.storage.read('0/0/2/stdout.log'), b'other task')
+
+        with self.storage.open('0/0/1/stdout.log', offset=1000) as f:
+            self.assertEqual(f.read(10), self.log[1000:1010])
+            f.seek(len(self.log) - 5)
+            self.assertEqual(f.read(), self.log[-5:])
+
+        with open(self.storage.local_path('0/0/1/pkg-1.0/scan-results.js'), 'rb') as f:
+            self.assertEqual(f.read(), b'{}')
+
+    def test_delete(self):
+        self.put_files()
+        self.storage.delete('0/0/2/stdout.log')
+        self.assertFalse(self.storage.exists('0/0/2/stdout.log'))
+        self.storage.delete_prefix('0/0/1')
+        self.assertEqual(self.storage.glob('0/0/*/*'), [])
+
+    def test_archive(self):
+        files = {'pkg/scan-results.js': b'{"defects": []}',
+                 'pkg/logs/build.log': os.urandom(200 * 1024)}
+        path = os.path.join(self.tmpdir.name, 'upload', 'results.tar.xz')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(lzma.compress(make_tarball(files)))
+        ResultsArchive.create(path)
+        self.storage.put('0/0/1/results.tar.xz', path)
+        self.storage.put(index_path('0/0/1/results.tar.xz'), index_path(path))
+
+        archive = ResultsArchive('0/0/1/results.tar.xz', self.storage)
+        self.assertEqual(archive.names(), list(files))
+        for name, data in files.items():
+            self.assertEqual(archive.read(name), data)
+        self.assertEqual(archive.open('pkg/logs/build.log', offset=1000).read(),
+                         files['pkg/logs/build.log'][1000:])
+
+
+class TestLocalStorage(StorageTests, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = create_storage({'BACKEND': 'local'}, os.path.join(self.tmpdir.name, 'tasks'))
+
+    def test_outside_of_root(self):
+        with self.assertRaises(ValueError):
+            self.storage.path('../secret')
+
+
+@unittest.skipUnless(HAS_MOTO, 'boto3 and moto are not available')
+class TestS3Storage(StorageTests, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from moto.server import ThreadedMotoServer
+
+        # S3 compatible server running locally
+        cls.server = ThreadedMotoServer(port=0)
+        cls.server.start()
+        host, port = cls.server.get_host_and_port()
+        cls.endpoint_url = 'http://%s:%d' % (host, port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        super().setUp()
+        self.storage = create_storage({
+            'BACKEND': 's3',
+            'BUCKET': 'osh-results',
+            'PREFIX': 'tasks/',
+            'ENDPOINT_URL': self.endpoint_url,
+            'AWS_ACCESS_KEY_ID': 'testing',
+            'AWS_SECRET_ACCESS_KEY': 'testing',
+            'REGION_NAME': 'us-east-1',
+        }, os.path.join(self.tmpdir.name, 'cache'))
+        self.storage.client.create_bucket(Bucket='osh-results')
+
+    def tearDown(self):
+        self.storage.delete_prefix('0')
+        self.storage.client.delete_bucket(Bucket='osh-results')
+        super().tearDown()
+
+    def test_remote_reads(self):
+        self.put_files()
+        # the local copy is not used for ranged reads
+        LocalStorage(self.storage.cache.root).delete_prefix('0')
+        with self.storage.open('0/0/1/stdout.log', offset=5) as f:
+            self.assertEqual(f.read(), self.log[5:])
+        self.assertEqual(self.storage.glob('0/0/1/*'), ['0/0/1/stdout.log'])
+
+        # downloaded to the cache on demand
+        path = self.storage.local_path('0/0/1/stdout.log')
+        self.assertTrue(path.startswith(self.storage.cache.root))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.log)
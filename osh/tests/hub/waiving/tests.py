@@ -1,10 +1,52 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import contextlib
+import io
+import os
 import pathlib
+from unittest.mock import MagicMock, patch
 
-from django.core.management import call_command
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from kobo.hub.models import Task
+
+from osh.common.constants import ERROR_DIFF_FILE, ERROR_HTML_FILE
+from osh.hub.scan.models import (RESULTS_STAGES, ResolvedResultPaths,
+                                 ResultsCheckpoint, Scan, ScanBinding)
+from osh.hub.service.path import TaskResultPaths
+from osh.hub.waiving.models import (DEFECT_STATES, RESULT_GROUP_STATES,
+                                    WAIVER_TYPES, Checker, CheckerGroup,
+                                    Defect, LatestWaiver, Result, ResultGroup,
+                                    Waiver)
+from osh.hub.waiving.results_loader import ResultsLoader, store_defects
+from osh.hub.waiving.service import (compare_result_groups,
+                                     find_processed_in_past, get_last_waiver,
+                                     get_scans_new_defects_count)
+from osh.hub.waiving.views import DEFECTS_PER_PAGE, get_waiving_data
+
+
+def make_defects(count, checkers):
+    """generate `count` synthetic csmock defects spread across `checkers`"""
+    return [
+        {
+            'checker': checkers[i % len(checkers)],
+            'key_event_idx': 0,
+            'function': 'func_%d' % i,
+            'cwe': 476,
+            'events': [{
+                'file_name': 'src/file_%d.c' % i,
+                'line': i,
+                'event': 'warning',
+                'message': 'synthetic defect #%d' % i,
+                'verbosity_level': 0,
+            }],
+        }
+        for i in range(count)
+    ]
 
 
 class BasicWebTestCase(TestCase):
@@ -52,3 +94,527 @@ class BasicWebTestCase(TestCase):
     def test_mockconfs_list(self):
         r = self.client.get('/scan/mock/')
         self.assertEqual(r.status_code, 200)
+
+    def test_result_navigation(self):
+        r = self.client.get('/waiving/1/navigation/')
+        self.assertEqual(r.status_code, 200)
+        data = r.json()
+        self.assertEqual(set(data), {'first', 'previous', 'next', 'newest', 'scan_order', 'scans_count'})
+        scan = Scan.objects.get(id=1)
+        self.assertEqual((data['scan_order'], data['scans_count']), scan.get_order_in_release())
+
+    def test_result_tab_without_results(self):
+        r = self.client.get('/waiving/1/tab/new/')
+        self.assertEqual(r.status_code, 404)
+
+
+class StoreDefectsTestCase(TestCase):
+    """
+    Bulk ingestion of defects into the database
+    """
+
+    def setUp(self):
+        group = CheckerGroup.objects.create(name='C/C++')
+        Checker.objects.create(name='CLANG_WARNING', group=group)
+        self.result = Result.objects.create()
+
+    def test_store_defects(self):
+        defects = make_defects(10, ['CLANG_WARNING', 'UNKNOWN_CHECKER'])
+        # internal warnings are skipped
+        defects[0]['events'][0]['event'] = 'internal warning'
+        store_defects(self.result, defects, DEFECT_STATES['NEW'])
+
+        self.assertEqual(Defect.objects.filter(result_group__result=self.result).count(), 9)
+
+        rg = ResultGroup.objects.get(result=self.result, checker_group__name='C/C++')
+        self.assertEqual(rg.state, RESULT_GROUP_STATES['NEEDS_INSPECTION'])
+        self.assertEqual(rg.defects_count, 4)
+
+        # unknown checkers land in the default group
+        rg = ResultGroup.objects.get(result=self.result, checker_group__name='Unsorted')
+        self.assertEqual(rg.defects_count, 5)
+        self.assertEqual(Checker.objects.get(name='UNKNOWN_CHECKER').group, rg.checker_group)
+
+        self.result.refresh_from_db()
+        self.assertEqual(self.result.new_defects_count(), 9)
+        self.assertEqual(self.result.fixed_defects_count(), 0)
+
+    def test_store_fixed_defects(self):
+        store_defects(self.result, make_defects(3, ['CLANG_WARNING']), DEFECT_STATES['FIXED'])
+        rg = ResultGroup.objects.get(result=self.result)
+        self.assertEqual(rg.state, RESULT_GROUP_STATES['INFO'])
+        self.assertEqual(set(rg.defect_set.values_list('state', flat=True)),
+                         {DEFECT_STATES['FIXED']})
+
+    def test_defects_are_ordered(self):
+        store_defects(self.result, make_defects(9, ['CLANG_WARNING', 'UNKNOWN_CHECKER']),
+                      DEFECT_STATES['NEW'])
+        for rg in ResultGroup.objects.filter(result=self.result):
+            orders = list(rg.defect_set.order_by('id').values_list('order', flat=True))
+            self.assertEqual(orders, list(range(1, len(orders) + 1)))
+
+    @patch('osh.hub.waiving.service.pycsdiff')
+    def test_compare_result_groups_by_fingerprint(self, pycsdiff):
+        defects = make_defects(5, ['CLANG_WARNING'])
+        store_defects(self.result, defects, DEFECT_STATES['NEW'])
+
+        # the same defects reported on different lines, in a different directory
+        # and function
+        for defect in defects:
+            defect['events'][0]['line'] += 10
+            defect['events'][0]['file_name'] = 'lib/' + defect['events'][0]['file_name']
+            defect['function'] += '_renamed'
+        result = Result.objects.create()
+        store_defects(result, defects, DEFECT_STATES['NEW'])
+
+        # one of the defects differs
+        defects[0]['events'][0]['message'] = 'other defect'
+        other = Result.objects.create()
+        store_defects(other, defects, DEFECT_STATES['NEW'])
+
+        rg = ResultGroup.objects.get(result=self.result)
+        self.assertTrue(compare_result_groups(rg, ResultGroup.objects.get(result=result)))
+        pycsdiff.diff_scans.assert_not_called()
+
+        # different fingerprints are verified by csdiff
+        pycsdiff.diff_scans.return_value = '{"defects": [{}]}'
+        self.assertFalse(compare_result_groups(rg, ResultGroup.objects.get(result=other)))
+        pycsdiff.diff_scans.assert_called()
+        pycsdiff.diff_scans.return_value = '{"defects": []}'
+        self.assertTrue(compare_result_groups(rg, ResultGroup.objects.get(result=other)))
+
+    def test_query_count_does_not_depend_on_defects(self):
+        checkers = ['CLANG_WARNING', 'COMPILER_WARNING']
+
+        with CaptureQueriesContext(connection) as small:
+            store_defects(self.result, make_defects(10, checkers), DEFECT_STATES['NEW'])
+
+        result = Result.objects.create()
+        with CaptureQueriesContext(connection) as large:
+            store_defects(result, make_defects(500, checkers), DEFECT_STATES['NEW'])
+
+        self.assertEqual(Defect.objects.filter(result_group__result=result).count(), 500)
+        # checkers and result groups are resolved once per distinct value
+        self.assertLessEqual(len(large), len(small))
+
+
+@patch('osh.hub.waiving.results_loader.TaskResultPaths', MagicMock())
+class ResultsLoaderTestCase(TestCase):
+    """
+    Loading of scan results into the database
+    """
+
+    def setUp(self):
+        fixture_path = pathlib.Path(__file__).parent.absolute() / 'fixtures/initial_test_data.json'
+        call_command('loaddata', fixture_path, verbosity=0)
+
+        api = MagicMock()
+        api.get_analyzers.return_value = []
+        api.get_scan_metadata.return_value = {}
+        self.defects = 5
+        api.get_defects.side_effect = lambda: iter(make_defects(self.defects, self.checkers))
+        patcher = patch('osh.hub.waiving.results_loader.CsmockAPI', return_value=api)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    checkers = ['CLANG_WARNING']
+
+    def process(self):
+        ResultsLoader(ScanBinding.objects.get(id=1)).process()
+
+    def stages(self):
+        return {RESULTS_STAGES.get_value(stage) for stage in
+                ResultsCheckpoint.objects.filter(task_id=1).values_list('stage', flat=True)}
+
+    def test_resume_after_failed_load(self):
+        with patch('osh.hub.waiving.results_loader.store_defects', side_effect=[None, OSError]):
+            self.assertRaises(OSError, self.process)
+        self.assertFalse(Result.objects.exists())
+        self.assertFalse(self.stages())
+
+        self.process()
+        self.assertEqual(Result.objects.count(), 1)
+        # 5 fixed and 5 added defects
+        self.assertEqual(Defect.objects.count(), 10)
+        self.assertEqual(self.stages(), {'LOADED', 'MATCHED'})
+
+    def test_retry_failed_load(self):
+        loader = ResultsLoader(ScanBinding.objects.get(id=1))
+        with patch('osh.hub.waiving.results_loader.store_defects', side_effect=[None, OSError]):
+            self.assertRaises(OSError, loader.process)
+        # the result created by the rolled back transaction is forgotten
+        self.assertIsNone(loader.result)
+        self.assertIsNone(loader.sb.result)
+
+        loader.process()
+        self.assertEqual(ScanBinding.objects.get(id=1).result, Result.objects.get())
+        self.assertEqual(Defect.objects.count(), 10)
+
+    def test_resume_skips_completed_stages(self):
+        with patch('osh.hub.waiving.results_loader.find_processed_in_past', side_effect=RuntimeError):
+            self.assertRaises(RuntimeError, self.process)
+        self.assertEqual(self.stages(), {'LOADED'})
+
+        with patch('osh.hub.waiving.results_loader.store_defects') as store:
+            self.process()
+        store.assert_not_called()
+        self.assertEqual(Result.objects.count(), 1)
+        self.assertEqual(Defect.objects.count(), 10)
+        self.assertEqual(self.stages(), {'LOADED', 'MATCHED'})
+        self.assertEqual(ScanBinding.objects.get(id=1).result, Result.objects.get())
+
+    def test_query_count_does_not_depend_on_defects(self):
+        self.checkers = ['CLANG_WARNING', 'COMPILER_WARNING', 'UNKNOWN_CHECKER']
+        # create the checkers beforehand
+        store_defects(Result.objects.create(), make_defects(3, self.checkers), DEFECT_STATES['NEW'])
+        Result.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as small:
+            self.process()
+
+        ResultsCheckpoint.objects.all().delete()
+        ScanBinding.objects.filter(id=1).update(result=None)
+        Result.objects.all().delete()
+        self.defects = 500
+        with CaptureQueriesContext(connection) as large:
+            self.process()
+
+        self.assertEqual(Defect.objects.count(), 1000)
+        # queries scale with the number of result groups, not defects
+        self.assertLessEqual(len(large), len(small))
+
+
+class FindProcessedInPastTestCase(TestCase):
+    """
+    Matching of new result groups against waivers of past scans
+    """
+
+    def setUp(self):
+        fixture_path = pathlib.Path(__file__).parent.absolute() / 'fixtures/initial_test_data.json'
+        call_command('loaddata', fixture_path, verbosity=0)
+
+        sb = ScanBinding.objects.get(id=1)
+        self.user = sb.scan.username
+
+        # previous scan of the same package in the same release
+        old_scan = Scan.objects.get(id=1)
+        old_scan.id = None
+        old_scan.save()
+        self.old = Result.objects.create()
+        ScanBinding.objects.create(task_id=2, scan=old_scan, result=self.old)
+
+        self.new = Result.objects.create()
+        sb.result = self.new
+        sb.save()
+
+    def add_groups(self, names, waiver_state):
+        """store the same defects of new checker groups in both results, waive the old ones"""
+        for name in names:
+            group = CheckerGroup.objects.create(name=name)
+            Checker.objects.create(name=name, group=group)
+
+        defects = make_defects(2 * len(names), names)
+        store_defects(self.old, defects, DEFECT_STATES['NEW'])
+        for rg in ResultGroup.objects.filter(result=self.old, checker_group__name__in=names):
+            Waiver.objects.create(message='waived', result_group=rg, user=self.user,
+                                  state=waiver_state, is_active=True)
+        return defects
+
+    def test_query_count_does_not_depend_on_checker_groups(self):
+        defects = self.add_groups(['GROUP_A', 'GROUP_B'], WAIVER_TYPES['NOT_A_BUG'])
+        store_defects(self.new, defects, DEFECT_STATES['NEW'])
+        with CaptureQueriesContext(connection) as small:
+            find_processed_in_past(self.new)
+
+        defects = self.add_groups(['GROUP_%d' % i for i in range(20)], WAIVER_TYPES['NOT_A_BUG'])
+        defects += self.add_groups(['BUG_%d' % i for i in range(5)], WAIVER_TYPES['IS_A_BUG'])
+        store_defects(self.new, defects, DEFECT_STATES['NEW'])
+        ResultGroup.objects.filter(result=self.new).update(state=RESULT_GROUP_STATES['NEEDS_INSPECTION'])
+        with CaptureQueriesContext(connection) as large:
+            find_processed_in_past(self.new)
+
+        self.assertLessEqual(len(large), len(small) + 1)
+        rgs = ResultGroup.objects.filter(result=self.new)
+        self.assertEqual(rgs.filter(state=RESULT_GROUP_STATES['PREVIOUSLY_WAIVED']).count(), 22)
+        self.assertEqual(rgs.filter(state=RESULT_GROUP_STATES['CONTAINS_BUG']).count(), 5)
+        self.assertFalse(Defect.objects.filter(result_group__result=self.new,
+                                               result_group__checker_group__name='GROUP_A',
+                                               state=DEFECT_STATES['NEW']).exists())
+
+    def test_unmatched_group_invalidates_waiver(self):
+        defects = self.add_groups(['GROUP_A'], WAIVER_TYPES['NOT_A_BUG'])
+        lw = LatestWaiver.objects.get(checker_group__name='GROUP_A')
+        self.assertTrue(lw.is_valid)
+        self.assertEqual(get_last_waiver(lw.checker_group, lw.package, lw.release), lw.waiver)
+
+        defects[0]['function'] = 'changed'
+        store_defects(self.new, defects, DEFECT_STATES['NEW'])
+        find_processed_in_past(self.new)
+
+        self.assertEqual(ResultGroup.objects.get(result=self.new).state,
+                         RESULT_GROUP_STATES['NEEDS_INSPECTION'])
+        self.assertIsNone(get_last_waiver(lw.checker_group, lw.package, lw.release))
+
+        # the table can be rebuilt from the history of waivers
+        call_command('rebuild_latest_waivers', stdout=io.StringIO())
+        self.assertFalse(LatestWaiver.objects.get(checker_group__name='GROUP_A').is_valid)
+
+    def test_defect_counters(self):
+        defects = self.add_groups(['GROUP_A', 'GROUP_B'], WAIVER_TYPES['NOT_A_BUG'])
+        defects[0]['function'] = 'changed'
+        store_defects(self.new, defects, DEFECT_STATES['NEW'])
+        store_defects(self.new, make_defects(3, ['GROUP_A']), DEFECT_STATES['FIXED'])
+
+        self.new.refresh_from_db()
+        self.assertEqual(self.new.new_defects_count(), 4)
+        self.assertEqual(self.new.fixed_defects_count(), 3)
+        self.assertEqual(get_scans_new_defects_count(ScanBinding.objects.get(id=1).scan_id), 4)
+
+        # GROUP_B matches the waiver of the previous scan
+        find_processed_in_past(self.new)
+        self.new.refresh_from_db()
+        self.assertEqual(self.new.new_defects_count(), 2)
+        self.assertEqual(self.new.previously_waived_defects_counter, 2)
+        self.assertEqual(ResultGroup.objects.get(result=self.new, checker_group__name='GROUP_B',
+                                                 defect_type=DEFECT_STATES['PREVIOUSLY_WAIVED'])
+                         .defects_count, 2)
+
+        call_command('check_defect_counters', stdout=io.StringIO())
+        Result.objects.filter(id=self.new.id).update(new_defects_counter=10)
+        ResultGroup.objects.filter(result=self.old).update(defects_counter=0)
+        self.assertEqual(Result.objects.with_wrong_defect_counters().count(), 2)
+        with self.assertRaises(CommandError):
+            call_command('check_defect_counters', stdout=io.StringIO())
+
+        call_command('check_defect_counters', '--fix', stdout=io.StringIO())
+        self.assertFalse(Result.objects.with_wrong_defect_counters().exists())
+        self.new.refresh_from_db()
+        self.assertEqual(self.new.new_defects_count(), 2)
+
+
+class WaivingDataTestCase(TestCase):
+    """
+    Data of the tabs of the result page
+    """
+
+    def setUp(self):
+        fixture_path = pathlib.Path(__file__).parent.absolute() / 'fixtures/initial_test_data.json'
+        call_command('loaddata', fixture_path, verbosity=0)
+        self.client = Client()
+        self.sb = ScanBinding.objects.get(id=1)
+        self.sb.result = Result.objects.create()
+        self.sb.save()
+
+    defect_types = [DEFECT_STATES['NEW'], DEFECT_STATES['FIXED'], DEFECT_STATES['PREVIOUSLY_WAIVED']]
+
+    def add_groups(self, count):
+        """ store new and fixed defects of `count` new checker groups, waive some of them """
+        names = ['GROUP_%d' % i for i in range(CheckerGroup.objects.count(), CheckerGroup.objects.count() + count)]
+        for name in names:
+            Checker.objects.create(name=name, group=CheckerGroup.objects.create(name=name))
+        store_defects(self.sb.result, make_defects(3 * count, names), DEFECT_STATES['NEW'])
+        store_defects(self.sb.result, make_defects(count, names), DEFECT_STATES['FIXED'])
+
+        waiver_types = [WAIVER_TYPES['NOT_A_BUG'], WAIVER_TYPES['FIX_LATER'], WAIVER_TYPES['IS_A_BUG']]
+        rgs = ResultGroup.objects.filter(result=self.sb.result, checker_group__name__in=names,
+                                         defect_type=DEFECT_STATES['NEW'])
+        for i, rg in enumerate(rgs):
+            if i % 2:
+                continue
+            Waiver.objects.create(message='waived', result_group=rg, user=self.sb.scan.username,
+                                  state=waiver_types[i % 3], is_active=True)
+            rg.waive()
+
+    def test_query_count_does_not_depend_on_groups(self):
+        self.add_groups(2)
+        with CaptureQueriesContext(connection) as small:
+            get_waiving_data(self.sb.result, self.defect_types)
+        self.assertLessEqual(len(small), 2)
+
+        self.add_groups(120)
+        with CaptureQueriesContext(connection) as large:
+            data = get_waiving_data(self.sb.result, self.defect_types)
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(data[DEFECT_STATES['NEW']][1], 122)
+        self.assertEqual(data[DEFECT_STATES['FIXED']][1], 122)
+
+        # the same as computed by separate queries per result group
+        for defect_type in self.defect_types:
+            for group, view_data in data[defect_type][0].items():
+                if not view_data:
+                    continue
+                rg = ResultGroup.objects.get(id=view_data['id'])
+                self.assertEqual(view_data['defects_count'], rg.defect_set.count())
+                self.assertEqual(view_data['group_state'], rg.get_state_to_display())
+
+    def test_result_tabs(self):
+        self.add_groups(5)
+        r = self.client.get('/waiving/1/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.context['new_count'], 5)
+        self.assertEqual(r.context['fixed_count'], 5)
+        self.assertEqual(r.context['old_count'], 0)
+
+        r = self.client.get('/waiving/1/tab/new/')
+        self.assertEqual(r.status_code, 200)
+        data = r.json()
+        self.assertEqual(data['count'], 5)
+        cells = [cell for row in data['rows'] for cell in row if 'id' in cell]
+        self.assertEqual(len(cells), 5)
+        self.assertTrue(all(cell['url'] == '/waiving/1/%d/' % cell['id'] for cell in cells))
+
+        self.assertEqual(self.client.get('/waiving/1/tab/fixed/').json()['count'], 5)
+        self.assertEqual(self.client.get('/waiving/1/tab/unknown/').status_code, 404)
+
+    def test_result_page(self):
+        # the third group is marked as a bug, so both cases report bugs
+        self.add_groups(4)
+        with CaptureQueriesContext(connection) as small:
+            r = self.client.get('/waiving/1/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.context['unreported_bugs_count_bz'], 1)
+        self.assertEqual(r.context['unreported_bugs_count_jira'], 1)
+
+        self.add_groups(120)
+        with CaptureQueriesContext(connection) as large:
+            r = self.client.get('/waiving/1/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(large), len(small))
+
+        # the same as resolved by separate queries per result group
+        latest_waivers = [rg.has_waiver() for rg in ResultGroup.objects.filter(result=self.sb.result)]
+        unreported = [w for w in latest_waivers if w is not None and w.marks_bug()]
+        self.assertTrue(unreported)
+        self.assertEqual(r.context['unreported_bugs_count_bz'], len(unreported))
+        self.assertEqual(r.context['unreported_bugs_count_jira'], len(unreported))
+
+
+class DefectListTestCase(TestCase):
+    """
+    Defects of result groups are paginated and their events loaded on demand
+    """
+
+    def setUp(self):
+        fixture_path = pathlib.Path(__file__).parent.absolute() / 'fixtures/initial_test_data.json'
+        call_command('loaddata', fixture_path, verbosity=0)
+        self.client = Client()
+        self.sb = ScanBinding.objects.get(id=1)
+        self.sb.result = Result.objects.create()
+        self.sb.save()
+
+        Checker.objects.create(name='HUGE', group=CheckerGroup.objects.create(name='HUGE'))
+        defects = make_defects(DEFECTS_PER_PAGE + 10, ['HUGE'])
+        for defect in defects:
+            defect['key_event_idx'] = 1
+            defect['events'].insert(0, {'file_name': 'src/main.c', 'line': 1, 'event': 'note',
+                                        'message': 'called from here', 'verbosity_level': 1})
+        store_defects(self.sb.result, defects, DEFECT_STATES['NEW'])
+        self.rg = ResultGroup.objects.get(result=self.sb.result, checker_group__name='HUGE')
+
+    def test_pages(self):
+        url = '/waiving/1/%d/' % self.rg.id
+        r = self.client.get(url)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.context['defects']), DEFECTS_PER_PAGE)
+        self.assertEqual(r.context['paginator'].count, DEFECTS_PER_PAGE + 10)
+        self.assertEqual(r.context['defects'][0].function, 'func_0')
+
+        r = self.client.get(url, {'page': 2})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.context['defects']), 10)
+        self.assertEqual(r.context['defects'][0].function, 'func_%d' % DEFECTS_PER_PAGE)
+
+    def test_key_event(self):
+        defects = Defect.objects.filter(result_group=self.rg).with_key_event()
+        defect = defects.get(order=1)
+        self.assertIn('events', defect.get_deferred_fields())
+        self.assertEqual(defect.key_event_data['message'], 'synthetic defect #0')
+
+    def test_defect_events(self):
+        defect = Defect.objects.get(result_group=self.rg, order=1)
+        r = self.client.get('/waiving/defect/%d/events/' % defect.id)
+        self.assertEqual(r.status_code, 200)
+        data = r.json()
+        self.assertEqual(data['key_event'], 1)
+        self.assertEqual(data['events'], defect.events)
+        self.assertEqual(self.client.get('/waiving/defect/0/events/').status_code, 404)
+
+
+class ResolvedResultPathsTestCase(TestCase):
+    """
+    Pages displaying results of processed tasks do not probe the task dir
+    """
+
+    def setUp(self):
+        fixture_path = pathlib.Path(__file__).parent.absolute() / 'fixtures/initial_test_data.json'
+        call_command('loaddata', fixture_path, verbosity=0)
+        self.client = Client()
+        self.task = Task.objects.get(id=1)
+
+    @contextlib.contextmanager
+    def task_dir_accesses(self):
+        """ record filesystem calls on paths in TASK_DIR """
+        accessed = []
+        patchers = []
+        # TASK_DIR may be relative while kobo and OSH access absolute paths
+        task_dir = os.path.abspath(settings.TASK_DIR) + os.sep
+        for name in ('os.stat', 'os.lstat', 'os.scandir', 'os.listdir', 'os.open', 'builtins.open'):
+            module, attr = name.split('.')
+            func = getattr(__import__(module), attr)
+
+            def wrapper(path=None, *args, func=func, **kwargs):
+                if isinstance(path, str) and os.path.abspath(path).startswith(task_dir):
+                    accessed.append(path)
+                return func(path, *args, **kwargs)
+            patchers.append(patch(name, wrapper))
+
+        with contextlib.ExitStack() as stack:
+            for patcher in patchers:
+                stack.enter_context(patcher)
+            yield accessed
+
+    def test_warm_results_page(self):
+        ResolvedResultPaths.objects.record(
+            self.task, json_results='pkg-1.0/scan-results.js', diffed=True,
+            files=['stdout.log', ERROR_DIFF_FILE, ERROR_HTML_FILE, 'pkg-1.0/scan-results.js'])
+
+        # templates are loaded by the first request
+        self.client.get('/waiving/1/')
+        with self.task_dir_accesses() as accessed:
+            r = self.client.get('/waiving/1/')
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(accessed, [])
+        titles = [log['title'] for log in r.context['logs']]
+        self.assertEqual(titles, ['Added defects', 'Scan Log'])
+
+        # the very same request probes the task dir once the paths are forgotten
+        ResolvedResultPaths.objects.invalidate(self.task)
+        with self.task_dir_accesses() as accessed:
+            r = self.client.get('/waiving/1/')
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(accessed)
+
+    def test_unresolved_results_page(self):
+        task_dir = os.path.abspath(TaskResultPaths(self.task).task_dir)
+        with self.task_dir_accesses() as accessed:
+            r = self.client.get('/waiving/1/')
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(accessed)
+        self.assertTrue(any(os.path.abspath(path).startswith(task_dir) for path in accessed))
+
+    def test_resolve_and_invalidate(self):
+        task_dir = TaskResultPaths(self.task).task_dir
+        os.makedirs(task_dir, exist_ok=True)
+        self.addCleanup(os.rmdir, task_dir)
+        with open(os.path.join(task_dir, ERROR_DIFF_FILE), 'w') as f:
+            f.write('{}')
+        self.addCleanup(os.unlink, f.name)
+
+        resolved = TaskResultPaths(self.task).resolve()
+        self.assertTrue(resolved.diffed)
+        self.assertEqual(resolved.files, [ERROR_DIFF_FILE])
+        self.assertFalse(TaskResultPaths(self.task).has_json_results())
+
+        ResolvedResultPaths.objects.invalidate(self.task)
+        self.assertIsNone(TaskResultPaths(self.task).get_resolved())
@@ -9,12 +9,17 @@ import shlex
 import shutil
 import subprocess
 import sys
+import tarfile
 import tempfile
 import urllib.request
 import uuid
 
 from kobo.shortcuts import run
 
+from osh.common.constants import (DEFAULT_RESULTS_COMPRESSION,
+                                  RESULTS_TARBALL_SUFFIXES)
+from osh.common.manifest import build_manifest, write_manifest
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,7 +28,19 @@ class CsmockRunner:
     context manager class which executes csmock in current process
     """
 
-    def __init__(self, tmpdir=None, create_tmpdir=False):
+    def __init__(self, tmpdir=None, create_tmpdir=False, xz_block_size=None,
+                 results_compression=None):
+        """
+        xz_block_size -- split the results tarball into xz blocks of the given
+                         size (e.g. "16MiB") so that the hub can decompress
+                         it in parallel
+        results_compression -- compression of the results tarball, see
+                               RESULTS_TARBALL_SUFFIXES
+        """
+        self.xz_block_size = xz_block_size
+        self.results_compression = results_compression or DEFAULT_RESULTS_COMPRESSION
+        if self.results_compression not in RESULTS_TARBALL_SUFFIXES:
+            raise RuntimeError(f'unsupported results compression: {self.results_compression}')
         if create_tmpdir:
             self.tmpdir = tempfile.mkdtemp()
             self.our_temp_dir = True
@@ -65,6 +82,11 @@ class CsmockRunner:
                 raise RuntimeError('temp dir does not exists!')
             command = f'cd {shlex.quote(self.tmpdir)} && ' + command
 
+        if self.xz_block_size:
+            # csmock compresses the results by tar -J, which honors XZ_OPT
+            xz_opt = f'-T0 --block-size={self.xz_block_size}'
+            command = f'export XZ_OPT={shlex.quote(xz_opt)} && ' + command
+
         if su_user:
             if self.our_temp_dir:
                 inner_cmd = ['chown', f'{su_user}:{su_user}', self.tmpdir]
@@ -81,7 +103,7 @@ class CsmockRunner:
 
         retcode, _ = run(command, stdout=True, can_fail=True, return_stdout=False, buffer_size=2, show_cmd=True, universal_newlines=True, errors="backslashreplace")
         if output_path:
-            return output_path, retcode
+            return self.finalize(output_path), retcode
 
         if self.tmpdir:
             path = self.tmpdir
@@ -99,7 +121,43 @@ class CsmockRunner:
         # usually we have just one .tar.xz but, if we analyze an usptream
         # tarball which itself has .tar.xz suffix, we need to pick a file
         # ending -results.tar.xz, which appears second in the glob results
-        return glob_results[-1], retcode
+        return self.finalize(glob_results[-1]), retcode
+
+    def finalize(self, tarball):
+        """
+        recompress the results tarball if requested and write its manifest
+        next to it; return path to the resulting tarball
+        """
+        manifest = None
+        if os.path.exists(tarball):
+            try:
+                manifest = build_manifest(tarball)
+            except (OSError, EOFError, tarfile.TarError) as ex:
+                # the hub copes with results without manifest
+                print("Building manifest of results failed:", ex, file=sys.stderr)
+
+        tarball = self.recompress(tarball)
+        if manifest is not None:
+            write_manifest(manifest, tarball)
+        return tarball
+
+    def recompress(self, tarball):
+        """
+        csmock always produces .tar.xz, convert it to the requested format;
+        return path to the resulting tarball
+        """
+        if self.results_compression == 'zstd' and os.path.exists(tarball):
+            output_path = re.sub(r'\.tar\.xz$', RESULTS_TARBALL_SUFFIXES['zstd'], tarball)
+            cmd = f'xz -dc {shlex.quote(tarball)} | zstd -q -f -T0 -19 -o {shlex.quote(output_path)}'
+            try:
+                subprocess.run(cmd, shell=True, check=True)
+            except subprocess.CalledProcessError as ex:
+                # upload the original tarball rather than nothing
+                print("Recompression of results failed:", ex, file=sys.stderr)
+                return tarball
+            os.unlink(tarball)
+            return output_path
+        return tarball
 
     def determine_output_path(self, srpm_path, result_filename):
         if result_filename is None:
@@ -8,6 +8,7 @@ from urllib.parse import urljoin
 
 from kobo.worker import TaskBase
 
+from osh.common.manifest import MANIFEST_SUFFIX, manifest_path
 from osh.worker.csmock_runner import CsmockRunner
 
 
@@ -50,6 +51,7 @@ class Build(OSHTaskBase):
         custom_model_name = self.args.pop("custom_model_name", None)
         task_url = self.hub.client.task_url(self.task_id)
         result_filename = self.args.pop("result_filename", None)
+        results_compression = self.args.pop("results_compression", None)
 
         # scan base
         if base_task_args:
@@ -66,7 +68,8 @@ class Build(OSHTaskBase):
         if upload_id:
             self.hub.worker.move_upload(self.task_id, upload_id)
 
-        with CsmockRunner() as runner:
+        with CsmockRunner(xz_block_size=self.conf.get('XZ_BLOCK_SIZE'),
+                          results_compression=results_compression) as runner:
             if custom_model_name:
                 model_url = urljoin(task_url, f'log/{custom_model_name}?format=raw')
                 model_path = runner.download_file(model_url, custom_model_name)
@@ -112,6 +115,9 @@ class Build(OSHTaskBase):
                 base_results = os.path.basename(results)
                 with open(results, "rb") as f:
                     self.hub.upload_task_log(f, self.task_id, base_results)
+                if os.path.exists(manifest_path(results)):
+                    with open(manifest_path(results), "rb") as f:
+                        self.hub.upload_task_log(f, self.task_id, base_results + MANIFEST_SUFFIX)
             except OSError as e:
                 print("Reading task logs failed:", e, file=sys.stderr)
                 self.fail()
@@ -6,6 +6,7 @@ import platform
 import sys
 from urllib.parse import urljoin
 
+from osh.common.manifest import MANIFEST_SUFFIX, manifest_path
 from osh.worker.csmock_runner import CsmockRunner
 from osh.worker.tasks.task_build import OSHTaskBase
 
@@ -55,7 +56,8 @@ class ErrataDiffBuild(OSHTaskBase):
         add_args = scanning_args.get('csmock_args', '')
         koji_profile = scanning_args.get('koji_profile', 'koji')
 
-        with CsmockRunner() as runner:
+        with CsmockRunner(xz_block_size=self.conf.get('XZ_BLOCK_SIZE'),
+                          results_compression=scanning_args.get('results_compression')) as runner:
             results, retcode = runner.koji_analyze(scanning_args['analyzers'],
                                                    build,
                                                    profile=mock_config,
@@ -73,6 +75,9 @@ class ErrataDiffBuild(OSHTaskBase):
                 base_results = os.path.basename(results)
                 with open(results, 'rb') as f:
                     self.hub.upload_task_log(f, self.task_id, base_results)
+                if os.path.exists(manifest_path(results)):
+                    with open(manifest_path(results), 'rb') as f:
+                        self.hub.upload_task_log(f, self.task_id, base_results + MANIFEST_SUFFIX)
             except OSError as e:
                 print("Reading task logs failed:", e, file=sys.stderr)
                 self.hub.worker.fail_scan(scan_id, f'Reading tak logs failed: {e}')
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Benchmarks of the hub's results processing on synthetic data
+
+Run it in the hub container, e.g.:
+
+    podman exec -it osh-hub python3 scripts/benchmark.py store-defects
+
+Nothing is left behind in the database -- all changes are rolled back.
+"""
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'osh.hub.settings'
+
+
+class Rollback(Exception):
+    """Raised to roll back the database changes made by a benchmark"""
+
+
+def generate_defects(count, checkers=100, offset=0):
+    """return `count` synthetic csmock defects"""
+    defects = []
+    for i in range(offset, offset + count):
+        defects.append({
+            'checker': 'BENCHMARK_CHECKER_%d' % (i % checkers),
+            'key_event_idx': 0,
+            'function': 'func_%d' % i,
+            'events': [{
+                'file_name': 'src/file_%d.c' % (i % 1000),
+                'line': i,
+                'event': 'warning',
+                'message': 'synthetic defect #%d' % i,
+                'verbosity_level': 0,
+            }],
+        })
+    return defects
+
+
+def generate_scan_results(path, count, checkers=100, offset=0):
+    """write synthetic csmock results with `count` defects to `path`"""
+    defects = generate_defects(count, checkers, offset)
+    with open(path, 'w') as f:
+        json.dump({'scan': {'tool': 'csmock'}, 'defects': defects}, f)
+
+
+def bench_store_defects(args):
+    from django.db import connection, transaction
+    from django.test.utils import CaptureQueriesContext
+
+    from osh.hub.service.csmock_parser import CsmockAPI
+    from osh.hub.waiving.models import DEFECT_STATES, Result
+    from osh.hub.waiving.results_loader import store_defects
+
+    with tempfile.TemporaryDirectory(prefix='osh-benchmark-') as tmpdir:
+        path = os.path.join(tmpdir, 'scan-results.js')
+        generate_scan_results(path, args.defects, args.checkers)
+
+        try:
+            with transaction.atomic():
+                result = Result.objects.create()
+                start = time.monotonic()
+                with CaptureQueriesContext(connection) as queries:
+                    defects = CsmockAPI(path, streaming=True).get_defects()
+                    store_defects(result, defects, DEFECT_STATES['NEW'])
+                elapsed = time.monotonic() - start
+                raise Rollback
+        except Rollback:
+            pass
+
+    print('defects:            %d' % args.defects)
+    print('checkers:           %d' % args.checkers)
+    print('queries:            %d' % len(queries))
+    print('queries per defect: %.4f' % (len(queries) / args.defects))
+    print('wall time:          %.2f s' % elapsed)
+
+
+def bench_diff(args):
+    from osh.hub.service.processing import (TITLE_ADDED, TITLE_FIXED,
+                                            add_title_to_json, csgrep_err,
+                                            cshtml, diff_scans,
+                                            read_json_results,
+                                            write_json_results)
+
+    def shell(cmd, workdir):
+        subprocess.run(cmd, shell=True, cwd=workdir, check=False)
+
+    with tempfile.TemporaryDirectory(prefix='osh-benchmark-') as tmpdir:
+        base = os.path.join(tmpdir, 'base.js')
+        target = os.path.join(tmpdir, 'target.js')
+        # 10 % of defects are fixed and 10 % newly introduced
+        shift = args.defects // 10
+        generate_scan_results(base, args.defects)
+        generate_scan_results(target, args.defects, offset=shift)
+
+        # csdiff/csgrep/cshtml subprocess chain operating on files
+        start = time.monotonic()
+        shell('csdiff -jz base.js target.js > added.js', tmpdir)
+        shell('csdiff -jz target.js base.js > fixed.js', tmpdir)
+        add_title_to_json(os.path.join(tmpdir, 'added.js'), TITLE_ADDED)
+        add_title_to_json(os.path.join(tmpdir, 'fixed.js'), TITLE_FIXED)
+        for name in ('added', 'fixed'):
+            shell(f'csgrep --prune-events 1 --mode json {name}.js | cshtml - > {name}.html', tmpdir)
+            shell(f'csgrep --prune-events 1 {name}.js > {name}.err', tmpdir)
+        subprocess_chain = time.monotonic() - start
+
+        # single-pass in-process diff
+        start = time.monotonic()
+        added, fixed = diff_scans(read_json_results(base), read_json_results(target))
+        added = write_json_results(added, os.path.join(tmpdir, 'added.js'), TITLE_ADDED)
+        fixed = write_json_results(fixed, os.path.join(tmpdir, 'fixed.js'), TITLE_FIXED)
+        for name, data in (('added', added), ('fixed', fixed)):
+            cshtml(None, f'{name}.html', tmpdir, data)
+            csgrep_err(None, f'{name}.err', tmpdir, data)
+        in_process = time.monotonic() - start
+
+    print('defects:          %d' % args.defects)
+    print('subprocess chain: %.2f s' % subprocess_chain)
+    print('in-process diff:  %.2f s' % in_process)
+    print('speedup:          %.1fx' % (subprocess_chain / in_process))
+
+
+def bench_compare_groups(args):
+    from django.db import transaction
+
+    from osh.hub.waiving.models import (DEFECT_STATES, Checker, CheckerGroup,
+                                        Result, ResultGroup)
+    from osh.hub.waiving.results_loader import store_defects
+    from osh.hub.waiving.service import (compare_result_groups,
+                                         csdiff_compare_result_groups)
+
+    def compare_all(compare, pairs):
+        start = time.monotonic()
+        matching = sum(1 for rg1, rg2 in pairs if compare(rg1, rg2))
+        return time.monotonic() - start, matching
+
+    try:
+        with transaction.atomic():
+            for i in range(args.groups):
+                group = CheckerGroup.objects.create(name='BENCHMARK_GROUP_%d' % i)
+                Checker.objects.create(name='BENCHMARK_CHECKER_%d' % i, group=group)
+
+            defects = generate_defects(args.defects, args.groups)
+            old = Result.objects.create()
+            store_defects(old, defects, DEFECT_STATES['NEW'])
+            # a tenth of the groups gets a new defect in the new scan
+            added = generate_defects(args.groups // 10, args.groups, offset=args.defects)
+            new = Result.objects.create()
+            store_defects(new, defects + added, DEFECT_STATES['NEW'])
+
+            old_rgs = {rg.checker_group_id: rg for rg in ResultGroup.objects.filter(result=old)}
+            pairs = [(rg, old_rgs[rg.checker_group_id])
+                     for rg in ResultGroup.objects.filter(result=new).select_related('checker_group')]
+
+            fingerprints, fp_matching = compare_all(compare_result_groups, pairs)
+            csdiff, csdiff_matching = compare_all(csdiff_compare_result_groups, pairs)
+            raise Rollback
+    except Rollback:
+        pass
+
+    print('checker groups:    %d' % len(pairs))
+    print('defects:           %d' % args.defects)
+    print('matching groups:   %d (csdiff: %d)' % (fp_matching, csdiff_matching))
+    print('fingerprints:      %.2f s' % fingerprints)
+    print('csdiff:            %.2f s' % csdiff)
+    print('speedup:           %.1fx' % (csdiff / fingerprints))
+
+
+def bench_defect_counters(args):
+    from django.db import connection, transaction
+    from django.db.models import Sum
+    from django.test.utils import CaptureQueriesContext
+
+    from osh.hub.waiving.models import DEFECT_STATES, Defect, Result
+    from osh.hub.waiving.results_loader import store_defects
+
+    def measure(func):
+        start = time.monotonic()
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        return time.monotonic() - start, len(queries)
+
+    def legacy_tree():
+        # Package.display_graph: counts of new and fixed defects of each scan
+        for result in Result.objects.filter(id__in=ids):
+            for defect_type in (DEFECT_STATES['NEW'], DEFECT_STATES['FIXED']):
+                Defect.objects.filter(result_group__result=result,
+                                      result_group__defect_type=defect_type).count()
+
+    def counters_tree():
+        for result in Result.objects.filter(id__in=ids):
+            result.new_defects_count()
+            result.fixed_defects_count()
+
+    def legacy_stats():
+        # totals of the stats page
+        for state in (DEFECT_STATES['NEW'], DEFECT_STATES['FIXED']):
+            Defect.objects.filter(result_group__result__in=ids, state=state).count()
+
+    def counters_stats():
+        Result.objects.filter(id__in=ids).aggregate(Sum('new_defects_counter'),
+                                                    Sum('fixed_defects_counter'))
+
+    try:
+        with transaction.atomic():
+            ids = []
+            for i in range(args.results):
+                result = Result.objects.create()
+                store_defects(result, generate_defects(args.defects, args.checkers),
+                              DEFECT_STATES['NEW'])
+                store_defects(result, generate_defects(args.defects // 10, args.checkers),
+                              DEFECT_STATES['FIXED'])
+                ids.append(result.id)
+
+            timings = [(name, measure(legacy), measure(counters)) for name, legacy, counters in (
+                ('scan tree', legacy_tree, counters_tree),
+                ('stats totals', legacy_stats, counters_stats),
+            )]
+            raise Rollback
+    except Rollback:
+        pass
+
+    print('results:          %d' % args.results)
+    print('defects per scan: %d' % args.defects)
+    print('%-13s %12s %8s %12s %8s' % ('', 'COUNT(*) (s)', 'queries', 'counters (s)', 'queries'))
+    for name, (legacy, legacy_queries), (counters, counters_queries) in timings:
+        print('%-13s %12.3f %8d %12.3f %8d' % (name, legacy, legacy_queries, counters, counters_queries))
+
+
+def generate_results_tarball(path, defects, log_size, xz_block_size=None):
+    """
+    write synthetic csmock results tarball to `path`; besides the results,
+    it contains `log_size` MiB of logs; the tarball is a single xz block
+    unless `xz_block_size` is set
+    """
+    with tempfile.TemporaryDirectory(prefix='osh-benchmark-') as tmpdir:
+        results_dir = os.path.join(tmpdir, 'benchmark-1.0-1')
+        os.makedirs(os.path.join(results_dir, 'logs'))
+        generate_scan_results(os.path.join(results_dir, 'scan-results.js'), defects)
+        with open(os.path.join(results_dir, 'scan-results-summary.txt'), 'w') as f:
+            f.write('%d defects\n' % defects)
+        for i in range(log_size):
+            # 1 MiB of partly random text compressing roughly as build logs do
+            lines = ('%08d: src/file_%d.c: %s\n' % (j, j % 1000, os.urandom(4).hex())
+                     for j in range(2**20 // 40))
+            with open(os.path.join(results_dir, 'logs', 'build-%d.log' % i), 'w') as f:
+                f.write(''.join(lines)[:2**20])
+        xz_opt = '-T0 --block-size=%s' % xz_block_size if xz_block_size else '-T1'
+        subprocess.run(['tar', '-C', tmpdir, '-cJf', path, 'benchmark-1.0-1'], check=True,
+                       env=dict(os.environ, XZ_OPT=xz_opt))
+
+
+def disk_usage(path):
+    """ return number of bytes allocated by files under `path` """
+    return sum(os.lstat(os.path.join(root, name)).st_blocks * 512
+               for root, dirs, files in os.walk(path)
+               for name in files + dirs)
+
+
+def bench_lazy_unpack(args):
+    from osh.hub.service.archive import ResultsArchive, index_path
+    from osh.hub.service.csmock_parser import ResultsExtractor
+
+    with tempfile.TemporaryDirectory(prefix='osh-benchmark-') as tmpdir:
+        tarball = os.path.join(tmpdir, 'benchmark-1.0-1.tar.xz')
+        generate_results_tarball(tarball, args.defects, args.log_size)
+        tarball_size = disk_usage(tmpdir)
+
+        full_dir = os.path.join(tmpdir, 'full')
+        os.mkdir(full_dir)
+        start = time.monotonic()
+        ResultsExtractor(tarball, output_dir=full_dir, unpack_in_temp=False).extract_tarball()
+        with open(os.path.join(full_dir, 'benchmark-1.0-1', 'scan-results.js')) as f:
+            json.load(f)
+        full_time = time.monotonic() - start
+        full_size = disk_usage(full_dir) + tarball_size
+
+        lazy_dir = os.path.join(tmpdir, 'lazy')
+        os.mkdir(lazy_dir)
+        start = time.monotonic()
+        archive = ResultsArchive.create(tarball)
+        with archive.open('benchmark-1.0-1/scan-results.js') as f:
+            json.load(f)
+        lazy_time = time.monotonic() - start
+        # the files needed by the hub are unpacked on first access
+        for name in archive.glob('*/scan-results*'):
+            archive.extract(name, lazy_dir)
+        lazy_size = tarball_size + disk_usage(lazy_dir) + \
+            os.lstat(index_path(tarball)).st_blocks * 512
+
+    print('defects:                       %d' % args.defects)
+    print('logs:                          %d MiB' % args.log_size)
+    print('full unpack footprint:         %.1f MiB' % (full_size / 2**20))
+    print('indexed footprint:             %.1f MiB' % (lazy_size / 2**20))
+    print('full unpack time-to-result:    %.2f s' % full_time)
+    print('indexed time-to-result:        %.2f s' % lazy_time)
+
+
+def bytes_read():
+    """ return number of bytes read by this process so far (Linux only) """
+    with open('/proc/self/io') as f:
+        for line in f:
+            if line.startswith('rchar:'):
+                return int(line.split()[1])
+
+
+def legacy_extract_tarball(path, output_dir, exclude_patterns):
+    """ extraction as done before, listing members with getmembers() first """
+    import fnmatch
+    import tarfile
+
+    with tarfile.open(path) as tf:
+        for member in tf.getmembers():
+            parts = member.name.rstrip('/').split('/')
+            if any(fnmatch.fnmatch(part, p) for part in parts for p in exclude_patterns):
+                continue
+            tf.extract(member, path=output_dir)
+
+
+def bench_extract(args):
+    from osh.hub.service.csmock_parser import ResultsExtractor
+
+    exclude = ['raw-results', '*.cov', '*debug']
+    print('logs (MiB)  size (MiB)  legacy (s)  passes  streaming (s)  passes')
+    for scale in (1, 2, 4):
+        with tempfile.TemporaryDirectory(prefix='osh-benchmark-') as tmpdir:
+            tarball = os.path.join(tmpdir, 'benchmark-1.0-1.tar.xz')
+            generate_results_tarball(tarball, args.defects, args.log_size * scale)
+            size = os.path.getsize(tarball)
+
+            results = []
+            for name, extract in (
+                ('legacy', lambda out: legacy_extract_tarball(tarball, out, exclude)),
+                ('streaming', lambda out: ResultsExtractor(tarball, output_dir=out,
+                                                           unpack_in_temp=False)
+                 .extract_tarball(exclude[:-1])),
+            ):
+                out = os.path.join(tmpdir, name)
+                os.mkdir(out)
+                read_before = bytes_read()
+                start = time.monotonic()
+                extract(out)
+                results.append((time.monotonic() - start, (bytes_read() - read_before) / size))
+
+            print('%10d  %10.1f  %10.2f  %6.1f  %13.2f  %6.1f' % (
+                args.log_size * scale, size / 2**20,
+                results[0][0], results[0][1], results[1][0], results[1][1]))
+
+
+def bench_decompress(args):
+    from osh.hub.service.archive import open_decompressed
+
+    def throughput(path, threads):
+        start = time.monotonic()
+        size = 0
+        with open(path, 'rb') as f, open_decompressed(f, threads) as stream:
+            while True:
+                data = stream.read(1024 ** 2)
+                if not data:
+                    break
+                size += len(data)
+        return size / 2**20 / (time.monotonic() - start)
+
+    with tempfile.TemporaryDirectory(prefix='osh-benchmark-') as tmpdir:
+        single = os.path.join(tmpdir, 'single.tar.xz')
+        multi = os.path.join(tmpdir, 'multi.tar.xz')
+        generate_results_tarball(single, args.defects, args.log_size)
+        generate_results_tarball(multi, args.defects, args.log_size, args.block_size)
+
+        print('single block, serial:   %7.1f MiB/s' % throughput(single, 1))
+        threads = 1
+        while threads <= args.max_threads:
+            print('%4s blocks, %2d threads: %7.1f MiB/s' % (
+                args.block_size, threads, throughput(multi, threads)))
+            threads *= 2
+
+
+def bench_zstd(args):
+    from osh.hub.service.archive import iter_members
+
+    def unpack_time(path):
+        start = time.monotonic()
+        for _ in iter_members(path):
+            pass
+        return time.monotonic() - start
+
+    with tempfile.TemporaryDirectory(prefix='osh-benchmark-') as tmpdir:
+        xz = args.tarball
+        if xz is None:
+            xz = os.path.join(tmpdir, 'results.tar.xz')
+            generate_results_tarball(xz, args.defects, args.log_size)
+
+        print('%-10s %10s %10s %10s' % ('format', 'size', 'compress', 'unpack'))
+        print('%-10s %8.1f M %10s %8.2f s' % (
+            'xz', os.path.getsize(xz) / 2**20, '-', unpack_time(xz)))
+        for level in args.levels:
+            zst = os.path.join(tmpdir, 'results-%d.tar.zst' % level)
+            start = time.monotonic()
+            subprocess.run('xz -dc %s | zstd -q -f -T0 -%d -o %s' % (
+                shlex.quote(xz), level, shlex.quote(zst)), shell=True, check=True)
+            elapsed = time.monotonic() - start
+            print('%-10s %8.1f M %8.2f s %8.2f s' % (
+                'zstd -%d' % level, os.path.getsize(zst) / 2**20, elapsed, unpack_time(zst)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    p = subparsers.add_parser('store-defects', help='ingestion of defects into the database')
+    p.add_argument('--defects', type=int, default=50000, help='number of defects')
+    p.add_argument('--checkers', type=int, default=100, help='number of distinct checkers')
+    p.set_defaults(func=bench_store_defects)
+
+    p = subparsers.add_parser('diff', help='diffing of results of two tasks')
+    p.add_argument('--defects', type=int, default=20000, help='number of defects per task')
+    p.set_defaults(func=bench_diff)
+
+    p = subparsers.add_parser('compare-groups', help='matching of result groups against past waivers')
+    p.add_argument('--groups', type=int, default=500, help='number of checker groups')
+    p.add_argument('--defects', type=int, default=20000, help='number of defects')
+    p.set_defaults(func=bench_compare_groups)
+
+    p = subparsers.add_parser('defect-counters', help='defect counts of the scan tree and stats pages')
+    p.add_argument('--results', type=int, default=50, help='number of results')
+    p.add_argument('--defects', type=int, default=5000, help='number of new defects per result')
+    p.add_argument('--checkers', type=int, default=100, help='number of distinct checkers')
+    p.set_defaults(func=bench_defect_counters)
+
+    p = subparsers.add_parser('lazy-unpack', help='indexed access to results tarball vs. full unpack')
+    p.add_argument('--defects', type=int, default=20000, help='number of defects')
+    p.add_argument('--log-size', type=int, default=200, help='size of logs in MiB')
+    p.set_defaults(func=bench_lazy_unpack, django=False)
+
+    p = subparsers.add_parser('extract', help='unpacking of results tarballs of growing size')
+    p.add_argument('--defects', type=int, default=20000, help='number of defects')
+    p.add_argument('--log-size', type=int, default=50, help='size of logs in MiB in the smallest tarball')
+    p.set_defaults(func=bench_extract, django=False)
+
+    p = subparsers.add_parser('decompress', help='decompression throughput by number of threads')
+    p.add_argument('--defects', type=int, default=20000, help='number of defects')
+    p.add_argument('--log-size', type=int, default=200, help='size of logs in MiB')
+    p.add_argument('--block-size', default='8MiB', help='size of xz blocks')
+    p.add_argument('--max-threads', type=int, default=os.cpu_count(),
+                   help='maximal number of threads')
+    p.set_defaults(func=bench_decompress, django=False)
+
+    p = subparsers.add_parser('zstd', help='size and unpack time of zstd vs. xz results tarballs')
+    p.add_argument('--tarball', help='.tar.xz results of a real scan (generated if not given)')
+    p.add_argument('--defects', type=int, default=20000, help='number of defects')
+    p.add_argument('--log-size', type=int, default=200, help='size of logs in MiB')
+    p.add_argument('--levels', type=int, nargs='+', default=[3, 19], help='zstd compression levels')
+    p.set_defaults(func=bench_zstd, django=False)
+
+    args = parser.parse_args()
+    if getattr(args, 'django', True):
+        import django
+        django.setup()
+
+    args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,6 +19,7 @@ data_files = {
         "osh/worker/worker.conf",
     ],
     "lib/systemd/system": [
+        "osh/hub/osh-results-processor.service",
         "osh/hub/osh-retention.service",
         "osh/hub/osh-retention.timer",
         "osh/hub/osh-stats.service",
@@ -33,6 +34,7 @@ data_files = {
     ],
     "bin": [
         "osh/client/osh-cli",
+        "osh/hub/scripts/osh-results-processor",
         "osh/hub/scripts/osh-retention",
         "osh/hub/scripts/osh-stats",
         "osh/hub/scripts/osh-worker-manager",